@@ -13,6 +13,8 @@ from pyrtools.pyramids.pyramid import Pyramid
 import scipy.io
 import os
 import os.path as op
+import tempfile
+import sys
 matfiles_path = op.join(op.dirname(op.realpath(__file__)), 'matFiles')
 test_data_path = op.join(op.dirname(op.realpath(__file__)), '..', 'DATA')
 
@@ -42,6 +44,929 @@ class corrDnTests(unittest.TestCase):
         res = pt.corrDn(ramp, pt.named_filter('qmf16'))
         self.assertTrue(pt.compareRecon(mres, res))
 
+class batchConvTests(unittest.TestCase):
+    def test_corrDn(self):
+        ims = np.random.rand(5, 20, 24)
+        filt = pt.named_filter('binom5')
+        for edge_type in ['circular', 'reflect1', 'zero', 'dont-compute']:
+            res = pt.corrDn(ims, filt, edge_type, step=(2, 1))
+            self.assertTrue(res.shape == (5, 10, 24))
+            for im, r in zip(ims, res):
+                self.assertTrue(np.allclose(pt.corrDn(im, filt, edge_type, step=(2, 1)), r))
+    def test_upConv(self):
+        ims = np.random.rand(5, 10, 12)
+        filt = pt.named_filter('binom5')
+        filt = filt * filt.T
+        for edge_type in ['circular', 'reflect1', 'zero', 'dont-compute']:
+            res = pt.upConv(ims, filt, edge_type, step=(2, 2), stop=(20, 23))
+            self.assertTrue(res.shape == (5, 20, 23))
+            for im, r in zip(ims, res):
+                self.assertTrue(np.allclose(pt.upConv(im, filt, edge_type, step=(2, 2),
+                                                      stop=(20, 23)), r))
+
+class threadedConvTests(unittest.TestCase):
+    def test_bad_env(self):
+        # a non-integer PYRTOOLS_NUM_THREADS warns and uses the default, rather than failing import
+        from pyrtools.pyramids.c import wrapper
+        env = os.environ.get('PYRTOOLS_NUM_THREADS')
+        try:
+            os.environ['PYRTOOLS_NUM_THREADS'] = 'auto'
+            with self.assertWarns(UserWarning):
+                self.assertEqual(wrapper._env_int('PYRTOOLS_NUM_THREADS', 1), 1)
+            os.environ['PYRTOOLS_NUM_THREADS'] = '3'
+            self.assertEqual(wrapper._env_int('PYRTOOLS_NUM_THREADS', 1), 3)
+        finally:
+            if env is None:
+                del os.environ['PYRTOOLS_NUM_THREADS']
+            else:
+                os.environ['PYRTOOLS_NUM_THREADS'] = env
+    def test_corrDn(self):
+        filt = pt.named_filter('binom5')
+        filt = filt * filt.T
+        for ims in [np.random.rand(300, 257), np.random.rand(3, 130, 97)]:
+            for edge_type in ['circular', 'reflect1', 'extend']:
+                res = pt.corrDn(ims, filt, edge_type, step=(2, 2), num_threads=1)
+                for num_threads in [2, 3, 8]:
+                    self.assertTrue(np.allclose(pt.corrDn(ims, filt, edge_type, step=(2, 2),
+                                                          num_threads=num_threads), res))
+    def test_upConv(self):
+        filt = pt.named_filter('binom5')
+        filt = filt * filt.T
+        for ims in [np.random.rand(150, 129), np.random.rand(3, 65, 49)]:
+            for edge_type in ['circular', 'reflect1', 'extend']:
+                res = pt.upConv(ims, filt, edge_type, step=(2, 2), num_threads=1)
+                for num_threads in [2, 3, 8]:
+                    self.assertTrue(np.allclose(pt.upConv(ims, filt, edge_type, step=(2, 2),
+                                                          num_threads=num_threads), res))
+    def test_set_num_threads(self):
+        n = pt.get_num_threads()
+        pt.set_num_threads(3)
+        self.assertEqual(pt.get_num_threads(), 3)
+        pt.set_num_threads(n)
+
+class sepConvTests(unittest.TestCase):
+    def test_sepCorrDn(self):
+        im = np.random.rand(37, 41)
+        filt_y = pt.named_filter('binom5')
+        filt_x = pt.named_filter('qmf8')
+        for edge_type in ['circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend',
+                          'dont-compute']:
+            for step, start in [((2, 2), (0, 0)), ((2, 3), (1, 0))]:
+                tmp = pt.corrDn(im, filt_y, edge_type, (step[0], 1), (start[0], 0))
+                res = pt.corrDn(tmp, filt_x.T, edge_type, (1, step[1]), (0, start[1]))
+                self.assertTrue(np.allclose(pt.sepCorrDn(im, filt_y, filt_x, edge_type, step,
+                                                         start), res))
+    def test_sepUpConv(self):
+        im = np.random.rand(19, 14)
+        filt_y = pt.named_filter('qmf9')
+        filt_x = pt.named_filter('binom5')
+        for edge_type in ['circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend',
+                          'dont-compute']:
+            for step, start, stop in [((2, 2), (0, 0), (38, 28)), ((2, 3), (1, 0), (38, 41))]:
+                tmp = pt.upConv(im, filt_y, edge_type, (step[0], 1), (start[0], 0),
+                                (stop[0], im.shape[1]))
+                res = pt.upConv(tmp, filt_x.T, edge_type, (1, step[1]), (0, start[1]), stop)
+                self.assertTrue(np.allclose(pt.sepUpConv(im, filt_y, filt_x, edge_type, step,
+                                                         start, stop), res))
+    def test_batch(self):
+        ims = np.random.rand(3, 64, 48)
+        filt = pt.named_filter('binom5')
+        res = pt.sepCorrDn(ims, filt, filt, step=(2, 2), num_threads=2)
+        for im, r in zip(ims, res):
+            self.assertTrue(np.allclose(pt.sepCorrDn(im, filt, filt, step=(2, 2)), r))
+        up = pt.sepUpConv(res, filt, filt, step=(2, 2), num_threads=2)
+        for r, u in zip(res, up):
+            self.assertTrue(np.allclose(pt.sepUpConv(r, filt, filt, step=(2, 2)), u))
+
+class convBufferTests(unittest.TestCase):
+    def test_corrDn_out(self):
+        im = np.random.rand(2, 37, 41)
+        filt = pt.named_filter('qmf9')
+        for edge_type in ['circular', 'reflect1', 'zero', 'dont-compute']:
+            res = pt.corrDn(im, filt, edge_type, (2, 1))
+            out = np.full(res.shape, np.nan)
+            workspace = np.full(100, np.nan)
+            res2 = pt.corrDn(im, filt, edge_type, (2, 1), out=out, workspace=workspace)
+            self.assertTrue(res2 is out)
+            self.assertTrue(np.array_equal(res, out))
+    def test_upConv_out(self):
+        im = np.random.rand(19, 14)
+        filt = pt.named_filter('binom5')
+        for edge_type in ['circular', 'reflect1', 'zero', 'dont-compute']:
+            res = pt.upConv(im, filt, edge_type, (2, 1))
+            out = np.full(res.shape, np.nan)
+            res2 = pt.upConv(im, filt, edge_type, (2, 1), out=out, workspace=np.full(6, np.nan))
+            self.assertTrue(res2 is out)
+            self.assertTrue(np.array_equal(res, out))
+    def test_sep_out(self):
+        im = np.random.rand(37, 41)
+        filt = pt.named_filter('binom5')
+        res = pt.sepCorrDn(im, filt, filt, step=(2, 2))
+        out = np.full(res.shape, np.nan)
+        pt.sepCorrDn(im, filt, filt, step=(2, 2), out=out, workspace=np.full(41, np.nan))
+        self.assertTrue(np.array_equal(res, out))
+        up = pt.sepUpConv(res, filt, filt, step=(2, 2))
+        out = np.full(up.shape, np.nan)
+        pt.sepUpConv(res, filt, filt, step=(2, 2), out=out, workspace=np.full(up.shape[1], np.nan))
+        self.assertTrue(np.array_equal(up, out))
+    def test_inputs_unchanged(self):
+        im = np.random.rand(37, 41)
+        filt = pt.named_filter('qmf9')
+        im_copy, filt_copy = im.copy(), filt.copy()
+        pt.corrDn(im, filt, step=(2, 2))
+        pt.upConv(im, filt, step=(2, 2))
+        self.assertTrue(np.array_equal(im, im_copy))
+        self.assertTrue(np.array_equal(filt, filt_copy))
+    def test_bad_buffers(self):
+        im = np.random.rand(37, 41)
+        filt = pt.named_filter('binom5')
+        with self.assertRaises(Exception):
+            pt.corrDn(im, filt, out=np.zeros((36, 41)))
+        with self.assertRaises(Exception):
+            pt.corrDn(im, filt, out=np.zeros((37, 41), dtype=np.float32))
+        with self.assertRaises(Exception):
+            pt.corrDn(im, filt, out=np.zeros((41, 37)).T)
+        with self.assertRaises(Exception):
+            pt.upConv(im, filt, workspace=np.zeros(2))
+
+class fftConvTests(unittest.TestCase):
+    def test_corrDn(self):
+        im = np.random.rand(2, 37, 41)
+        for filt in [np.random.rand(17, 17), np.random.rand(4, 9), pt.named_filter('qmf8')]:
+            for edge_type in ['circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend',
+                              'dont-compute']:
+                for step, start, stop in [((1, 1), (0, 0), None), ((2, 3), (1, 2), (35, 41))]:
+                    res = pt.corrDn(im, filt, edge_type, step, start, stop, method='direct')
+                    res_fft = pt.corrDn(im, filt, edge_type, step, start, stop, method='fft')
+                    self.assertTrue(np.allclose(res, res_fft))
+    def test_upConv(self):
+        im = np.random.rand(2, 19, 14)
+        for filt in [np.random.rand(17, 17), pt.named_filter('qmf9')]:
+            for edge_type in ['circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend',
+                              'dont-compute']:
+                for step, start, stop in [((2, 2), (0, 0), (38, 28)), ((2, 3), (1, 2), (38, 42))]:
+                    res = pt.upConv(im, filt, edge_type, step, start, stop, method='direct')
+                    res_fft = pt.upConv(im, filt, edge_type, step, start, stop, method='fft')
+                    self.assertTrue(np.allclose(res, res_fft))
+    def test_upConv_lattice(self):
+        # with start (or stop) set, the upsampling lattice has fewer points than the image has
+        # samples: all methods read them the same way
+        for shape in [(20, 21), (33, 17), (200, 200)]:
+            im = np.random.rand(*shape)
+            for filt in [np.random.rand(5, 5), np.random.rand(9, 3), np.random.rand(25, 25)]:
+                if filt.shape[0] > shape[1]:
+                    continue
+                for start, stop in [((1, 2), None), ((2, 2), None), ((1, 1), (37, 31)),
+                                    ((0, 1), (2*shape[0] - 3, 2*shape[1] - 1))]:
+                    if stop is not None and (stop[0] > 2*shape[0] or stop[1] > 2*shape[1]):
+                        continue
+                    for edge_type in ['reflect1', 'reflect2', 'zero', 'circular']:
+                        res = pt.upConv(im, filt, edge_type, (2, 2), start, stop, method='direct')
+                        for method in ['fft', 'auto']:
+                            res_method = pt.upConv(im, filt, edge_type, (2, 2), start, stop,
+                                                   method=method)
+                            self.assertTrue(np.allclose(res, res_method))
+        # each image of a stack is read the same way as on its own
+        im = np.random.rand(3, 20, 21)
+        filt = np.random.rand(5, 5)
+        res = pt.upConv(im, filt, 'reflect2', (2, 2), (1, 2))
+        for i in range(len(im)):
+            self.assertTrue(np.allclose(res[i], pt.upConv(im[i], filt, 'reflect2', (2, 2),
+                                                          (1, 2))))
+    def test_float32(self):
+        im = np.random.rand(64, 64).astype(np.float32)
+        filt = np.random.rand(17, 17)
+        res = pt.corrDn(im, filt, method='fft')
+        self.assertEqual(res.dtype, np.float32)
+        self.assertTrue(np.allclose(res, pt.corrDn(im, filt, method='direct'), rtol=1e-4))
+    def test_bad_method(self):
+        with self.assertRaises(Exception):
+            pt.corrDn(np.random.rand(16, 16), pt.named_filter('binom5'), method='fast')
+
+class convArgsTests(unittest.TestCase):
+    def test_numpy_ints(self):
+        im = np.random.rand(20, 20)
+        filt = pt.named_filter('binom5')
+        step, start = np.array([2, 2]), np.array([1, 0])
+        self.assertTrue(np.allclose(pt.corrDn(im, filt, 'reflect1', step, start),
+                                    pt.corrDn(im, filt, 'reflect1', (2, 2), (1, 0))))
+        self.assertTrue(np.allclose(pt.sepUpConv(im, filt, filt, 'zero', step),
+                                    pt.sepUpConv(im, filt, filt, 'zero', (2, 2))))
+    def test_bad_edge_type(self):
+        im = np.random.rand(20, 20)
+        filt = pt.named_filter('binom5')
+        for func in [pt.corrDn, pt.upConv]:
+            with self.assertRaises(Exception):
+                func(im, filt, 'qreflect2')
+
+class edgeBankTests(unittest.TestCase):
+    def test_cached_vs_computed(self):
+        from pyrtools.pyramids.c import wrapper
+        im = np.random.rand(2, 23, 30)
+        filt = np.random.rand(7, 5)
+        size = wrapper._EDGE_BANK_SIZE
+        for edge_type in ['reflect1', 'reflect2', 'repeat', 'zero', 'extend']:
+            for dtype in [np.float64, np.float32]:
+                x = im.astype(dtype)
+                cached = [pt.corrDn(x, filt, edge_type, (2, 3), (1, 0), method='direct'),
+                          pt.upConv(x, filt, edge_type, (2, 1), method='direct')]
+                try:
+                    wrapper._EDGE_BANK_SIZE = 0
+                    computed = [pt.corrDn(x, filt, edge_type, (2, 3), (1, 0), method='direct'),
+                                pt.upConv(x, filt, edge_type, (2, 1), method='direct')]
+                finally:
+                    wrapper._EDGE_BANK_SIZE = size
+                for c, d in zip(cached, computed):
+                    self.assertTrue(np.array_equal(c, d))
+    def test_filter_changes(self):
+        # the cache is keyed on the filter's values, not the array
+        im = np.random.rand(20, 20)
+        filt = np.random.rand(5, 5)
+        res = pt.corrDn(im, filt, 'reflect1', (2, 2))
+        filt[0, 0] += 1
+        self.assertFalse(np.allclose(res, pt.corrDn(im, filt, 'reflect1', (2, 2))))
+        filt[0, 0] -= 1
+        self.assertTrue(np.allclose(res, pt.corrDn(im, filt, 'reflect1', (2, 2))))
+    def test_cache_bounded(self):
+        from pyrtools.pyramids.c import wrapper
+        im = np.random.rand(40, 40)
+        nbytes = wrapper._EDGE_BANK_CACHE_BYTES
+        try:
+            # room for about 3 banks of 9x9 filters
+            wrapper._EDGE_BANK_CACHE_BYTES = 3 * 11 * 11 * 81 * 8 + 1
+            for i in range(10):
+                pt.corrDn(im, np.random.rand(9, 9), 'reflect1', (2, 2), method='direct')
+            self.assertEqual(len(wrapper._edge_banks), 3)
+            self.assertLessEqual(sum(b.nbytes for b in wrapper._edge_banks.values()),
+                                 wrapper._EDGE_BANK_CACHE_BYTES)
+        finally:
+            wrapper._EDGE_BANK_CACHE_BYTES = nbytes
+        pt.clear_edge_bank_cache()
+        self.assertEqual(len(wrapper._edge_banks), 0)
+        self.assertEqual(wrapper._edge_banks_nbytes, 0)
+    def test_c_errors(self):
+        # failures of the C code (here, an invalid edge-handler id) raise instead of returning
+        # uninitialized results
+        from pyrtools.pyramids.c import wrapper
+        im = np.random.rand(20, 20)
+        filt = np.random.rand(5, 5)
+        edge_id = wrapper._EDGE_TYPES['reflect1']
+        try:
+            wrapper._EDGE_TYPES['reflect1'] = 99
+            for method in ['direct', 'fft']:
+                with self.assertRaises(Exception):
+                    pt.corrDn(im, filt, 'reflect1', (2, 2), method=method)
+                with self.assertRaises(Exception):
+                    pt.upConv(im, filt, 'reflect1', (2, 2), method=method)
+            with self.assertRaises(Exception):
+                pt.sepCorrDn(im, filt[0], filt[:, 0], 'reflect1', (2, 2))
+            with self.assertRaises(Exception):
+                pt.sepUpConv(im, filt[0], filt[:, 0], 'reflect1', (2, 2))
+        finally:
+            wrapper._EDGE_TYPES['reflect1'] = edge_id
+
+class simdTests(unittest.TestCase):
+    def test_bad_env(self):
+        # importing with a non-integer PYRTOOLS_SIMD warns and uses the default
+        import subprocess
+        env = dict(os.environ, PYRTOOLS_SIMD='none')
+        proc = subprocess.run([sys.executable, '-c', 'import pyrtools'], env=env,
+                              capture_output=True, text=True,
+                              cwd=op.dirname(op.dirname(op.abspath(pt.__file__))))
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        self.assertIn('PYRTOOLS_SIMD must be an integer', proc.stderr)
+    def test_same_as_scalar(self):
+        # the vectorized inner loops (if the cpu has them) must match the scalar ones exactly
+        from pyrtools.pyramids.c import wrapper
+        im = np.random.rand(2, 45, 38)
+        filt = np.random.randn(5, 7)
+        results = []
+        try:
+            for level in [-1, 0]:
+                wrapper.lib.internal_simd_level(level)
+                res = []
+                for dtype in [np.float64, np.float32]:
+                    for edge_type in ['reflect1', 'circular', 'zero']:
+                        for step in [(1, 1), (2, 2), (3, 2)]:
+                            x = im.astype(dtype)
+                            res.append(pt.corrDn(x, filt, edge_type, step, method='direct'))
+                            res.append(pt.upConv(x[..., :21, :17], filt, edge_type, step,
+                                                 method='direct'))
+                results.append(res)
+        finally:
+            wrapper.lib.internal_simd_level(-1)
+        for a, b in zip(*results):
+            self.assertTrue(np.array_equal(a, b))
+
+class SteerablePyramidFreqMaskCacheTests(unittest.TestCase):
+    def test_masks_shared(self):
+        import sys
+        spf = sys.modules['pyrtools.pyramids.SteerablePyramidFreq']
+        im = np.random.rand(64, 48)
+        args = (im.shape, 3, 2, 1, np.dtype(np.float64), False)
+        pt.pyramids.SteerablePyramidFreq(im, order=2, is_complex=True)
+        masks = spf._build_complex_masks(*args)
+        pt.pyramids.SteerablePyramidFreq(np.random.rand(64, 48), order=2, is_complex=True)
+        self.assertIs(masks, spf._build_complex_masks(*args))
+        with self.assertRaises(ValueError):
+            masks['bands'][1][2][0, 0] = 1
+        hits = spf._build_complex_masks.cache_info().hits
+        pt.pyramids.SteerablePyramidFreq(im, order=3, is_complex=True)
+        self.assertEqual(spf._build_complex_masks.cache_info().hits, hits)
+        # real pyramids have their own masks
+        pt.pyramids.SteerablePyramidFreq(im, order=2)
+        hits = spf._build_real_masks.cache_info().hits
+        pt.pyramids.SteerablePyramidFreq(np.random.rand(64, 48), order=2).recon_pyr()
+        self.assertEqual(spf._build_real_masks.cache_info().hits, hits + 1)
+    def test_same_as_uncached(self):
+        import sys
+        spf = sys.modules['pyrtools.pyramids.SteerablePyramidFreq']
+        for is_complex in [False, True]:
+            im = np.random.rand(36, 50)
+            pyr = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex)
+            recon = pyr.recon_pyr()
+            for cached in [spf._build_real_masks, spf._build_complex_masks,
+                           spf._recon_real_masks]:
+                cached.cache_clear()
+            pyr2 = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex)
+            for k, v in pyr.pyr_coeffs.items():
+                self.assertTrue(np.array_equal(v, pyr2.pyr_coeffs[k]))
+            self.assertTrue(np.array_equal(recon, pyr2.recon_pyr()))
+            self.assertTrue(np.allclose(recon, im, atol=1e-4))
+
+class SteerablePyramidFreqRealTests(unittest.TestCase):
+    def _full_fft_pyr(self, im, order, twidth):
+        # the real pyramid, the way it's computed for complex ones: with the complex fft of the
+        # image, taking the real part of the bands
+        import sys
+        import scipy.fft
+        spf = sys.modules['pyrtools.pyramids.SteerablePyramidFreq']
+        num_scales = int(np.floor(np.log2(min(im.shape))) - 2)
+        masks = spf._build_masks(im.shape, num_scales, order, twidth, False, np.dtype(np.float64))
+        def band(dft):
+            return np.real(scipy.fft.ifft2(scipy.fft.ifftshift(dft)))
+        imdft = scipy.fft.fftshift(scipy.fft.fft2(im))
+        coeffs = {'residual_highpass': band(imdft * masks['hi0mask'])}
+        lodft = imdft * masks['lo0mask']
+        for i in range(num_scales):
+            for b in range(order + 1):
+                coeffs[(i, b)] = band((-1j) ** order * lodft * masks['anglemasks'][i][b] *
+                                      masks['himasks'][i])
+            lostart, loend = masks['lo_bounds'][i]
+            lodft = lodft[lostart[0]:loend[0], lostart[1]:loend[1]] * masks['lomasks'][i]
+        coeffs['residual_lowpass'] = band(lodft)
+        return coeffs
+    def test_same_as_full_fft(self):
+        # the odd sizes and uneven crops need the Nyquist corrections
+        for shape in [(64, 48), (37, 50), (35, 35), (33, 64)]:
+            im = np.random.rand(*shape)
+            for order in [0, 1, 2, 3]:
+                for twidth in [1, 2]:
+                    pyr = pt.pyramids.SteerablePyramidFreq(im, order=order, twidth=twidth)
+                    coeffs = self._full_fft_pyr(im, order, twidth)
+                    self.assertEqual(set(pyr.pyr_coeffs.keys()), set(coeffs.keys()))
+                    for k, v in coeffs.items():
+                        self.assertEqual(pyr.pyr_coeffs[k].dtype, np.float64)
+                        self.assertEqual(pyr.pyr_size[k], v.shape)
+                        self.assertTrue(np.allclose(pyr.pyr_coeffs[k], v, atol=1e-12))
+    def test_recon_subsets(self):
+        # reconstructing from a subset of the coefficients is the same as zeroing the others
+        for shape in [(64, 48), (37, 50)]:
+            for is_complex in [False, True]:
+                pyr = pt.pyramids.SteerablePyramidFreq(np.random.rand(*shape), order=2,
+                                                       is_complex=is_complex)
+                recon = pyr.recon_pyr(levels=[0, 2, 'residual_lowpass'], bands=[1])
+                for k in pyr.pyr_coeffs:
+                    if k not in [(0, 1), (2, 1), 'residual_lowpass']:
+                        pyr.pyr_coeffs[k] = np.zeros_like(pyr.pyr_coeffs[k])
+                self.assertTrue(np.allclose(recon, pyr.recon_pyr(), atol=1e-12))
+    def test_float32(self):
+        im = np.random.rand(37, 50)
+        pyr = pt.pyramids.SteerablePyramidFreq(im, dtype=np.float32)
+        pyr64 = pt.pyramids.SteerablePyramidFreq(im)
+        for k, v in pyr.pyr_coeffs.items():
+            self.assertEqual(v.dtype, np.float32)
+            self.assertTrue(np.allclose(v, pyr64.pyr_coeffs[k], atol=1e-4))
+        self.assertEqual(pyr.recon_pyr().dtype, np.float32)
+
+class fftBackendTests(unittest.TestCase):
+    def test_threads(self):
+        im = np.random.rand(64, 48)
+        for is_complex in [False, True]:
+            pyr = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex)
+            pyr2 = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex,
+                                                    fft_backend='scipy', num_threads=2)
+            for k, v in pyr.pyr_coeffs.items():
+                self.assertTrue(np.allclose(v, pyr2.pyr_coeffs[k]))
+            self.assertTrue(np.allclose(pyr.recon_pyr(), pyr2.recon_pyr()))
+    def test_bad_backend(self):
+        with self.assertRaises(Exception):
+            pt.pyramids.SteerablePyramidFreq(np.random.rand(32, 32), fft_backend='fftpack')
+        with self.assertRaises(Exception):
+            pt.set_fft_backend('fftpack')
+        self.assertEqual(pt.get_fft_backend(), 'scipy')
+    def test_pyfftw(self):
+        try:
+            import pyfftw  # noqa: F401
+        except ImportError:
+            self.skipTest("pyfftw isn't installed")
+        im = np.random.rand(64, 48)
+        pyr = pt.pyramids.SteerablePyramidFreq(im)
+        pyr2 = pt.pyramids.SteerablePyramidFreq(im, fft_backend='pyfftw')
+        for k, v in pyr.pyr_coeffs.items():
+            self.assertTrue(np.allclose(v, pyr2.pyr_coeffs[k]))
+        self.assertTrue(np.allclose(pyr.recon_pyr(), pyr2.recon_pyr()))
+    def test_wisdom_file(self):
+        from pyrtools.tools import fft
+        wisdom = (b'(fftw-3.3.10 fftw_wisdom)\n', b'', b'\x00\xff')
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'wisdom')
+            fft._write_wisdom(path, wisdom)
+            self.assertEqual(fft._read_wisdom(path), wisdom)
+            with open(path, 'rb') as f:
+                data = f.read()
+            for bad in [data[:-1], data + b'\x00', b'\x80' + data[1:]]:
+                with open(path, 'wb') as f:
+                    f.write(bad)
+                with self.assertRaises(Exception):
+                    fft._read_wisdom(path)
+
+class SteerablePyramidFreqBatchTests(unittest.TestCase):
+    def test_same_as_single(self):
+        ims = np.random.rand(3, 2, 37, 50)
+        for is_complex in [False, True]:
+            pyr = pt.pyramids.SteerablePyramidFreq(ims, order=2, is_complex=is_complex)
+            self.assertEqual(pyr.batch_shape, (3, 2))
+            self.assertEqual(pyr.image_size, (37, 50))
+            recon = pyr.recon_pyr()
+            recon_sub = pyr.recon_pyr(levels=[1, 'residual_lowpass'], bands=[0, 2])
+            self.assertEqual(recon.shape, ims.shape)
+            for n in range(3):
+                for c in range(2):
+                    single = pt.pyramids.SteerablePyramidFreq(ims[n, c], order=2,
+                                                              is_complex=is_complex)
+                    self.assertEqual(pyr.pyr_size, single.pyr_size)
+                    for k, v in single.pyr_coeffs.items():
+                        self.assertTrue(np.allclose(pyr.pyr_coeffs[k][n, c], v))
+                    self.assertTrue(np.allclose(recon[n, c], single.recon_pyr()))
+                    self.assertTrue(np.allclose(recon_sub[n, c],
+                                                single.recon_pyr(levels=[1, 'residual_lowpass'],
+                                                                 bands=[0, 2])))
+    def test_steer(self):
+        ims = np.random.rand(4, 32, 32)
+        pyr = pt.pyramids.SteerablePyramidFreq(ims)
+        single = pt.pyramids.SteerablePyramidFreq(ims[1])
+        steered = pyr.steer_coeffs([.3, 1.2])[0]
+        for k, v in single.steer_coeffs([.3, 1.2])[0].items():
+            self.assertTrue(np.allclose(steered[k][1], v))
+    def test_other_pyramids_unbatched(self):
+        with self.assertRaises(Exception):
+            pt.pyramids.LaplacianPyramid(np.random.rand(2, 32, 32))
+
+class SteerablePyramidFreqDftTests(unittest.TestCase):
+    def test_same_as_spatial(self):
+        ims = np.random.rand(2, 37, 50)
+        for is_complex in [False, True]:
+            pyr = pt.pyramids.SteerablePyramidFreq(ims, order=1, is_complex=is_complex)
+            pyr_dft = pt.pyramids.SteerablePyramidFreq(ims, order=1, is_complex=is_complex,
+                                                       store_dft=True)
+            self.assertEqual(list(pyr.pyr_coeffs.keys()), list(pyr_dft.pyr_coeffs.keys()))
+            self.assertEqual(pyr.pyr_size, pyr_dft.pyr_size)
+            self.assertEqual(pyr.pyr_coeffs_dft, {})
+            for k, v in pyr.pyr_coeffs.items():
+                self.assertEqual(v.dtype, pyr_dft.pyr_coeffs[k].dtype)
+                self.assertTrue(np.allclose(v, pyr_dft.pyr_coeffs[k]))
+                fft = np.fft.rfft2 if np.isrealobj(v) else np.fft.fft2
+                self.assertTrue(np.allclose(fft(v), pyr_dft.pyr_coeffs_dft[k]))
+            self.assertTrue(np.allclose(pyr.recon_pyr(), pyr_dft.recon_pyr()))
+            self.assertTrue(np.allclose(pyr.recon_pyr(levels=[0, 'residual_lowpass'], bands=[1]),
+                                        pyr_dft.recon_pyr(levels=[0, 'residual_lowpass'],
+                                                          bands=[1])))
+    def test_modify(self):
+        im = np.random.rand(64, 48)
+        for is_complex in [False, True]:
+            pyr = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex)
+            pyr_dft = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex, store_dft=True)
+            with self.assertRaises(ValueError):
+                pyr_dft.pyr_coeffs[(1, 2)][0, 0] = 1
+            # in the spatial domain
+            pyr.pyr_coeffs[(1, 2)] = pyr.pyr_coeffs[(1, 2)] * 2
+            pyr_dft.pyr_coeffs[(1, 2)] = pyr_dft.pyr_coeffs[(1, 2)] * 2
+            self.assertTrue(np.allclose(pyr.recon_pyr(), pyr_dft.recon_pyr()))
+            # and in the Fourier domain
+            pyr.pyr_coeffs['residual_lowpass'] = np.zeros_like(pyr.pyr_coeffs['residual_lowpass'])
+            pyr_dft.pyr_coeffs_dft['residual_lowpass'] *= 0
+            self.assertTrue(np.allclose(pyr.recon_pyr(), pyr_dft.recon_pyr()))
+            self.assertTrue(np.all(pyr_dft.pyr_coeffs['residual_lowpass'] == 0))
+
+class SteerablePyramidFreqReconTests(unittest.TestCase):
+    def test_sum_of_bands(self):
+        # the reconstruction is the sum of those from each band and residual
+        im = np.random.rand(64, 48)
+        for is_complex in [False, True]:
+            for store_dft in [False, True]:
+                pyr = pt.pyramids.SteerablePyramidFreq(im, order=2, is_complex=is_complex,
+                                                       store_dft=store_dft)
+                dfts = {k: v.copy() for k, v in pyr.pyr_coeffs_dft.items()}
+                recon = sum(pyr.recon_pyr(levels=[i], bands=[b]) for i in range(pyr.num_scales)
+                            for b in range(pyr.num_orientations))
+                recon += pyr.recon_pyr(levels=['residual_lowpass', 'residual_highpass'])
+                self.assertTrue(np.allclose(recon, pyr.recon_pyr()))
+                self.assertTrue(np.allclose(im, pyr.recon_pyr(), atol=1e-4))
+                # reconstructing doesn't change the coefficients
+                for k, v in dfts.items():
+                    self.assertTrue(np.all(v == pyr.pyr_coeffs_dft[k]))
+
+class SteerablePyramidFreqExactMasksTests(unittest.TestCase):
+    def test_close_to_lut(self):
+        im = np.random.rand(37, 50)
+        for order in [0, 1, 3]:
+            for is_complex in [False, True]:
+                pyr = pt.pyramids.SteerablePyramidFreq(im, order=order, is_complex=is_complex)
+                pyr_exact = pt.pyramids.SteerablePyramidFreq(im, order=order, is_complex=is_complex,
+                                                             exact_masks=True)
+                for k, v in pyr.pyr_coeffs.items():
+                    self.assertTrue(np.allclose(v, pyr_exact.pyr_coeffs[k], atol=1e-4))
+                self.assertTrue(np.allclose(pyr.recon_pyr(), pyr_exact.recon_pyr(), atol=1e-4))
+    def test_perfect_recon(self):
+        im = np.random.rand(64, 48)
+        for order in [1, 3, 5]:
+            for is_complex in [False, True]:
+                pyr = pt.pyramids.SteerablePyramidFreq(im, order=order, is_complex=is_complex,
+                                                       exact_masks=True)
+                self.assertTrue(np.allclose(im, pyr.recon_pyr(), rtol=0, atol=1e-12))
+
+class SteerablePyramidFreqScaleFactorTests(unittest.TestCase):
+    def test_perfect_recon(self):
+        im = np.random.rand(64, 48)
+        for scale_factor in [2**.5, 2**(1/3), 1.5, 3]:
+            for is_complex in [False, True]:
+                pyr = pt.pyramids.SteerablePyramidFreq(im, scale_factor=scale_factor,
+                                                       is_complex=is_complex, exact_masks=True)
+                self.assertTrue(np.allclose(im, pyr.recon_pyr(), rtol=0, atol=1e-12))
+                pyr = pt.pyramids.SteerablePyramidFreq(im, scale_factor=scale_factor,
+                                                       is_complex=is_complex)
+                self.assertTrue(np.allclose(im, pyr.recon_pyr(), atol=1e-4))
+    def test_sizes(self):
+        im = np.random.rand(128, 96)
+        pyr = pt.pyramids.SteerablePyramidFreq(im, scale_factor=2**.5)
+        self.assertEqual(pyr.num_scales, 9)
+        sizes = [pyr.pyr_size[(i, 0)] for i in range(pyr.num_scales)]
+        sizes.append(pyr.pyr_size['residual_lowpass'])
+        for i in range(len(sizes)):
+            self.assertEqual(sizes[i], tuple(np.ceil(np.array([128, 96]) / 2**(i/2) - 1e-10)))
+        # every other scale is that of the octave pyramid
+        octave = pt.pyramids.SteerablePyramidFreq(im)
+        for i in range(octave.num_scales):
+            self.assertEqual(pyr.pyr_size[(2*i, 0)], octave.pyr_size[(i, 0)])
+        with self.assertRaises(Exception):
+            pt.pyramids.SteerablePyramidFreq(im, scale_factor=1)
+    def test_subsets(self):
+        im = np.random.rand(64, 64)
+        pyr = pt.pyramids.SteerablePyramidFreq(im, scale_factor=1.5, order=1)
+        recon = sum(pyr.recon_pyr(levels=[i]) for i in range(pyr.num_scales))
+        recon += pyr.recon_pyr(levels=['residual_lowpass', 'residual_highpass'])
+        self.assertTrue(np.allclose(recon, pyr.recon_pyr()))
+        stream = pt.pyramids.SteerablePyramidFreqStream((64, 64), scale_factor=1.5, order=1)
+        pyr_coeffs = stream.process(im)
+        for k, v in pyr.pyr_coeffs.items():
+            self.assertTrue(np.array_equal(v, pyr_coeffs[k]))
+
+class SteerablePyramidFreqStreamTests(unittest.TestCase):
+    def test_same_as_pyramid(self):
+        frames = np.random.rand(5, 37, 50)
+        for is_complex in [False, True]:
+            stream = pt.pyramids.SteerablePyramidFreqStream((37, 50), order=2,
+                                                            is_complex=is_complex, history=3)
+            for frame, pyr_coeffs in zip(frames, stream.stream(iter(frames))):
+                pyr = pt.pyramids.SteerablePyramidFreq(frame, order=2, is_complex=is_complex)
+                self.assertEqual(stream.pyr_size, pyr.pyr_size)
+                self.assertEqual(list(pyr_coeffs.keys()), list(pyr.pyr_coeffs.keys()))
+                for k, v in pyr.pyr_coeffs.items():
+                    self.assertTrue(np.array_equal(pyr_coeffs[k], v))
+                self.assertTrue(np.allclose(stream.recon_pyr(), pyr.recon_pyr()))
+                self.assertTrue(np.allclose(stream.recon_pyr(pyr_coeffs, levels=[1], bands=[0]),
+                                            pyr.recon_pyr(levels=[1], bands=[0])))
+            self.assertEqual(stream.num_frames, 5)
+    def test_history(self):
+        frames = np.random.rand(4, 2, 32, 32)
+        stream = pt.pyramids.SteerablePyramidFreqStream((32, 32), history=2)
+        results = [stream.process(frame) for frame in frames]
+        self.assertEqual(len(stream.history), 2)
+        self.assertIs(stream.history[0], results[-1])
+        self.assertIs(stream.history[1], results[-2])
+        self.assertEqual(results[0]['residual_highpass'].shape, (2, 32, 32))
+        self.assertTrue(np.allclose(stream.recon_pyr(), frames[-1], atol=1e-4))
+    def test_frame_size(self):
+        stream = pt.pyramids.SteerablePyramidFreqStream((32, 32))
+        with self.assertRaises(Exception):
+            stream.process(np.random.rand(32, 48))
+        with self.assertRaises(Exception):
+            pt.pyramids.SteerablePyramidFreqStream((32, 32), history=0)
+
+class MotionMagnificationTests(unittest.TestCase):
+    def _frames(self, num_frames=12, shape=(32, 48)):
+        # a grating moving back and forth
+        x = np.arange(shape[1])
+        return [np.tile(np.cos(2*np.pi*(x - .3*np.sin(2*np.pi*t/6)) / 8), (shape[0], 1))
+                for t in range(num_frames)]
+    def test_same_as_loop(self):
+        import scipy.signal
+        frames = self._frames()
+        b, a = scipy.signal.butter(2, [.1, .3], btype='bandpass')
+        magnifier = pt.PhaseMotionMagnifier(frames[0].shape, 5, (b, a), order=1)
+        magnified = [magnifier.process(f) for f in frames]
+        # the same, one coefficient set at a time
+        pyrs = [pt.pyramids.SteerablePyramidFreq(f, order=1, is_complex=True) for f in frames]
+        for k in pyrs[0].pyr_coeffs.keys():
+            if isinstance(k, str):
+                continue
+            coeffs = np.array([p.pyr_coeffs[k] for p in pyrs])
+            dphase = np.angle(coeffs[1:] * np.conj(coeffs[:-1]))
+            phase = np.concatenate([np.zeros_like(dphase[:1]), np.cumsum(dphase, 0)])
+            filtered = scipy.signal.lfilter(b, a, phase, axis=0)
+            for p, c, f in zip(pyrs, coeffs, filtered):
+                p.pyr_coeffs[k] = c * np.exp(5j * f)
+        for m, p in zip(magnified, pyrs):
+            self.assertTrue(np.allclose(m, p.recon_pyr()))
+    def test_threads(self):
+        frames = self._frames()
+        fir = ([.5, 0, -.5], [1])
+        magnified = list(pt.magnify_motion(frames, 10, (1, 3), 12))
+        magnifier = pt.PhaseMotionMagnifier((32, 48), 10, fir)
+        magnified_fir = [magnifier.process(f) for f in frames]
+        try:
+            pt.set_num_threads(3)
+            magnified_threads = list(pt.magnify_motion(frames, 10, (1, 3), 12))
+            magnifier = pt.PhaseMotionMagnifier((32, 48), 10, fir)
+            magnified_fir_threads = [magnifier.process(f) for f in frames]
+        finally:
+            pt.set_num_threads(1)
+        for m, m_threads in zip(magnified, magnified_threads):
+            self.assertTrue(np.allclose(m, m_threads))
+        for m, m_threads in zip(magnified_fir, magnified_fir_threads):
+            self.assertTrue(np.allclose(m, m_threads))
+    def test_no_magnification(self):
+        frames = self._frames(4)
+        for f, m in zip(frames, pt.magnify_motion(frames, 0, (1, 3), 12)):
+            self.assertTrue(np.allclose(f, m, atol=1e-4))
+
+class PyramidVectorTests(unittest.TestCase):
+    def _pyramids(self, im):
+        return [pt.pyramids.GaussianPyramid(im), pt.pyramids.LaplacianPyramid(im),
+                pt.pyramids.WaveletPyramid(im), pt.pyramids.SteerablePyramidSpace(im),
+                pt.pyramids.SteerablePyramidFreq(im),
+                pt.pyramids.SteerablePyramidFreq(im, is_complex=True, dtype=np.float32)]
+    def test_views(self):
+        im = np.random.rand(64, 64)
+        for pyr in self._pyramids(im):
+            vec = pyr.to_vector()
+            self.assertEqual(vec.ndim, 1)
+            self.assertEqual(vec.dtype, pyr.dtype)
+            self.assertIs(vec, pyr.to_vector())
+            for v in pyr.pyr_coeffs.values():
+                self.assertTrue(np.shares_memory(v, vec))
+            # pyr/pind order: the highpass first, the lowpass last
+            keys = list(pyr.pyr_coeffs.keys())
+            first = np.ravel(pyr.pyr_coeffs[keys[0]])
+            last = np.ravel(pyr.pyr_coeffs[keys[-1]])
+            self.assertTrue(np.array_equal(first.view(pyr.dtype), vec[:first.view(pyr.dtype).size]))
+            self.assertTrue(np.array_equal(last.view(pyr.dtype), vec[-last.view(pyr.dtype).size:]))
+            # changing the vector changes the coefficients
+            old = first.copy()
+            vec *= 2
+            self.assertTrue(np.array_equal(np.ravel(pyr.pyr_coeffs[keys[0]]), 2 * old))
+    def test_round_trip(self):
+        im = np.random.rand(64, 48)
+        for pyr, blank in zip(self._pyramids(im), self._pyramids(np.zeros_like(im))):
+            vec = pyr.to_vector().copy()
+            blank.from_vector(vec)
+            self.assertTrue(np.shares_memory(blank.to_vector(), vec))
+            for k, v in pyr.pyr_coeffs.items():
+                self.assertTrue(np.array_equal(v, blank.pyr_coeffs[k]))
+            if not isinstance(pyr, pt.pyramids.GaussianPyramid):
+                self.assertTrue(np.allclose(pyr.recon_pyr(), blank.recon_pyr()))
+            with self.assertRaises(Exception):
+                blank.from_vector(vec[:-1])
+    def test_assigned_coeffs(self):
+        im = np.random.rand(32, 32)
+        pyr = pt.pyramids.SteerablePyramidFreq(im, is_complex=True)
+        vec = pyr.to_vector()
+        new = np.ones_like(pyr.pyr_coeffs[(1, 0)])
+        pyr.pyr_coeffs[(1, 0)] = new
+        repacked = pyr.to_vector()
+        self.assertIsNot(repacked, vec)
+        self.assertTrue(np.array_equal(pyr.pyr_coeffs[(1, 0)], new))
+        self.assertTrue(np.shares_memory(pyr.pyr_coeffs[(1, 0)], repacked))
+    def test_store_dft(self):
+        im = np.random.rand(32, 32)
+        pyr = pt.pyramids.SteerablePyramidFreq(im, is_complex=True)
+        dft_pyr = pt.pyramids.SteerablePyramidFreq(im, is_complex=True, store_dft=True)
+        self.assertTrue(np.allclose(pyr.to_vector(), dft_pyr.to_vector()))
+        dft_pyr.from_vector(2 * pyr.to_vector())
+        self.assertTrue(np.allclose(dft_pyr.recon_pyr(), 2 * im, atol=1e-4))
+
+class PyramidStoreTests(unittest.TestCase):
+    def test_round_trip(self):
+        ims = np.random.rand(4, 32, 32)
+        pyrs = [pt.pyramids.SteerablePyramidFreq(im, is_complex=True, dtype=np.float32)
+                for im in ims]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = op.join(tmp, 'store')
+            store = pt.pyramids.PyramidStore.create(path, pyrs[0], len(ims))
+            for i, pyr in enumerate(pyrs[:-1]):
+                store.write(i, pyr)
+            # coefficients dicts, as those of the stream, can be written too
+            stream = pt.pyramids.SteerablePyramidFreqStream(ims.shape[1:], is_complex=True,
+                                                            dtype=np.float32)
+            store.write(len(ims) - 1, stream.process(ims[-1]))
+            store.flush()
+            del store
+            store = pt.pyramids.PyramidStore(path)
+            self.assertEqual(len(store), len(ims))
+            self.assertEqual(store.pyr_size, pyrs[0].pyr_size)
+            for i, pyr in enumerate(pyrs):
+                coeffs = store[i]
+                for k, v in pyr.pyr_coeffs.items():
+                    self.assertTrue(np.array_equal(coeffs[k], v))
+            band = store[:, (1, 2)]
+            self.assertIsInstance(band, np.memmap)
+            self.assertEqual(band.shape, (len(ims),) + pyrs[0].pyr_size[(1, 2)])
+            self.assertTrue(np.array_equal(band[2], pyrs[2].pyr_coeffs[(1, 2)]))
+            self.assertTrue(np.array_equal(store[1, 'residual_lowpass'],
+                                           pyrs[1].pyr_coeffs['residual_lowpass']))
+            with self.assertRaises(Exception):
+                store[0, (10, 0)]
+            del band, store
+    def test_layout_mismatch(self):
+        im = np.random.rand(32, 32)
+        with tempfile.TemporaryDirectory() as tmp:
+            store = pt.pyramids.PyramidStore.create(op.join(tmp, 'store'),
+                                                    pt.pyramids.LaplacianPyramid(im), 2)
+            with self.assertRaises(Exception):
+                store.write(0, pt.pyramids.LaplacianPyramid(im, height=2))
+            with self.assertRaises(Exception):
+                pt.pyramids.PyramidStore.create(op.join(tmp, 'store'),
+                                                pt.pyramids.LaplacianPyramid(im), 2)
+            del store
+
+class PyramidSaveTests(unittest.TestCase):
+    def _pyramids(self, im):
+        return [pt.pyramids.GaussianPyramid(im), pt.pyramids.LaplacianPyramid(im),
+                pt.pyramids.WaveletPyramid(im), pt.pyramids.SteerablePyramidSpace(im),
+                pt.pyramids.SteerablePyramidFreq(im, is_complex=True, dtype=np.float32),
+                pt.pyramids.SteerablePyramidFreq(im, scale_factor=2**.5, store_dft=True)]
+    def test_round_trip(self):
+        im = np.random.rand(64, 48)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = op.join(tmp, 'pyr')
+            for pyr in self._pyramids(im):
+                for compress, mmap_mode in [(False, None), (False, 'r'), (True, None)]:
+                    pyr.save(path, compress=compress)
+                    loaded = pt.pyramids.Pyramid.load(path, mmap_mode=mmap_mode)
+                    self.assertIs(type(loaded), type(pyr))
+                    self.assertEqual(loaded.pyr_size, pyr.pyr_size)
+                    self.assertEqual(loaded.num_scales, pyr.num_scales)
+                    self.assertTrue(np.array_equal(loaded.image, pyr.image))
+                    for k, v in pyr.pyr_coeffs.items():
+                        self.assertTrue(np.allclose(loaded.pyr_coeffs[k], v))
+                    if not isinstance(pyr, pt.pyramids.GaussianPyramid):
+                        self.assertTrue(np.allclose(loaded.recon_pyr(), pyr.recon_pyr()))
+                    del loaded
+    def test_options(self):
+        im = np.random.rand(64, 64)
+        pyr = pt.pyramids.SteerablePyramidFreq(im, order=1)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = op.join(tmp, 'pyr')
+            pyr.save(path, include_image=False)
+            loaded = pt.pyramids.SteerablePyramidFreq.load(path, mmap_mode='r')
+            self.assertIsNone(loaded.image)
+            self.assertIsInstance(loaded.to_vector(), np.memmap)
+            self.assertTrue(np.allclose(loaded.recon_pyr(), pyr.recon_pyr()))
+            del loaded
+            with self.assertRaises(Exception):
+                pt.pyramids.LaplacianPyramid.load(path)
+            pyr.save(path, compress=True)
+            with self.assertRaises(Exception):
+                pt.pyramids.Pyramid.load(path, mmap_mode='r')
+
+class LazyPyramidTests(unittest.TestCase):
+    def _pyramids(self, im, **kwargs):
+        return [pt.pyramids.GaussianPyramid(im, **kwargs),
+                pt.pyramids.LaplacianPyramid(im, **kwargs),
+                pt.pyramids.WaveletPyramid(im, **kwargs),
+                pt.pyramids.SteerablePyramidSpace(im, **kwargs),
+                pt.pyramids.SteerablePyramidFreq(im, **kwargs),
+                pt.pyramids.SteerablePyramidFreq(im, is_complex=True, **kwargs)]
+    def test_on_demand(self):
+        im = np.random.rand(64, 64)
+        for pyr, lazy in zip(self._pyramids(im), self._pyramids(im, lazy=True)):
+            self.assertEqual(list(lazy.pyr_coeffs.keys()), list(pyr.pyr_coeffs.keys()))
+            self.assertEqual(len(lazy.pyr_coeffs._built), 0)
+            self.assertTrue(np.array_equal(lazy.pyr_coeffs[(0, 0)], pyr.pyr_coeffs[(0, 0)]))
+            # only the levels up to the one accessed are built
+            self.assertNotIn('residual_lowpass', lazy.pyr_coeffs._built)
+            self.assertEqual(lazy.pyr_size[(1, 0)], pyr.pyr_size[(1, 0)])
+            self.assertNotIn((2, 0), lazy.pyr_coeffs._built)
+            self.assertEqual(dict(lazy.pyr_size), pyr.pyr_size)
+            for k, v in pyr.pyr_coeffs.items():
+                self.assertTrue(np.array_equal(lazy.pyr_coeffs[k], v))
+    def test_recon(self):
+        im = np.random.rand(64, 48)
+        for pyr, lazy in zip(self._pyramids(im)[1:], self._pyramids(im, lazy=True)[1:]):
+            self.assertTrue(np.allclose(lazy.recon_pyr(), pyr.recon_pyr()))
+            self.assertTrue(np.array_equal(lazy.to_vector(), pyr.to_vector()))
+    def test_assign(self):
+        im = np.random.rand(64, 64)
+        pyr = pt.pyramids.LaplacianPyramid(im, lazy=True)
+        pyr.pyr_coeffs[(1, 0)] = np.zeros(pyr.pyr_size[(1, 0)])
+        self.assertTrue(np.array_equal(pyr.pyr_coeffs[(1, 0)], np.zeros(pyr.pyr_size[(1, 0)])))
+        levels = pyr.recon_pyr(levels=[1])
+        self.assertTrue(np.array_equal(levels, np.zeros_like(im)))
+        with self.assertRaises(Exception):
+            pt.pyramids.SteerablePyramidFreq(im, lazy=True, store_dft=True)
+
+class KeepImageMasksTests(unittest.TestCase):
+    def test_keep_image(self):
+        im = np.random.rand(64, 48)
+        for P in [pt.pyramids.LaplacianPyramid, pt.pyramids.WaveletPyramid,
+                  pt.pyramids.SteerablePyramidSpace, pt.pyramids.SteerablePyramidFreq]:
+            pyr = P(im)
+            self.assertIsNotNone(pyr.image)
+            dropped = P(im, keep_image=False)
+            self.assertIsNone(dropped.image)
+            self.assertTrue(np.allclose(dropped.recon_pyr(), pyr.recon_pyr()))
+            # lazy pyramids need the image until all their levels are built
+            lazy = P(im, keep_image=False, lazy=True)
+            self.assertIsNotNone(lazy.image)
+            self.assertTrue(np.allclose(lazy.recon_pyr(), pyr.recon_pyr()))
+            self.assertIsNone(lazy.image)
+        wavelet_1d = pt.pyramids.WaveletPyramid(np.random.rand(64), keep_image=False)
+        self.assertEqual(wavelet_1d.recon_pyr().shape, (64, 1))
+    def test_keep_masks(self):
+        masks_module = sys.modules['pyrtools.pyramids.SteerablePyramidFreq']
+        im = np.random.rand(40, 56)
+        for is_complex, build_masks in [(False, masks_module._build_real_masks),
+                                        (True, masks_module._build_complex_masks)]:
+            build_masks.cache_clear()
+            masks_module._recon_real_masks.cache_clear()
+            pyr = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex, keep_masks=False)
+            recon = pyr.recon_pyr()
+            self.assertEqual(build_masks.cache_info().currsize, 0)
+            self.assertEqual(masks_module._recon_real_masks.cache_info().currsize, 0)
+            cached = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex)
+            self.assertEqual(build_masks.cache_info().currsize, 1)
+            for k, v in cached.pyr_coeffs.items():
+                self.assertTrue(np.array_equal(pyr.pyr_coeffs[k], v))
+            self.assertTrue(np.array_equal(recon, cached.recon_pyr()))
+
+class float32Tests(unittest.TestCase):
+    def test_corrDn(self):
+        im = np.random.rand(3, 37, 41)
+        filt = pt.named_filter('qmf9')
+        for edge_type in ['circular', 'reflect1', 'zero', 'dont-compute']:
+            res = pt.corrDn(im.astype(np.float32), filt, edge_type, (2, 1), (1, 0))
+            self.assertEqual(res.dtype, np.float32)
+            self.assertTrue(np.allclose(res, pt.corrDn(im, filt, edge_type, (2, 1), (1, 0)),
+                                        atol=1e-5))
+    def test_upConv(self):
+        im = np.random.rand(19, 14)
+        filt = pt.named_filter('binom5')
+        for edge_type in ['circular', 'reflect1', 'zero', 'dont-compute']:
+            res = pt.upConv(im.astype(np.float32), filt, edge_type, (2, 1), stop=(38, 14))
+            self.assertEqual(res.dtype, np.float32)
+            self.assertTrue(np.allclose(res, pt.upConv(im, filt, edge_type, (2, 1),
+                                                       stop=(38, 14)), atol=1e-5))
+    def test_sep(self):
+        im = np.random.rand(37, 41)
+        filt = pt.named_filter('binom5')
+        res = pt.sepCorrDn(im.astype(np.float32), filt, filt, step=(2, 2))
+        self.assertEqual(res.dtype, np.float32)
+        self.assertTrue(np.allclose(res, pt.sepCorrDn(im, filt, filt, step=(2, 2)), atol=1e-5))
+        up = pt.sepUpConv(res, filt, filt, step=(2, 2), stop=im.shape)
+        self.assertEqual(up.dtype, np.float32)
+        self.assertTrue(np.allclose(up, pt.sepUpConv(res.astype(float), filt, filt, step=(2, 2),
+                                                     stop=im.shape), atol=1e-5))
+    def test_pyramids(self):
+        img = pt.synthetic_images.ramp((64, 48)) + np.random.rand(64, 48)
+        for pyr_class, kwargs in [(pt.pyramids.LaplacianPyramid, {}),
+                                  (pt.pyramids.WaveletPyramid, {}),
+                                  (pt.pyramids.SteerablePyramidSpace, {}),
+                                  (pt.pyramids.SteerablePyramidFreq, {}),
+                                  (pt.pyramids.SteerablePyramidFreq, {'is_complex': True})]:
+            pyr = pyr_class(img, dtype=np.float32, **kwargs)
+            for k, v in pyr.pyr_coeffs.items():
+                if kwargs.get('is_complex') and isinstance(k, tuple):
+                    self.assertEqual(v.dtype, np.complex64)
+                else:
+                    self.assertEqual(v.dtype, np.float32)
+            recon = pyr.recon_pyr()
+            self.assertEqual(recon.dtype, np.float32)
+            self.assertTrue(np.allclose(recon, pyr_class(img, **kwargs).recon_pyr(), atol=1e-4))
+    def test_bad_dtype(self):
+        with self.assertRaises(Exception):
+            pt.pyramids.GaussianPyramid(np.random.rand(16, 16), dtype=np.int32)
+
 class blurTests(unittest.TestCase):
     def test0(self):
         matPyr = scipy.io.loadmat(op.join(matfiles_path, 'blur0.mat'))
@@ -218,6 +1143,36 @@ class pointOpTests(unittest.TestCase):
         foo = pt.pointOp(img, filt, 0, 1);
         foo = np.reshape(foo,(200,200))
         self.assertTrue((matImg['foo'] == foo).all())
+    def _reference(self, img, lut, origin, increment):
+        pos = (img - origin) / increment
+        index = np.clip(pos.astype(int), 0, lut.size-2)
+        return lut[index] + (lut[index+1] - lut[index]) * (pos - index)
+    def test_nd_strided(self):
+        img = np.random.uniform(-2, 12, (3, 40, 50))
+        lut = np.random.rand(100)
+        ref = self._reference(img, lut, 0, .1)
+        self.assertTrue(np.array_equal(pt.pointOp(img, lut, 0, .1), ref))
+        self.assertTrue(np.array_equal(pt.pointOp(img[:, ::2, 1::3], lut, 0, .1),
+                                       ref[:, ::2, 1::3]))
+        self.assertTrue(np.array_equal(pt.pointOp(img, lut, 0, .1, num_threads=3), ref))
+    def test_float32(self):
+        img = np.random.uniform(0, 9, (40, 50)).astype(np.float32)
+        lut = np.random.rand(100)
+        res = pt.pointOp(img, lut, 0, .1)
+        self.assertEqual(res.dtype, np.float32)
+        self.assertTrue(np.allclose(res, self._reference(img.astype(np.float64), lut, 0, .1),
+                                    atol=1e-5))
+    def test_out(self):
+        img = np.random.uniform(0, 9, (40, 50))
+        lut = np.random.rand(100)
+        ref = pt.pointOp(img, lut, 0, .1)
+        out = np.empty_like(img)
+        self.assertTrue(pt.pointOp(img, lut, 0, .1, out=out) is out)
+        self.assertTrue(np.array_equal(out, ref))
+        pt.pointOp(img, lut, 0, .1, out=img)
+        self.assertTrue(np.array_equal(img, ref))
+        with self.assertRaises(Exception):
+            pt.pointOp(img, lut, 0, .1, out=np.empty((40, 50), dtype=np.float32))
 
 class maxPyrHeightTests(unittest.TestCase):
     def test1(self):
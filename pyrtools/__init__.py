@@ -1,9 +1,12 @@
 from . import pyramids
 
-from .pyramids.c.wrapper import corrDn, upConv, pointOp
+from .pyramids.c.wrapper import corrDn, upConv, sepCorrDn, sepUpConv, pointOp
+from .pyramids.c.wrapper import set_num_threads, get_num_threads, clear_edge_bank_cache
 from .pyramids.filters import named_filter, binomial_filter, steerable_filters
 
 from .tools import synthetic_images
+from .tools.fft import set_fft_backend, get_fft_backend
+from .tools.motion_magnification import PhaseMotionMagnifier, magnify_motion
 from .tools.convolutions import blurDn, blur, upBlur, image_gradient, rconv2
 from .tools.display import imshow, animshow, pyrshow, make_figure
 from .tools.image_stats import image_compare, image_stats, range, skew, var, entropy
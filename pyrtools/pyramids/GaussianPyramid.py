@@ -1,6 +1,7 @@
+import numpy as np
 from .pyramid import Pyramid
 from .filters import parse_filter
-from .c.wrapper import corrDn
+from .c.wrapper import corrDn, sepCorrDn
 
 
 class GaussianPyramid(Pyramid):
@@ -32,11 +33,21 @@ class GaussianPyramid(Pyramid):
         * `'zero'` - assume values of zero outside image boundary
         * `'extend'` - reflect and invert
         * `'dont-compute'` - zero output when filter overhangs imput boundaries.
+    dtype : {np.float64, np.float32}
+        Floating-point precision in which to build the pyramid and store its coefficients. float32
+        halves memory use, at the cost of precision.
+    lazy : `bool`
+        If True, the levels are only built when they're needed: the first time one of their
+        coefficients (or one of a coarser level) is accessed, in `pyr_coeffs` or `pyr_size`.
+        Otherwise, they're all built now.
+    keep_image : `bool`
+        Whether to keep the image the pyramid is built from (in `image`), after it's built. It
+        isn't needed to reconstruct it, and dropping it saves memory.
 
     Attributes
     ----------
-    image : `array_like`
-        The input image used to construct the pyramid.
+    image : `array_like` or None
+        The input image used to construct the pyramid, or None if it wasn't kept.
     image_size : `tuple`
         The size of the input image.
     pyr_type : `str` or `None`
@@ -52,6 +63,8 @@ class GaussianPyramid(Pyramid):
     is_complex : `bool`
         Whether the coefficients are complex- or real-valued. Only `SteerablePyramidFreq` can have
         a value of True, all others must be False.
+    dtype : `np.dtype`
+        The floating-point precision of the pyramid.
 
     References
     ----------
@@ -67,8 +80,9 @@ class GaussianPyramid(Pyramid):
 
     """
 
-    def __init__(self, image, height='auto', filter_name='binom5', edge_type='reflect1', **kwargs):
-        super().__init__(image=image, edge_type=edge_type)
+    def __init__(self, image, height='auto', filter_name='binom5', edge_type='reflect1',
+                 dtype=np.float64, lazy=False, keep_image=True, **kwargs):
+        super().__init__(image=image, edge_type=edge_type, dtype=dtype)
         if self.pyr_type is None:
             self.pyr_type = 'Gaussian'
         self.num_orientations = 1
@@ -81,7 +95,7 @@ class GaussianPyramid(Pyramid):
             self.filters['upsample_filter'] = parse_filter(upsamp_filt, normalize=False)
         self._set_num_scales('downsample_filter', height, 1)
 
-        self._build_pyr()
+        self._build(lazy, keep_image)
 
     def _build_next(self, image):
         """build the next level of the pyramid
@@ -95,15 +109,14 @@ class GaussianPyramid(Pyramid):
         elif image.shape[1] == 1:
             res = corrDn(image=image, filt=self.filters['downsample_filter'], edge_type=self.edge_type, step=(2, 1))
         else:
-            tmp = corrDn(image=image, filt=self.filters['downsample_filter'].T, edge_type=self.edge_type, step=(1, 2))
-            res = corrDn(image=tmp, filt=self.filters['downsample_filter'], edge_type=self.edge_type, step=(2, 1))
+            res = sepCorrDn(image=image, filt_y=self.filters['downsample_filter'], filt_x=self.filters['downsample_filter'], edge_type=self.edge_type, step=(2, 2))
         return res
 
-    def _build_pyr(self):
+    def _build_levels(self):
         """build the pyramid
 
         This should not be called directly by users, it's a helper function for constructing the
-        pyramid
+        pyramid: a generator, which yields after each level (see `Pyramid._build`)
 
         we do this in a separate method for a bit of class wizardry: by over-writing this method in
         the LaplacianPyramid class, which inherits the GaussianPyramid class, we can still
@@ -111,12 +124,17 @@ class GaussianPyramid(Pyramid):
         constructor
         """
         im = self.image
-        self.pyr_coeffs[(0, 0)] = self.image.copy()
+        self.pyr_coeffs[(0, 0)] = self.image
         self.pyr_size[(0, 0)] = self.image_size
+        yield
         for lev in range(1, self.num_scales):
             im = self._build_next(im)
-            self.pyr_coeffs[(lev, 0)] = im.copy()
+            self.pyr_coeffs[(lev, 0)] = im
             self.pyr_size[(lev, 0)] = im.shape
+            yield
+
+    def _coeffs_keys(self):
+        return [(lev, 0) for lev in range(self.num_scales)]
 
     def recon_pyr(self, *args):
         """Reconstruct the pyramid -- NOT NECESSARY FOR GAUSSIANS
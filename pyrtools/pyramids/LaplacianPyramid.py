@@ -1,7 +1,7 @@
 import numpy as np
 from .GaussianPyramid import GaussianPyramid
 from .filters import parse_filter
-from .c.wrapper import upConv
+from .c.wrapper import upConv, sepUpConv
 
 
 class LaplacianPyramid(GaussianPyramid):
@@ -44,11 +44,21 @@ class LaplacianPyramid(GaussianPyramid):
         * `'zero'` - assume values of zero outside image boundary
         * `'extend'` - reflect and invert
         * `'dont-compute'` - zero output when filter overhangs imput boundaries.
+    dtype : {np.float64, np.float32}
+        Floating-point precision in which to build the pyramid and store its coefficients. float32
+        halves memory use, at the cost of precision.
+    lazy : `bool`
+        If True, the levels are only built when they're needed: the first time one of their
+        coefficients (or one of a coarser level) is accessed, in `pyr_coeffs` or `pyr_size`.
+        Otherwise, they're all built now.
+    keep_image : `bool`
+        Whether to keep the image the pyramid is built from (in `image`), after it's built. It
+        isn't needed to reconstruct it, and dropping it saves memory.
 
     Attributes
     ----------
-    image : `array_like`
-        The input image used to construct the pyramid.
+    image : `array_like` or None
+        The input image used to construct the pyramid, or None if it wasn't kept.
     image_size : `tuple`
         The size of the input image.
     pyr_type : `str` or `None`
@@ -64,6 +74,8 @@ class LaplacianPyramid(GaussianPyramid):
     is_complex : `bool`
         Whether the coefficients are complex- or real-valued. Only `SteerablePyramidFreq` can have
         a value of True, all others must be False.
+    dtype : `np.dtype`
+        The floating-point precision of the pyramid.
 
     References
     ----------
@@ -79,18 +91,20 @@ class LaplacianPyramid(GaussianPyramid):
 
     """
     def __init__(self, image, height='auto', downsample_filter_name='binom5',
-                 upsample_filter_name=None, edge_type='reflect1'):
+                 upsample_filter_name=None, edge_type='reflect1', dtype=np.float64, lazy=False,
+                 keep_image=True):
         self.pyr_type = 'Laplacian'
         if upsample_filter_name is None:
             upsample_filter_name = downsample_filter_name
-        super().__init__(image, height, downsample_filter_name, edge_type, upsample_filter_name=upsample_filter_name)
+        super().__init__(image, height, downsample_filter_name, edge_type, dtype=dtype, lazy=lazy,
+                         keep_image=keep_image, upsample_filter_name=upsample_filter_name)
 
 
-    def _build_pyr(self):
+    def _build_levels(self):
         """build the pyramid
 
         This should not be called directly by users, it's a helper function for constructing the
-        pyramid
+        pyramid: a generator, which yields after each level (see `Pyramid._build`)
 
         """
         im = self.image
@@ -98,11 +112,13 @@ class LaplacianPyramid(GaussianPyramid):
             im_next = self._build_next(im)
             im_recon = self._recon_prev(im_next, output_size=im.shape)
             im_residual = im - im_recon
-            self.pyr_coeffs[(lev, 0)] = im_residual.copy()
+            self.pyr_coeffs[(lev, 0)] = im_residual
             self.pyr_size[(lev, 0)] = im_residual.shape
             im = im_next
-        self.pyr_coeffs[(lev+1, 0)] = im.copy()
-        self.pyr_size[(lev+1, 0)] = im.shape
+            yield
+        self.pyr_coeffs[(self.num_scales-1, 0)] = im
+        self.pyr_size[(self.num_scales-1, 0)] = im.shape
+        yield
 
 
     def _recon_prev(self, image, output_size, upsample_filter=None, edge_type=None):
@@ -125,8 +141,7 @@ class LaplacianPyramid(GaussianPyramid):
         elif image.shape[1] == 1:
             res = upConv(image=image, filt=upsample_filter, edge_type=edge_type, step=(2, 1), stop=(output_size[0], output_size[1]))
         else:
-            tmp = upConv(image=image, filt=upsample_filter, edge_type=edge_type, step=(2, 1), stop=(output_size[0], image.shape[1]))
-            res = upConv(image=tmp, filt=upsample_filter.T, edge_type=edge_type, step=(1, 2), stop=(output_size[0], output_size[1]))
+            res = sepUpConv(image=image, filt_y=upsample_filter, filt_x=upsample_filter, edge_type=edge_type, step=(2, 2), stop=(output_size[0], output_size[1]))
         return res
 
 
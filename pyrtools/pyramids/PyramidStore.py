@@ -0,0 +1,151 @@
+import json
+import os
+import numpy as np
+from .pyramid import Pyramid, _vector_views
+
+
+class PyramidStore:
+    """Store the coefficients of the pyramids of many images in a memory-mapped file
+
+    All the pyramids in a store have the same configuration (type, parameters and image size),
+    and so the same coefficients, with the same sizes: each pyramid is stored as its vector (see
+    `Pyramid.to_vector`), a row of a 2d array on disk, whose layout (where each coefficient is in
+    the row) is that of the pyramid the store is created from. The array is memory-mapped, so that
+    the coefficients are only read from disk when they're used: indexing the store returns views
+    into it, by image id and coefficient key (e.g., `store[10, (2, 0)]`, or `store[:, (2, 0)]` for
+    that band of all the images), without loading the rest.
+
+    The store is a directory, containing the coefficients in `coeffs.npy` (a `.npy` file, which
+    `np.load` can open as well), and their layout in `layout.json`. Create it with `create`, then
+    write the pyramids of the images in it (with `write`), and open it later with `PyramidStore`.
+
+    Parameters
+    ----------
+    path : `str`
+        The directory of the store.
+    mode : {'r', 'r+'}
+        Whether to open the store read-only or for reading and writing.
+
+    Attributes
+    ----------
+    path : `str`
+        The directory of the store.
+    num_images : `int`
+        The number of pyramids the store holds.
+    pyr_type : `str`
+        The type of the pyramids, as their `pyr_type`.
+    pyr_size : `dict`
+        The sizes of the coefficients, as the `pyr_size` of the pyramids.
+    dtype : `np.dtype`
+        The floating-point precision of the coefficients.
+    data : `np.memmap`
+        The coefficients, as a (num_images, vector length) array, each row the vector of a pyramid.
+
+    """
+    def __init__(self, path, mode='r'):
+        if mode not in ['r', 'r+']:
+            raise Exception("mode must be 'r' or 'r+', but got %s!" % mode)
+        self.path = path
+        with open(os.path.join(path, 'layout.json')) as f:
+            layout = json.load(f)
+        self.pyr_type = layout['pyr_type']
+        self.dtype = np.dtype(layout['dtype'])
+        self._index = {}
+        self.pyr_size = {}
+        for key, offset, shape, is_complex in layout['coeffs']:
+            key = key if isinstance(key, str) else tuple(key)
+            self._index[key] = (offset, tuple(shape), is_complex)
+            self.pyr_size[key] = tuple(shape)
+        self.data = np.load(os.path.join(path, 'coeffs.npy'), mmap_mode=mode)
+        self.num_images = self.data.shape[0]
+        if self.data.dtype != self.dtype or self.data.shape[1] != layout['size']:
+            raise Exception("The coefficients in %s don't match their layout!" % path)
+
+    @classmethod
+    def create(cls, path, pyr, num_images):
+        """Create a store, for the pyramids of `num_images` images
+
+        Parameters
+        ----------
+        path : `str`
+            The directory of the store, which is created (it can exist, if empty).
+        pyr : `Pyramid`
+            A pyramid with the configuration of those of the store (e.g., that of the first image),
+            which gives the layout of the coefficients. It isn't written in the store.
+        num_images : `int`
+            The number of pyramids the store holds.
+
+        Returns
+        -------
+        store : `PyramidStore`
+            The store, opened for writing, with all the coefficients zero.
+
+        """
+        vector = pyr.to_vector()
+        os.makedirs(path, exist_ok=True)
+        if os.listdir(path):
+            raise Exception("%s isn't empty!" % path)
+        coeffs = [[k if isinstance(k, str) else list(k), int(offset), list(shape), bool(c)]
+                  for k, (offset, shape, c) in pyr._coeffs_index.items()]
+        layout = {'pyr_type': pyr.pyr_type, 'dtype': pyr.dtype.str, 'size': vector.size,
+                  'coeffs': coeffs}
+        data = np.lib.format.open_memmap(os.path.join(path, 'coeffs.npy'), mode='w+',
+                                         dtype=pyr.dtype, shape=(int(num_images), vector.size))
+        del data
+        with open(os.path.join(path, 'layout.json'), 'w') as f:
+            json.dump(layout, f)
+        return cls(path, mode='r+')
+
+    def __len__(self):
+        return self.num_images
+
+    def keys(self):
+        """The keys of the coefficients of the pyramids, as those of their `pyr_coeffs`
+        """
+        return self._index.keys()
+
+    def write(self, image_id, pyr):
+        """Write the pyramid of an image
+
+        Parameters
+        ----------
+        image_id : `int`
+            The index of the image in the store.
+        pyr : `Pyramid` or `dict`
+            Its pyramid, or the coefficients of it (as its `pyr_coeffs`, e.g., those returned by
+            `SteerablePyramidFreqStream.process`), with the configuration of the store.
+
+        """
+        if isinstance(pyr, Pyramid):
+            vector = pyr.to_vector()
+            if pyr._coeffs_index != self._index:
+                raise Exception("The pyramid doesn't have the layout of the store!")
+            self.data[image_id] = vector
+        else:
+            if pyr.keys() != self._index.keys():
+                raise Exception("The coefficients don't have the layout of the store!")
+            for k, v in _vector_views(self.data[image_id], self._index).items():
+                if (np.shape(pyr[k]) != v.shape or
+                        np.iscomplexobj(pyr[k]) != np.iscomplexobj(v)):
+                    raise Exception("Coefficient %s doesn't have the layout of the store!" % (k,))
+                v[...] = pyr[k]
+
+    def __getitem__(self, key):
+        """Get coefficients: `store[image_id]` gives the coefficients of an image's pyramid (as
+        its `pyr_coeffs`), and `store[image_id, key]` its coefficient `key`. `image_id` can also
+        be a slice (or anything that indexes the images without copying), for the coefficients of
+        several images, stacked along the first dimension. All are views into the file.
+        """
+        if isinstance(key, tuple) and len(key) == 2 and (isinstance(key[1], str) or
+                                                         isinstance(key[1], tuple)):
+            image_id, coeff_key = key
+            if coeff_key not in self._index:
+                raise Exception("The pyramids have no coefficient %s!" % (coeff_key,))
+            index = {coeff_key: self._index[coeff_key]}
+            return _vector_views(self.data[image_id], index)[coeff_key]
+        return _vector_views(self.data[key], self._index)
+
+    def flush(self):
+        """Write the changes to the coefficients to disk
+        """
+        self.data.flush()
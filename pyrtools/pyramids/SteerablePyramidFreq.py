@@ -1,9 +1,604 @@
+import collections.abc
+import functools
 import warnings
 import numpy as np
+import scipy.fft
 from scipy.special import factorial
 from .pyramid import SteerablePyramidBase
 from .c.wrapper import pointOp
 from ..tools.utils import rcosFn
+from ..tools.fft import fft2, ifft2, rfft2, irfft2
+
+
+# number of sets of masks kept by _build_real_masks, _build_complex_masks and _recon_real_masks.
+# Each holds a few times the size of the image, so only the most recently used shapes and
+# parameters are kept
+_MASK_CACHE_SIZE = 4
+
+
+def _readonly(mask):
+    """mark a cached mask as read-only, since it's shared between pyramids
+    """
+    mask.flags.writeable = False
+    return mask
+
+
+def _lodims(shape, factor):
+    """the size of the lowpass dft kept for a scale `factor` times coarser than the image: the
+    frequencies up to 1/`factor` of those of the image (beyond which the lowpass mask is zero)
+
+    It's computed from the size of the image, rather than from that of the previous scale, so that
+    the rounding doesn't accumulate (for octaves, both are the same).
+    """
+    return np.ceil(np.array(shape) / factor - 1e-10).astype(int)
+
+
+def _angle_const(order):
+    """the normalization of the angular masks, so that the squares of those of the `order`+1 bands
+    sum to one
+    """
+    num_orientations = order + 1
+    return (2**(2*order))*(factorial(order, exact=True)**2) / float(num_orientations*factorial(2*order, exact=True))
+
+
+@functools.lru_cache(maxsize=None)
+def _angle_lut(order, is_complex):
+    """lookup table for the angular masks
+
+    Returns
+    -------
+    Xcosn, Ycosn : `np.array`
+        the angles and the values of the mask at them
+    """
+    lutsize = 1024
+    Xcosn = np.pi * np.arange(-(2*lutsize+1), (lutsize+2)) / lutsize
+
+    const = _angle_const(order)
+
+    if is_complex:
+        # TODO clean that up and give comments
+        alfa = ((np.pi+Xcosn) % (2.0*np.pi)) - np.pi
+        Ycosn = (2.0 * np.sqrt(const) * (np.cos(Xcosn) ** order) *
+                 (np.abs(alfa) < np.pi/2.0).astype(int))
+    else:
+        Ycosn = np.sqrt(const) * (np.cos(Xcosn))**order
+    return _readonly(Xcosn), _readonly(Ycosn)
+
+
+def _angle_masks(angle, order, is_complex, exact):
+    """the angular masks of the `order`+1 bands, at the frequencies whose orientation is `angle`
+
+    With `exact`, the cos^order function is evaluated directly, otherwise it's interpolated from
+    the lookup table of `_angle_lut` (as in matlabPyrTools).
+    """
+    num_orientations = order + 1
+    if not exact:
+        Xcosn, Ycosn = _angle_lut(order, is_complex)
+        return [pointOp(angle, Ycosn, Xcosn[0]+np.pi*b/num_orientations, Xcosn[1]-Xcosn[0])
+                for b in range(num_orientations)]
+    cos_angle, sin_angle = np.cos(angle), np.sin(angle)
+    anglemasks = []
+    for b in range(num_orientations):
+        shift = np.pi * b / num_orientations
+        # cos(angle - shift)
+        cos_b = cos_angle * np.cos(shift) + sin_angle * np.sin(shift)
+        anglemask = np.full(angle.shape, np.sqrt(_angle_const(order)))
+        for _ in range(order):
+            anglemask *= cos_b
+        if is_complex:
+            # only the orientations within pi/2 of the band's are kept
+            alfa = ((np.pi + angle - shift) % (2.0*np.pi)) - np.pi
+            anglemask *= 2.0 * (np.abs(alfa) < np.pi/2.0)
+        anglemasks.append(anglemask)
+    return anglemasks
+
+
+def _radial_mask(log_rad, position, twidth, highpass, exact):
+    """the highpass (or lowpass) radial mask, at the frequencies whose log2 radius is `log_rad`
+
+    The transition is a raised cosine in log-frequency, `twidth` octaves wide and centered at
+    `position`. With `exact`, it's evaluated directly, otherwise it's interpolated from the lookup
+    table of `rcosFn` (as in matlabPyrTools).
+    """
+    if exact:
+        theta = np.clip((log_rad - position) * np.pi / (2*twidth) - np.pi/4, -np.pi/2, 0)
+        return np.cos(theta) if highpass else -np.sin(theta)
+    (Xrcos, Yrcos) = rcosFn(twidth, position, np.array([0, 1]))
+    Yrcos = np.sqrt(Yrcos)
+    if not highpass:
+        Yrcos = np.sqrt(1.0 - Yrcos**2)
+    return pointOp(log_rad, Yrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
+
+
+def _build_masks(shape, num_scales, order, twidth, is_complex, dtype, exact=False,
+                 scale_factor=2):
+    """compute the Fourier-domain masks used to build a `SteerablePyramidFreq`
+
+    They aren't cached themselves: `_build_real_masks` and `_build_complex_masks` combine them into
+    the masks the pyramids use, which are. With `exact`, they're evaluated directly rather than
+    interpolated from lookup tables (see `_radial_mask` and `_angle_masks`). Each scale is
+    `scale_factor` times coarser than the previous one (see `_lodims`).
+
+    Returns
+    -------
+    masks : `dict`
+        'lo0mask' and 'hi0mask', the initial lowpass and highpass masks, and lists with, for each
+        scale, the highpass mask ('himasks'), the list of angular masks ('anglemasks'), the
+        (start, end) bounds of the lowpass dft kept for the next scale ('lo_bounds') and the
+        lowpass mask applied to it ('lomasks').
+
+    """
+    dims = np.array(shape)
+    ctr = np.ceil((np.array(dims)+0.5)/2).astype(int)
+
+    (xramp, yramp) = np.meshgrid(np.linspace(-1, 1, dims[1]+1)[:-1],
+                                 np.linspace(-1, 1, dims[0]+1)[:-1])
+
+    angle = np.arctan2(yramp, xramp)
+    log_rad = np.sqrt(xramp**2 + yramp**2)
+    log_rad[ctr[0]-1, ctr[1]-1] = log_rad[ctr[0]-1, ctr[1]-2]
+    log_rad = np.log2(log_rad)
+
+    # center of the radial transition function (a raised cosine in log-frequency)
+    position = -twidth/2.0
+
+    # the masks are computed in double precision, then cast to the precision of the pyramid.
+    masks = {'himasks': [], 'anglemasks': [], 'lo_bounds': [], 'lomasks': []}
+    masks['lo0mask'] = _readonly(_radial_mask(log_rad, position, twidth, False,
+                                              exact).astype(dtype))
+    masks['hi0mask'] = _readonly(_radial_mask(log_rad, position, twidth, True,
+                                              exact).astype(dtype))
+
+    # the frequencies of each scale are the center of those of the previous one, so its angular
+    # masks are the center of those of the first scale
+    anglemasks = [_readonly(anglemask.astype(dtype))
+                  for anglemask in _angle_masks(angle, order, is_complex, exact)]
+    for i in range(num_scales):
+        position -= np.log2(scale_factor)
+
+        himask = _radial_mask(log_rad, position, twidth, True, exact).astype(dtype)
+        masks['himasks'].append(_readonly(himask))
+        masks['anglemasks'].append(anglemasks)
+
+        dims = np.array(log_rad.shape)
+        ctr = np.ceil((dims+0.5)/2).astype(int)
+        lodims = _lodims(shape, scale_factor ** (i+1))
+        loctr = np.ceil((lodims+0.5)/2).astype(int)
+        lostart = ctr - loctr
+        loend = lostart + lodims
+        masks['lo_bounds'].append((lostart, loend))
+
+        log_rad = log_rad[lostart[0]:loend[0], lostart[1]:loend[1]]
+        anglemasks = [anglemask[lostart[0]:loend[0], lostart[1]:loend[1]]
+                      for anglemask in anglemasks]
+        lomask = _radial_mask(log_rad, position, twidth, False, exact).astype(dtype)
+        masks['lomasks'].append(_readonly(lomask))
+    return masks
+
+
+def _recon_masks(sizes, order, twidth, dtype, exact=False, scale_factor=2):
+    """compute the Fourier-domain masks used by `SteerablePyramidFreq.recon_pyr`
+
+    These only depend on the sizes of the pyramid's scales (from the residual lowpass to the
+    finest scale) and its parameters. `recon_pyr` uses them through `_recon_real_masks`, which is
+    cached. With `exact`, they're evaluated directly rather than interpolated from lookup tables.
+
+    Returns
+    -------
+    masks : `dict`
+        'bound_list' and 'dim_list', the bounds and sizes of the dfts at each stage of the
+        reconstruction, from the coarsest to the finest, the initial lowpass mask ('lomask'), dicts
+        with the lowpass ('lomasks'), highpass ('himasks') and angular ('anglemasks', one list per
+        stage) masks for each stage, and the final lowpass and highpass masks ('lo0mask' and
+        'hi0mask').
+
+    """
+    # make list of dims and bounds
+    bound_list = []
+    dim_list = []
+    # we go through pyr_sizes from smallest to largest, each cropped to the previous one
+    for j, dims in enumerate(sizes):
+        dim_list.append(dims)
+        dims = np.array(dims)
+        ctr = np.ceil((dims+0.5)/2).astype(int)
+        lodims = np.array(sizes[j-1]) if j > 0 else _lodims(dims, scale_factor)
+        loctr = np.ceil((lodims+0.5)/2).astype(int)
+        lostart = ctr - loctr
+        loend = lostart + lodims
+        bounds = (lostart[0], lostart[1], loend[0], loend[1])
+        bound_list.append(bounds)
+    bound_list.append((0, 0, dim_list[-1][0], dim_list[-1][1]))
+    dim_list.append((dim_list[-1][0], dim_list[-1][1]))
+
+    # matlab code starts here
+    dims = np.array(sizes[-1])
+    ctr = np.ceil((dims+0.5)/2.0).astype(int)
+
+    (xramp, yramp) = np.meshgrid((np.arange(1, dims[1]+1)-ctr[1]) / (dims[1]/2.),
+                                 (np.arange(1, dims[0]+1)-ctr[0]) / (dims[0]/2.))
+    angle = np.arctan2(yramp, xramp)
+    log_rad = np.sqrt(xramp**2 + yramp**2)
+    log_rad[ctr[0]-1, ctr[1]-1] = log_rad[ctr[0]-1, ctr[1]-2]
+    log_rad = np.log2(log_rad)
+
+    # center of the radial transition function (a raised cosine in log-frequency)
+    position = -twidth/2.0
+
+    # from reconSFpyrLevs. The angular masks of each stage are the center of those of the finest
+    anglemasks = [anglemask.astype(dtype)
+                  for anglemask in _angle_masks(angle, order, False, exact)]
+
+    masks = {'bound_list': bound_list, 'dim_list': dim_list, 'lomasks': {}, 'himasks': {},
+             'anglemasks': {}}
+
+    # lowest band
+    bounds = (0, 0, 0, 0)
+    for idx in range(len(bound_list)-2, 0, -1):
+        diff = (bound_list[idx][2]-bound_list[idx][0],
+                bound_list[idx][3]-bound_list[idx][1])
+        bounds = (bounds[0]+bound_list[idx][0], bounds[1]+bound_list[idx][1],
+                  bounds[0]+bound_list[idx][0] + diff[0],
+                  bounds[1]+bound_list[idx][1] + diff[1])
+        position -= np.log2(scale_factor)
+    nlog_rad = log_rad[bounds[0]:bounds[2], bounds[1]:bounds[3]]
+    masks['lomask'] = _readonly(_radial_mask(nlog_rad, position, twidth, False,
+                                             exact).astype(dtype))
+
+    # middle bands
+    for idx in range(1, len(bound_list)-1):
+        bounds1 = (0, 0, 0, 0)
+        bounds2 = (0, 0, 0, 0)
+        for boundIdx in range(len(bound_list) - 1, idx - 1, -1):
+            diff = (bound_list[boundIdx][2]-bound_list[boundIdx][0],
+                    bound_list[boundIdx][3]-bound_list[boundIdx][1])
+            bound2tmp = bounds2
+            bounds2 = (bounds2[0]+bound_list[boundIdx][0],
+                       bounds2[1]+bound_list[boundIdx][1],
+                       bounds2[0]+bound_list[boundIdx][0] + diff[0],
+                       bounds2[1]+bound_list[boundIdx][1] + diff[1])
+            bounds1 = bound2tmp
+        nlog_rad1 = log_rad[bounds1[0]:bounds1[2], bounds1[1]:bounds1[3]]
+        nlog_rad2 = log_rad[bounds2[0]:bounds2[2], bounds2[1]:bounds2[3]]
+        if idx > 1:
+            position += np.log2(scale_factor)
+            lomask = _radial_mask(nlog_rad2, position, twidth, False, exact).astype(dtype)
+            masks['lomasks'][idx] = _readonly(lomask)
+
+        # reconSFpyrLevs
+        himask = _radial_mask(nlog_rad1, position, twidth, True, exact).astype(dtype)
+        masks['himasks'][idx] = _readonly(himask)
+        masks['anglemasks'][idx] = [_readonly(anglemask[bounds1[0]:bounds1[2],
+                                                        bounds1[1]:bounds1[3]])
+                                    for anglemask in anglemasks]
+
+    position += np.log2(scale_factor)
+    masks['lo0mask'] = _readonly(_radial_mask(log_rad, position, twidth, False,
+                                              exact).astype(dtype))
+    masks['hi0mask'] = _readonly(_radial_mask(log_rad, position, twidth, True,
+                                              exact).astype(dtype))
+    return masks
+
+
+def _wrap(freqs, n):
+    """the frequencies equal to `freqs` modulo `n`, in the range of those of an `n`-point dft
+    (from -(n//2) to (n-1)//2)
+    """
+    return (freqs + n//2) % n - n//2
+
+
+def _mask_values(mask, fy, fx):
+    """the values of a (centered, i.e., fftshifted) Fourier-domain mask at the frequencies `fy`
+    (rows) and `fx` (columns), zero for the frequencies outside of it
+    """
+    ny, nx = mask.shape
+    iy, ix = fy + ny//2, fx + nx//2
+    valid_y = (iy >= 0) & (iy < ny)
+    valid_x = (ix >= 0) & (ix < nx)
+    values = np.zeros((len(fy), len(fx)), dtype=mask.dtype)
+    values[np.ix_(valid_y, valid_x)] = mask[np.ix_(iy[valid_y], ix[valid_x])]
+    return values
+
+
+def _crop_mask(mask, shape):
+    """the center (i.e., the lowest frequencies) of a centered Fourier-domain mask
+    """
+    start = np.array(mask.shape)//2 - np.array(shape)//2
+    return mask[start[0]:start[0]+shape[0], start[1]:start[1]+shape[1]]
+
+
+def _rfft_gather(shape, image_shape):
+    """where to find the dft of size `shape` of the low frequencies of an image in the image's rfft
+
+    Returns
+    -------
+    gather : `dict` or None
+        None if `shape` is the `image_shape`. Otherwise, 'index' and 'conj', the flat index in the
+        rfft of the image's dft at each frequency of the half-spectrum of size `shape`, and whether
+        it needs to be conjugated. For even sizes, the dft at the Nyquist frequency -n/2 of the
+        smaller spectrum doesn't equal its conjugate at n/2 (both of which come from the image),
+        so 'nyquist', 'nyquist_index' and 'nyquist_conj' give the flat index of those entries in
+        the half-spectrum, and where to find the dft at the opposite frequency.
+
+    """
+    if tuple(shape) == tuple(image_shape):
+        return None
+    (ny, nx), (dim_y, dim_x) = shape, image_shape
+
+    def rfft_index(fy, fx):
+        # the rfft only has the non-negative column frequencies, the others are the conjugate of
+        # those at the opposite frequency
+        fy, fx = np.broadcast_arrays(fy[:, None], fx[None, :])
+        conj = (fx % dim_x) > dim_x//2
+        fy = np.where(conj, -fy, fy) % dim_y
+        fx = np.where(conj, -fx, fx) % dim_x
+        return (fy * (dim_x//2 + 1) + fx).ravel(), conj.ravel()
+
+    ky, kx = np.arange(ny), np.arange(nx//2 + 1)
+    dy, dx = _wrap(ky, ny), _wrap(kx, nx)
+    oy, ox = -_wrap(-ky, ny), -_wrap(-kx, nx)
+    gather = dict(zip(['index', 'conj'], rfft_index(dy, dx)))
+    nyquist = ((((oy - dy) % dim_y) != 0)[:, None] | (((ox - dx) % dim_x) != 0)[None, :]).ravel()
+    index, conj = rfft_index(oy, ox)
+    gather['nyquist'] = np.flatnonzero(nyquist)
+    gather['nyquist_index'] = index[nyquist]
+    gather['nyquist_conj'] = conj[nyquist]
+    return gather
+
+
+def _real_band_weights(mask, sign, gather, dtype):
+    """the weights giving the rfft of the real part of a band from the half-spectrum of the image
+
+    The band is the real part of the inverse dft of `c * mask * imdft`, where `c` is 1, -1, 1j or
+    -1j, and `sign` is `conj(c) / c`. That's the inverse dft of the hermitian part of
+    `c * mask * imdft`, which is `c * (mask(k) + sign * mask(-k)) / 2 * imdft(k)`, except at the
+    Nyquist frequencies of `_rfft_gather`, where the second term multiplies the dft at the
+    opposite frequency instead: that's corrected by adding `sign * mask(-k) / 2` times the
+    difference between the two.
+
+    Returns
+    -------
+    weights, nyquist_weights : `np.array`
+        The weights of the half-spectrum, and the corrections at the Nyquist frequencies of
+        `gather` (None if there are none).
+
+    """
+    ny, nx = mask.shape
+    ky, kx = np.arange(ny), np.arange(nx//2 + 1)
+    direct = _mask_values(mask, _wrap(ky, ny), _wrap(kx, nx))
+    opposite = sign * _mask_values(mask, _wrap(-ky, ny), _wrap(-kx, nx)) / 2
+    nyquist_weights = None
+    if gather is not None:
+        nyquist_weights = _readonly(opposite.ravel()[gather['nyquist']].astype(dtype))
+    return _readonly((direct/2 + opposite).astype(dtype)), nyquist_weights
+
+
+@functools.lru_cache(maxsize=_MASK_CACHE_SIZE)
+def _build_real_masks(shape, num_scales, order, twidth, dtype, exact=False, scale_factor=2):
+    """compute the half-spectrum masks used to build a real-valued `SteerablePyramidFreq`
+
+    The real parts of the bands (which are all a real-valued pyramid keeps) are computed with
+    irfft2, from the rfft2 of the image, which is half the work of the complex transforms. The
+    masks of `_build_masks` are combined (the lowpass masks of the previous scales with those of
+    each band) and made hermitian (see `_real_band_weights`), in the unshifted layout of the
+    rfft, so that no fftshift is needed either. They only depend on the shape of the image and
+    the parameters of the pyramid, so they're cached: building the pyramids of many images of the
+    same shape (e.g., the frames of a video) only computes them once. They are shared between
+    those pyramids, and so are read-only.
+
+    Returns
+    -------
+    masks : `dict`
+        'levels', for each scale and for the residual lowpass, a dict with its 'shape' and the
+        `_rfft_gather` to get its half-spectrum from that of the image, and the weights (and
+        Nyquist corrections, see `_real_band_weights`) for the 'residual_highpass', each of the
+        'bands' (a list per scale) and the 'residual_lowpass'.
+
+    """
+    masks = _build_masks(shape, num_scales, order, twidth, False, np.dtype(np.float64), exact,
+                         scale_factor)
+    sign = (-1) ** order
+
+    real_masks = {'levels': [], 'bands': []}
+    real_masks['residual_highpass'] = _real_band_weights(masks['hi0mask'], 1, None, dtype)
+    lomask = masks['lo0mask']
+    for i in range(num_scales):
+        gather = _rfft_gather(lomask.shape, shape)
+        real_masks['levels'].append({'shape': lomask.shape, 'gather': gather})
+        bands = []
+        for anglemask in masks['anglemasks'][i]:
+            bands.append(_real_band_weights(lomask * anglemask * masks['himasks'][i], sign,
+                                            gather, dtype))
+        real_masks['bands'].append(bands)
+        lomask = _crop_mask(lomask, masks['lomasks'][i].shape) * masks['lomasks'][i]
+    gather = _rfft_gather(lomask.shape, shape)
+    real_masks['levels'].append({'shape': lomask.shape, 'gather': gather})
+    real_masks['residual_lowpass'] = _real_band_weights(lomask, 1, gather, dtype)
+    return real_masks
+
+
+@functools.lru_cache(maxsize=_MASK_CACHE_SIZE)
+def _build_complex_masks(shape, num_scales, order, twidth, dtype, exact=False,
+                         scale_factor=2):
+    """compute the masks used to build a complex-valued `SteerablePyramidFreq`
+
+    The masks of `_build_masks` are combined (the lowpass masks of the previous scales with those
+    of each band) and unshifted, so that each band's dft is the image's at the band's frequencies
+    times a single mask, without any fftshift. The residuals are real, and are computed from the
+    half-spectrum of the image, as in `_build_real_masks`. Like those, they're cached, and shared
+    (read-only) between pyramids.
+
+    Returns
+    -------
+    masks : `dict`
+        'levels', for each scale, a dict with its 'shape' and the 'rows' and 'cols' of the image's
+        dft at its frequencies, the mask of each of the 'bands' (a list per scale), and the
+        weights (see `_real_band_weights`) of the 'residual_highpass' and of the
+        'residual_lowpass', with the `_rfft_gather` of the latter ('lowpass_level').
+
+    """
+    masks = _build_masks(shape, num_scales, order, twidth, True, np.dtype(np.float64), exact,
+                         scale_factor)
+
+    complex_masks = {'levels': [], 'bands': []}
+    complex_masks['residual_highpass'] = _real_band_weights(masks['hi0mask'], 1, None, dtype)
+    lomask = masks['lo0mask']
+    for i in range(num_scales):
+        (ny, nx) = lomask.shape
+        complex_masks['levels'].append({'shape': lomask.shape,
+                                        'rows': _readonly(_wrap(np.arange(ny), ny) % shape[0]),
+                                        'cols': _readonly(_wrap(np.arange(nx), nx) % shape[1])})
+        complex_masks['bands'].append([
+            _readonly(scipy.fft.ifftshift(lomask * anglemask * masks['himasks'][i]).astype(dtype))
+            for anglemask in masks['anglemasks'][i]])
+        lomask = _crop_mask(lomask, masks['lomasks'][i].shape) * masks['lomasks'][i]
+    gather = _rfft_gather(lomask.shape, shape)
+    complex_masks['lowpass_level'] = {'shape': lomask.shape, 'gather': gather}
+    complex_masks['residual_lowpass'] = _real_band_weights(lomask, 1, gather, dtype)
+    return complex_masks
+
+
+def _real_band_dft(imdft, level, weights, c=1):
+    """compute the rfft2 of a band of a real-valued pyramid from the rfft2 of the image
+
+    Parameters
+    ----------
+    imdft : `np.array`
+        The rfft2 of the image.
+    level : `dict`
+        The shape of the band and where to find its half-spectrum in `imdft`.
+    weights : `tuple`
+        The weights (and Nyquist corrections) of the band, from `_real_band_weights`.
+    c : `complex`
+        The phase of the band (see `_real_band_weights`).
+
+    """
+    gather = level['gather']
+    if gather is None:
+        banddft = imdft * weights[0]
+    else:
+        # the last two dimensions are the frequencies, the others index the images of a batch
+        batch_shape = imdft.shape[:-2]
+        imdft = imdft.reshape(batch_shape + (-1,))
+        lodft = imdft[..., gather['index']]
+        lodft[..., gather['conj']] = lodft[..., gather['conj']].conj()
+        banddft = lodft * weights[0].ravel()
+        nyquist = imdft[..., gather['nyquist_index']]
+        nyquist[..., gather['nyquist_conj']] = nyquist[..., gather['nyquist_conj']].conj()
+        nyquist -= lodft[..., gather['nyquist']]
+        banddft[..., gather['nyquist']] += weights[1] * nyquist
+        banddft = banddft.reshape(batch_shape + weights[0].shape)
+    if c != 1:
+        banddft *= c
+    return banddft
+
+
+def _real_part_rfft(dft):
+    """the rfft2 of the real part of a signal, from its (full, unshifted) fft2
+    """
+    dim_y, dim_x = dft.shape[-2:]
+    # the dft of the conjugate of the signal is the conjugate of the dft at the opposite frequency
+    opposite = dft[..., -np.arange(dim_y) % dim_y, :][..., -np.arange(dim_x//2 + 1) % dim_x]
+    return (dft[..., :dim_x//2 + 1] + opposite.conj()) / 2
+
+
+class _DftCoeffs(collections.abc.MutableMapping):
+    """the coefficients of a `SteerablePyramidFreq` whose dfts are stored (see `store_dft`)
+
+    Each coefficient is computed from its dft (in `pyr_coeffs_dft`) when it's accessed, and isn't
+    kept, so the returned arrays are read-only: to change a coefficient, assign it, which stores its
+    dft instead.
+    """
+    def __init__(self, pyr):
+        self._pyr = pyr
+
+    def _is_real(self, key):
+        # the residuals are real, and so are the bands of real-valued pyramids
+        return isinstance(key, str) or not self._pyr.is_complex
+
+    def __getitem__(self, key):
+        pyr = self._pyr
+        dft = pyr.pyr_coeffs_dft[key]
+        if self._is_real(key):
+            coeff = irfft2(dft, pyr.pyr_size[key], pyr.fft_backend, pyr.num_threads)
+        else:
+            coeff = ifft2(dft, pyr.fft_backend, pyr.num_threads)
+        coeff.flags.writeable = False
+        return coeff
+
+    def __setitem__(self, key, coeff):
+        pyr = self._pyr
+        if self._is_real(key):
+            dft = rfft2(np.real(coeff), pyr.fft_backend, pyr.num_threads)
+        else:
+            dft = fft2(coeff, pyr.fft_backend, pyr.num_threads)
+        pyr.pyr_coeffs_dft[key] = dft
+
+    def __delitem__(self, key):
+        del self._pyr.pyr_coeffs_dft[key]
+
+    def __iter__(self):
+        return iter(self._pyr.pyr_coeffs_dft)
+
+    def __len__(self):
+        return len(self._pyr.pyr_coeffs_dft)
+
+
+@functools.lru_cache(maxsize=_MASK_CACHE_SIZE)
+def _recon_real_masks(sizes, order, twidth, dtype, exact=False, scale_factor=2):
+    """compute the half-spectrum masks used by `SteerablePyramidFreq.recon_pyr`
+
+    The reconstruction is real-valued, so it's the irfft2 of the hermitian part of the sum of the
+    (masked and zero-padded) dfts of the coefficients. Since the coefficients are real, their dfts
+    are hermitian, so each term's contribution is its rfft2 times the hermitian part of the
+    product of the masks it goes through (those of `_recon_masks`). These weights are cached.
+
+    Returns
+    -------
+    masks : `dict`
+        'residual_highpass', 'residual_lowpass', and 'levels', a list with a dict for each scale
+        (the finest first), each containing 'rows', the row (frequencies) of the image's
+        half-spectrum its contribution covers, 'coeff_rows', the corresponding rows of its own, and
+        'weights', a stack of the weights of each band (of the residual, for those).
+
+    """
+    masks = _recon_masks(sizes, order, twidth, np.dtype(np.float64), exact, scale_factor)
+    dim_list = masks['dim_list']
+    image_shape = dim_list[-1]
+
+    def row_freqs(ny):
+        # the row frequencies of a term with ny rows go from -(ny//2) to (ny-1)//2, and those of
+        # its conjugate from -(ny-1)//2 to ny//2
+        return np.arange(-(ny//2), (ny//2 if ny < image_shape[0] else (image_shape[0]-1)//2) + 1)
+
+    def rows(shape):
+        fy = row_freqs(shape[0])
+        return {'rows': fy % image_shape[0], 'coeff_rows': fy % shape[0]}
+
+    def weights(mask, sign):
+        (dim_y, dim_x) = image_shape
+        fy, fx = row_freqs(mask.shape[0]), np.arange(mask.shape[1]//2 + 1)
+        weights = (_mask_values(mask, _wrap(fy, dim_y), _wrap(fx, dim_x)) +
+                   sign * _mask_values(mask, _wrap(-fy, dim_y), _wrap(-fx, dim_x))) / 2
+        return weights.astype(dtype)
+
+    sign = (-1) ** order
+    real_masks = {'levels': []}
+    real_masks['residual_highpass'] = rows(image_shape)
+    real_masks['residual_highpass']['weights'] = _readonly(weights(masks['hi0mask'], 1)[None])
+    # the product of the masks each stage of the reconstruction goes through, from the finest
+    lomask = masks['lo0mask']
+    for idx in range(len(dim_list)-2, 0, -1):
+        lomask = _crop_mask(lomask, dim_list[idx])
+        level = rows(dim_list[idx])
+        level['weights'] = _readonly(np.stack([weights(lomask * anglemask * masks['himasks'][idx],
+                                                       sign)
+                                               for anglemask in masks['anglemasks'][idx]]))
+        real_masks['levels'].append(level)
+        lomask = _crop_mask(lomask, dim_list[idx-1])
+        lomask = lomask * (masks['lomasks'][idx] if idx > 1 else masks['lomask'])
+    real_masks['residual_lowpass'] = rows(dim_list[0])
+    real_masks['residual_lowpass']['weights'] = _readonly(weights(lomask, 1)[None])
+    return real_masks
 
 
 class SteerablePyramidFreq(SteerablePyramidBase):
@@ -24,10 +619,22 @@ class SteerablePyramidFreq(SteerablePyramidBase):
     -----
     Transform described in [1]_, filter kernel design described in [2]_.
 
+    The Fourier-domain masks only depend on the shape of the image and the parameters of the
+    pyramid, so they're cached and shared between pyramids (and calls to `recon_pyr`): building
+    the pyramids of many images of the same shape only computes them once. The masks of the last
+    few shapes / parameters are kept. Real-valued pyramids (`is_complex=False`) are built with
+    real FFTs, as is the reconstruction (which only uses the real part of the coefficients).
+
+    A batch of images of the same size (e.g., an array of shape `(N, H, W)` or `(N, C, H, W)`) is
+    transformed at once: each FFT is a single call over the whole batch, and the masks are
+    broadcast over the batch dimensions, which lead those of the coefficients (and of the
+    reconstruction).
+
     Parameters
     ----------
     image : `array_like`
-        2d image upon which to construct to the pyramid.
+        2d image upon which to construct to the pyramid, or a batch of them, stacked along leading
+        dimensions (e.g., an array of shape `(N, C, H, W)`), whose pyramids are built at once.
     height : 'auto' or `int`.
         The height of the pyramid. If 'auto', will automatically determine based on the size of
         `image`.
@@ -41,23 +648,85 @@ class SteerablePyramidFreq(SteerablePyramidBase):
         Whether the pyramid coefficients should be complex or not. If True, the real and imaginary
         parts correspond to a pair of even and odd symmetric filters. If False, the coefficients
         only include the real part / even symmetric filter.
+    dtype : {np.float64, np.float32}
+        Floating-point precision in which to build the pyramid and store its coefficients. With
+        float32, the (Fourier transforms and) coefficients are computed in single precision, and
+        are complex64 if `is_complex` is True. This halves memory use, at the cost of precision.
+    fft_backend : {None, 'scipy', 'pyfftw'}
+        The backend of the FFTs used to build and reconstruct the pyramid. If None, use the
+        default, see `pyrtools.tools.fft.set_fft_backend`.
+    num_threads : `int` or None
+        The number of threads the FFTs run on. If None, use the library's default, see
+        `set_num_threads`.
+    store_dft : `bool`
+        Whether to store the coefficients in the Fourier domain (in `pyr_coeffs_dft`), rather than
+        the spatial domain. The pyramid is computed in the Fourier domain, and so is the
+        reconstruction, so this skips an inverse FFT per coefficient when building the pyramid,
+        and a forward one when reconstructing it. `pyr_coeffs` still gives the coefficients in the
+        spatial domain, computed when they're accessed (as read-only arrays: to change one,
+        assign it, or change its dft).
+    exact_masks : `bool`
+        Whether to evaluate the radial (raised cosine) and angular (cos^order) masks exactly. By
+        default, they're linearly interpolated from lookup tables, as in matlabPyrTools, which
+        limits the accuracy of the reconstruction to about 1e-5. Exact masks reconstruct the image
+        to machine precision (for even sizes), but take a few times longer to compute (once per
+        shape, since they're cached), and the coefficients differ slightly from the default ones.
+    scale_factor : `float`
+        The ratio between the (radial) frequencies of consecutive scales, and between their sizes.
+        The default, 2, gives the usual octave-spaced pyramid, while `2**(1/k)` gives `k` scales per
+        octave (e.g., `2**.5` for a half-octave pyramid), for a finer sampling of scale. The
+        transition between scales stays `twidth` octaves wide, and the maximum height grows
+        accordingly.
+    lazy : `bool`
+        If True, the levels are only built when they're needed: the first time one of their
+        coefficients (or one of a coarser level) is accessed, in `pyr_coeffs` or `pyr_size`.
+        Otherwise, they're all built now. Can't be used with `store_dft`.
+    keep_image : `bool`
+        Whether to keep the image the pyramid is built from (in `image`), after it's built. It
+        isn't needed to reconstruct it, and dropping it saves memory.
+    keep_masks : `bool`
+        Whether to keep the masks of the pyramid (and those of its reconstruction) in memory once
+        they're computed, in a cache shared by all the pyramids of the same configuration (size,
+        order, etc.), so that building or reconstructing other such pyramids doesn't compute them
+        again. If False, they're computed each time they're needed, and not kept.
 
     Attributes
     ----------
-    image : `array_like`
-        The input image used to construct the pyramid.
+    image : `array_like` or None
+        The input image used to construct the pyramid, or None if it wasn't kept.
     image_size : `tuple`
-        The size of the input image.
+        The size of the input image (of each image, for a batch).
+    batch_shape : `tuple`
+        The shape of the leading (batch) dimensions of the input, empty for a single image.
     pyr_type : `str` or `None`
         Human-readable string specifying the type of pyramid. For base class, is None.
     pyr_coeffs : `dict`
         Dictionary containing the coefficients of the pyramid. Keys are `(level, band)` tuples and
-        values are 1d or 2d numpy arrays (same number of dimensions as the input image)
+        values are 1d or 2d numpy arrays (same number of dimensions as the input image), with the
+        batch dimensions first for a batch.
     pyr_size : `dict`
         Dictionary containing the sizes of the pyramid coefficients. Keys are `(level, band)`
-        tuples and values are tuples.
+        tuples and values are tuples (without the batch dimensions).
     is_complex : `bool`
         Whether the coefficients are complex- or real-valued.
+    dtype : `np.dtype`
+        The floating-point precision of the pyramid.
+    fft_backend : `str` or None
+        The backend of the FFTs.
+    num_threads : `int` or None
+        The number of threads the FFTs run on.
+    store_dft : `bool`
+        Whether the coefficients are stored in the Fourier domain.
+    pyr_coeffs_dft : `dict`
+        If `store_dft`, the dfts of the coefficients, with the same keys as `pyr_coeffs`: the
+        rfft2 of the real ones (the residuals, and the bands if `is_complex` is False) and the
+        fft2 of the complex ones, unshifted (i.e., as computed by `numpy.fft`). Empty otherwise.
+    exact_masks : `bool`
+        Whether the masks are evaluated exactly, rather than from lookup tables.
+    scale_factor : `float`
+        The ratio between the (radial) frequencies of consecutive scales.
+    keep_masks : `bool`
+        Whether the masks are kept in the cache shared by the pyramids.
 
     References
     ----------
@@ -67,20 +736,36 @@ class SteerablePyramidFreq(SteerablePyramidBase):
     .. [2] A Karasaridis and E P Simoncelli, "A Filter Design Technique for Steerable Pyramid
        Image Transforms", ICASSP, Atlanta, GA, May 1996.
     """
-    def __init__(self, image, height='auto', order=3, twidth=1, is_complex=False):
+    _batched = True
+
+    def __init__(self, image, height='auto', order=3, twidth=1, is_complex=False,
+                 dtype=np.float64, fft_backend=None, num_threads=None, store_dft=False,
+                 exact_masks=False, scale_factor=2, lazy=False, keep_image=True,
+                 keep_masks=True):
         # in the Fourier domain, there's only one choice for how do edge-handling: circular. to
         # emphasize that thisisn'ta choice, we use None here.
-        super().__init__(image=image, edge_type=None)
+        super().__init__(image=image, edge_type=None, dtype=dtype)
 
         self.pyr_type = 'SteerableFrequency'
         self.is_complex = is_complex
+        self.fft_backend = fft_backend
+        self.num_threads = num_threads
+        self.store_dft = store_dft
+        self.exact_masks = exact_masks
+        if scale_factor <= 1:
+            raise Exception("scale_factor must be greater than 1, but got %s!" % scale_factor)
+        self.scale_factor = scale_factor
+        self.keep_masks = keep_masks
+        self.pyr_coeffs_dft = {}
+        if self.store_dft:
+            self.pyr_coeffs = _DftCoeffs(self)
         # SteerablePyramidFreq doesn't have filters, they're constructed in the frequency space
         self.filters = {}
         self.order = int(order)
 
         # we can't use the base class's _set_num_scales method because the max height is calculated
         # slightly differently
-        max_ht = np.floor(np.log2(min(self.image.shape))) - 2
+        max_ht = np.floor((np.log2(min(self.image_size)) - 2) / np.log2(self.scale_factor))
         if height == 'auto' or height is None:
             self.num_scales = int(max_ht)
         elif height > max_ht:
@@ -96,106 +781,109 @@ class SteerablePyramidFreq(SteerablePyramidBase):
         if twidth <= 0:
             warnings.warn("twidth must be positive. Setting to 1.")
             twidth = 1
-        twidth = int(twidth)
-
-        dims = np.array(self.image.shape)
-        ctr = np.ceil((np.array(dims)+0.5)/2).astype(int)
-
-        (xramp, yramp) = np.meshgrid(np.linspace(-1, 1, dims[1]+1)[:-1],
-                                     np.linspace(-1, 1, dims[0]+1)[:-1])
-
-        angle = np.arctan2(yramp, xramp)
-        log_rad = np.sqrt(xramp**2 + yramp**2)
-        log_rad[ctr[0]-1, ctr[1]-1] = log_rad[ctr[0]-1, ctr[1]-2]
-        log_rad = np.log2(log_rad)
-
-        # Radial transition function (a raised cosine in log-frequency):
-        (Xrcos, Yrcos) = rcosFn(twidth, (-twidth/2.0), np.array([0, 1]))
-        Yrcos = np.sqrt(Yrcos)
-
-        YIrcos = np.sqrt(1.0 - Yrcos**2)
-        lo0mask = pointOp(log_rad, YIrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-        self._lo0mask = lo0mask
-
-        imdft = np.fft.fftshift(np.fft.fft2(self.image))
-
-        hi0mask = pointOp(log_rad, Yrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-        self._hi0mask = hi0mask
-
-        hi0dft = imdft * hi0mask.reshape(imdft.shape[0], imdft.shape[1])
-        hi0 = np.fft.ifft2(np.fft.ifftshift(hi0dft))
-
-        self.pyr_coeffs['residual_highpass'] = np.real(hi0)
-        self.pyr_size['residual_highpass'] = hi0.shape
+        self._twidth = int(twidth)
+        if self.store_dft:
+            if lazy:
+                raise Exception("A pyramid can't be both lazy and store_dft!")
+            self._build_pyr()
+            if not keep_image:
+                self.image = None
+        else:
+            self._build(lazy, keep_image)
 
-        lo0mask = lo0mask.reshape(imdft.shape[0], imdft.shape[1])
-        lodft = imdft * lo0mask
+    def _masks(self, build_masks, *args):
+        """the masks computed by `build_masks` (one of the cached mask functions) from `args`,
+        kept in its cache only if `keep_masks`
+        """
+        if self.keep_masks:
+            return build_masks(*args)
+        return build_masks.__wrapped__(*args)
 
-        self._anglemasks = []
-        self._himasks = []
-        self._lomasks = []
+    def _build_levels(self):
+        """build the pyramid of `self.image`, storing each coefficient with `_store_coeff`, and
+        yielding after each level (see `Pyramid._build`)
+        """
+        if not self.is_complex:
+            yield from self._build_real_levels()
+            return
+
+        masks = self._masks(_build_complex_masks, self.image_size, self.num_scales, self.order,
+                            self._twidth, self.dtype, self.exact_masks, self.scale_factor)
+        imdft = fft2(self.image, self.fft_backend, self.num_threads)
+        # the residuals are real: their dfts are computed from the half-spectrum of the image
+        halfdft = imdft[..., :self.image_size[1]//2 + 1]
+
+        top = {'shape': self.image_size, 'gather': None}
+        self._store_coeff('residual_highpass',
+                          _real_band_dft(halfdft, top, masks['residual_highpass']),
+                          self.image_size)
+        yield
 
         for i in range(self.num_scales):
-            Xrcos -= np.log2(2)
-
-            lutsize = 1024
-            Xcosn = np.pi * np.arange(-(2*lutsize+1), (lutsize+2)) / lutsize
+            level = masks['levels'][i]
+            # the masks broadcast over the leading dimensions of a batch of images
+            if i == 0:
+                lodft = imdft
+            else:
+                lodft = imdft[..., level['rows'][:, None], level['cols']]
+            for b in range(self.num_orientations):
+                banddft = lodft * masks['bands'][i][b]
+                # that (-1j)**order term in the beginning will be 1, -j, -1, j for order 0, 1, 2,
+                # 3, and will then loop again
+                if self.order % 4:
+                    banddft *= (-1j) ** self.order
+                self._store_coeff((i, b), banddft, level['shape'])
+            yield
+
+        level = masks['lowpass_level']
+        self._store_coeff('residual_lowpass',
+                          _real_band_dft(halfdft, level, masks['residual_lowpass']),
+                          level['shape'])
+        yield
+
+    def _reset_coeffs(self):
+        """empty the coefficients, before those of a loaded pyramid are set
+        """
+        self.pyr_coeffs_dft = {}
+        self.pyr_coeffs = _DftCoeffs(self) if self.store_dft else {}
 
-            const = (2**(2*self.order))*(factorial(self.order, exact=True)**2)/ float(self.num_orientations*factorial(2*self.order, exact=True))
+    def _store_coeff(self, key, dft, shape):
+        """store a coefficient, given its dft (the rfft2 of the real ones, the fft2 of the complex
+        ones), as is if `self.store_dft`, else in the spatial domain
+        """
+        self.pyr_size[key] = tuple(shape)
+        if self.store_dft:
+            self.pyr_coeffs_dft[key] = dft
+        elif isinstance(key, str) or not self.is_complex:
+            self.pyr_coeffs[key] = irfft2(dft, shape, self.fft_backend, self.num_threads)
+        else:
+            self.pyr_coeffs[key] = ifft2(dft, self.fft_backend, self.num_threads)
 
-            if self.is_complex:
-                # TODO clean that up and give comments
-                alfa = ((np.pi+Xcosn) % (2.0*np.pi)) - np.pi
-                Ycosn = (2.0 * np.sqrt(const) * (np.cos(Xcosn) ** self.order) *
-                         (np.abs(alfa) < np.pi/2.0).astype(int))
-            else:
-                Ycosn = np.sqrt(const) * (np.cos(Xcosn))**self.order
+    def _build_real_levels(self):
+        """build a real-valued pyramid, with real ffts (see `_build_real_masks`)
+        """
+        masks = self._masks(_build_real_masks, self.image_size, self.num_scales, self.order,
+                            self._twidth, self.dtype, self.exact_masks, self.scale_factor)
+        imdft = rfft2(self.image, self.fft_backend, self.num_threads)
 
-            log_rad_test = np.reshape(log_rad, (1, log_rad.shape[0] * log_rad.shape[1]))
-            himask = pointOp(log_rad_test, Yrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-            himask = himask.reshape((lodft.shape[0], lodft.shape[1]))
-            self._himasks.append(himask)
+        top = {'shape': self.image_size, 'gather': None}
+        self._store_coeff('residual_highpass',
+                          _real_band_dft(imdft, top, masks['residual_highpass']), self.image_size)
+        yield
 
-            anglemasks = []
+        for i in range(self.num_scales):
+            level = masks['levels'][i]
             for b in range(self.num_orientations):
-                angle_tmp = np.reshape(angle, (1, angle.shape[0] * angle.shape[1]))
-                anglemask = pointOp(angle_tmp, Ycosn, Xcosn[0]+np.pi*b/self.num_orientations,
-                                    Xcosn[1]-Xcosn[0])
-
-                anglemask = anglemask.reshape(lodft.shape[0], lodft.shape[1])
-                anglemasks.append(anglemask)
                 # that (-1j)**order term in the beginning will be 1, -j, -1, j for order 0, 1, 2,
                 # 3, and will then loop again
-                banddft = (-1j) ** self.order * lodft * anglemask * himask
-                band = np.fft.ifft2(np.fft.ifftshift(banddft))
-                if not self.is_complex:
-                    self.pyr_coeffs[(i, b)] = np.real(band.copy())
-                else:
-                    self.pyr_coeffs[(i, b)] = band.copy()
-                self.pyr_size[(i, b)] = band.shape
-
-            self._anglemasks.append(anglemasks)
-            dims = np.array(lodft.shape)
-            ctr = np.ceil((dims+0.5)/2).astype(int)
-            lodims = np.ceil((dims-0.5)/2).astype(int)
-            loctr = np.ceil((lodims+0.5)/2).astype(int)
-            lostart = ctr - loctr
-            loend = lostart + lodims
-
-            log_rad = log_rad[lostart[0]:loend[0], lostart[1]:loend[1]]
-            angle = angle[lostart[0]:loend[0], lostart[1]:loend[1]]
-            lodft = lodft[lostart[0]:loend[0], lostart[1]:loend[1]]
-            YIrcos = np.abs(np.sqrt(1.0 - Yrcos**2))
-            log_rad_tmp = np.reshape(log_rad, (1, log_rad.shape[0] * log_rad.shape[1]))
-            lomask = pointOp(log_rad_tmp, YIrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-            lomask = lomask.reshape(lodft.shape[0], lodft.shape[1])
-            self._lomasks.append(lomask)
-
-            lodft = lodft * lomask
-
-        lodft = np.fft.ifft2(np.fft.ifftshift(lodft))
-        self.pyr_coeffs['residual_lowpass'] = np.real(np.array(lodft).copy())
-        self.pyr_size['residual_lowpass'] = lodft.shape
+                banddft = _real_band_dft(imdft, level, masks['bands'][i][b], (-1j) ** self.order)
+                self._store_coeff((i, b), banddft, level['shape'])
+            yield
+
+        level = masks['levels'][-1]
+        self._store_coeff('residual_lowpass',
+                          _real_band_dft(imdft, level, masks['residual_lowpass']), level['shape'])
+        yield
 
     def recon_pyr(self, levels='all', bands='all', twidth=1):
         """Reconstruct the image, optionally using subset of pyramid coefficients.
@@ -224,150 +912,49 @@ class SteerablePyramidFreq(SteerablePyramidBase):
             twidth = 1
 
         recon_keys = self._recon_keys(levels, bands)
+        complex_dtype = np.result_type(self.dtype, np.complex64)
+
+        # the sizes of the scales, from the residual lowpass to the finest
+        sizes = tuple([self.pyr_size['residual_lowpass']] +
+                      [self.pyr_size[(i, 0)] for i in reversed(range(self.num_scales))])
+        masks = self._masks(_recon_real_masks, sizes, self.order, twidth, self.dtype,
+                            self.exact_masks, self.scale_factor)
+
+        def coeff_dft(key):
+            # the rfft2 of the coefficient or, for complex ones (if self.is_complex=True), of its
+            # real part: we only reconstruct with the real portion
+            if key in self.pyr_coeffs_dft:
+                dft = self.pyr_coeffs_dft[key]
+                return dft if isinstance(key, str) or not self.is_complex else _real_part_rfft(dft)
+            return rfft2(np.real(self.pyr_coeffs[key]), self.fft_backend, self.num_threads)
+
+        def add_contribution(contribution, keys, weights, c=1):
+            # the coefficients only contribute to the frequencies around their own, and the bands
+            # of a level to the same ones: their weighted sum is accumulated in place, and added
+            # to the output once
+            rows, coeff_rows = contribution['rows'], contribution['coeff_rows']
+            resdft = coeff_dft(keys[0])[..., coeff_rows, :]
+            resdft *= weights[0]
+            for key, weight in zip(keys[1:], weights[1:]):
+                resdft += coeff_dft(key)[..., coeff_rows, :] * weight
+            if c != 1:
+                resdft *= c
+            outdft[..., rows, :resdft.shape[-1]] += resdft
+
+        outdft = np.zeros(self.batch_shape + (self.image_size[0], self.image_size[1]//2 + 1),
+                          dtype=complex_dtype)
+        for key in ['residual_lowpass', 'residual_highpass']:
+            if key in recon_keys:
+                add_contribution(masks[key], [key], masks[key]['weights'])
 
-        # make list of dims and bounds
-        bound_list = []
-        dim_list = []
-        # we go through pyr_sizes from smallest to largest
-        for dims in sorted(self.pyr_size.values()):
-            if dims in dim_list:
-                continue
-            dim_list.append(dims)
-            dims = np.array(dims)
-            ctr = np.ceil((dims+0.5)/2).astype(int)
-            lodims = np.ceil((dims-0.5)/2).astype(int)
-            loctr = np.ceil((lodims+0.5)/2).astype(int)
-            lostart = ctr - loctr
-            loend = lostart + lodims
-            bounds = (lostart[0], lostart[1], loend[0], loend[1])
-            bound_list.append(bounds)
-        bound_list.append((0, 0, dim_list[-1][0], dim_list[-1][1]))
-        dim_list.append((dim_list[-1][0], dim_list[-1][1]))
-
-        # matlab code starts here
-        dims = np.array(self.pyr_size['residual_highpass'])
-        ctr = np.ceil((dims+0.5)/2.0).astype(int)
-
-        (xramp, yramp) = np.meshgrid((np.arange(1, dims[1]+1)-ctr[1]) / (dims[1]/2.),
-                                     (np.arange(1, dims[0]+1)-ctr[0]) / (dims[0]/2.))
-        angle = np.arctan2(yramp, xramp)
-        log_rad = np.sqrt(xramp**2 + yramp**2)
-        log_rad[ctr[0]-1, ctr[1]-1] = log_rad[ctr[0]-1, ctr[1]-2]
-        log_rad = np.log2(log_rad)
-
-        # Radial transition function (a raised cosine in log-frequency):
-        (Xrcos, Yrcos) = rcosFn(twidth, (-twidth/2.0), np.array([0, 1]))
-        Yrcos = np.sqrt(Yrcos)
-        YIrcos = np.sqrt(1.0 - Yrcos**2)
-
-        # from reconSFpyrLevs
-        lutsize = 1024
-
-        Xcosn = np.pi * np.arange(-(2*lutsize+1), (lutsize+2)) / lutsize
-
-        const = (2**(2*self.order))*(factorial(self.order, exact=True)**2) / float(self.num_orientations*factorial(2*self.order, exact=True))
-        Ycosn = np.sqrt(const) * (np.cos(Xcosn))**self.order
-
-        # lowest band
-        # initialize reconstruction
-        if 'residual_lowpass' in recon_keys:
-            nresdft = np.fft.fftshift(np.fft.fft2(self.pyr_coeffs['residual_lowpass']))
-        else:
-            nresdft = np.zeros_like(self.pyr_coeffs['residual_lowpass'])
-        resdft = np.zeros(dim_list[1]) + 0j
-
-        bounds = (0, 0, 0, 0)
-        for idx in range(len(bound_list)-2, 0, -1):
-            diff = (bound_list[idx][2]-bound_list[idx][0],
-                    bound_list[idx][3]-bound_list[idx][1])
-            bounds = (bounds[0]+bound_list[idx][0], bounds[1]+bound_list[idx][1],
-                      bounds[0]+bound_list[idx][0] + diff[0],
-                      bounds[1]+bound_list[idx][1] + diff[1])
-            Xrcos -= np.log2(2.0)
-        nlog_rad = log_rad[bounds[0]:bounds[2], bounds[1]:bounds[3]]
-
-        nlog_rad_tmp = np.reshape(nlog_rad, (1, nlog_rad.shape[0]*nlog_rad.shape[1]))
-        lomask = pointOp(nlog_rad_tmp, YIrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-        lomask = lomask.reshape(nresdft.shape[0], nresdft.shape[1])
-        lomask = lomask + 0j
-        resdft[bound_list[1][0]:bound_list[1][2],
-               bound_list[1][1]:bound_list[1][3]] = nresdft * lomask
-
-        # middle bands
-        for idx in range(1, len(bound_list)-1):
-            bounds1 = (0, 0, 0, 0)
-            bounds2 = (0, 0, 0, 0)
-            for boundIdx in range(len(bound_list) - 1, idx - 1, -1):
-                diff = (bound_list[boundIdx][2]-bound_list[boundIdx][0],
-                        bound_list[boundIdx][3]-bound_list[boundIdx][1])
-                bound2tmp = bounds2
-                bounds2 = (bounds2[0]+bound_list[boundIdx][0],
-                           bounds2[1]+bound_list[boundIdx][1],
-                           bounds2[0]+bound_list[boundIdx][0] + diff[0],
-                           bounds2[1]+bound_list[boundIdx][1] + diff[1])
-                bounds1 = bound2tmp
-            nlog_rad1 = log_rad[bounds1[0]:bounds1[2], bounds1[1]:bounds1[3]]
-            nlog_rad2 = log_rad[bounds2[0]:bounds2[2], bounds2[1]:bounds2[3]]
-            dims = dim_list[idx]
-            nangle = angle[bounds1[0]:bounds1[2], bounds1[1]:bounds1[3]]
-            YIrcos = np.abs(np.sqrt(1.0 - Yrcos**2))
-            if idx > 1:
-                Xrcos += np.log2(2.0)
-                nlog_rad2_tmp = np.reshape(nlog_rad2, (1, nlog_rad2.shape[0]*nlog_rad2.shape[1]))
-                lomask = pointOp(nlog_rad2_tmp, YIrcos, Xrcos[0],
-                                 Xrcos[1]-Xrcos[0])
-                lomask = lomask.reshape(bounds2[2]-bounds2[0],
-                                        bounds2[3]-bounds2[1])
-                lomask = lomask + 0j
-                nresdft = np.zeros(dim_list[idx]) + 0j
-                nresdft[bound_list[idx][0]:bound_list[idx][2],
-                        bound_list[idx][1]:bound_list[idx][3]] = resdft * lomask
-                resdft = nresdft.copy()
-
-            # reconSFpyrLevs
-            if idx != 0 and idx != len(bound_list)-1:
-                for b in range(self.num_orientations):
-                    nlog_rad1_tmp = np.reshape(nlog_rad1,
-                                               (1, nlog_rad1.shape[0]*nlog_rad1.shape[1]))
-                    himask = pointOp(nlog_rad1_tmp, Yrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-
-                    himask = himask.reshape(nlog_rad1.shape)
-                    nangle_tmp = np.reshape(nangle, (1, nangle.shape[0]*nangle.shape[1]))
-                    anglemask = pointOp(nangle_tmp, Ycosn,
-                                        Xcosn[0]+np.pi*b/self.num_orientations,
-                                        Xcosn[1]-Xcosn[0])
-
-                    anglemask = anglemask.reshape(nangle.shape)
-                    # either the coefficients will already be real-valued (if
-                    # self.is_complex=False) or complex (if self.is_complex=True). in the
-                    # former case, this np.real() does nothing. in the latter, we want to only
-                    # reconstruct with the real portion
-                    curLev = self.num_scales-1 - (idx-1)
-                    band = np.real(self.pyr_coeffs[(curLev, b)])
-                    if (curLev, b) in recon_keys:
-                        banddft = np.fft.fftshift(np.fft.fft2(band))
-                    else:
-                        banddft = np.zeros(band.shape)
-                    resdft += ((np.power(-1+0j, 0.5))**(self.num_orientations-1) *
-                               banddft * anglemask * himask)
-
-        # apply lo0mask
-        Xrcos += np.log2(2.0)
-        lo0mask = pointOp(log_rad, YIrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-
-        lo0mask = lo0mask.reshape(dims[0], dims[1])
-        resdft = resdft * lo0mask
-
-        # residual highpass subband
-        hi0mask = pointOp(log_rad, Yrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-
-        hi0mask = hi0mask.reshape(resdft.shape[0], resdft.shape[1])
-        if 'residual_highpass' in recon_keys:
-            hidft = np.fft.fftshift(np.fft.fft2(self.pyr_coeffs['residual_highpass']))
-        else:
-            hidft = np.zeros_like(self.pyr_coeffs['residual_highpass'])
-        resdft += hidft * hi0mask
-
-        outresdft = np.real(np.fft.ifft2(np.fft.ifftshift(resdft)))
+        for i in range(self.num_scales):
+            level = masks['levels'][i]
+            bands = [b for b in range(self.num_orientations) if (i, b) in recon_keys]
+            if bands:
+                weights = level['weights']
+                if len(bands) < self.num_orientations:
+                    weights = weights[bands]
+                add_contribution(level, [(i, b) for b in bands], weights, 1j ** self.order)
+        outresdft = irfft2(outdft, self.image_size, self.fft_backend, self.num_threads)
 
         return outresdft
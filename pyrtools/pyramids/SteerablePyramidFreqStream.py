@@ -0,0 +1,167 @@
+import collections
+import numpy as np
+from .SteerablePyramidFreq import SteerablePyramidFreq
+
+
+class SteerablePyramidFreqStream:
+    """Build the `SteerablePyramidFreq` of each frame of a video, as it streams in
+
+    The pyramid's parameters are checked, and its masks computed, once for the frame size, and
+    each frame is then transformed by the same pyramid object, so that processing a frame is just
+    its FFTs and the multiplications by the masks. The coefficients of the last `history` frames
+    are kept (in a ring buffer, the oldest being dropped as new frames come in), for processing
+    that looks at how they change over time (e.g., their phase, for phase-based motion
+    processing).
+
+    The time taken by a frame is that of its FFTs: to speed it up, run them on several threads
+    (`num_threads`), build the pyramids in single precision (`dtype=np.float32`) and, if the
+    coefficients aren't needed, use a real-valued pyramid (`is_complex=False`), which uses real
+    FFTs.
+
+    Parameters
+    ----------
+    frame_size : `tuple`
+        The size (height, width) of the frames.
+    height : 'auto' or `int`.
+        The height of the pyramids, see `SteerablePyramidFreq`.
+    order : `int`.
+        The Gaussian derivative order used for the steerable filters, see `SteerablePyramidFreq`.
+    twidth : `int`
+        The width of the transition region of the radial lowpass function, in octaves
+    is_complex : `bool`
+        Whether the pyramid coefficients should be complex or not.
+    dtype : {np.float64, np.float32}
+        Floating-point precision in which to build the pyramids and store their coefficients.
+    fft_backend : {None, 'scipy', 'pyfftw'}
+        The backend of the FFTs, see `pyrtools.tools.fft.set_fft_backend`.
+    num_threads : `int` or None
+        The number of threads the FFTs run on. If None, use the library's default, see
+        `set_num_threads`.
+    exact_masks : `bool`
+        Whether to evaluate the masks exactly, rather than from lookup tables, see
+        `SteerablePyramidFreq`.
+    scale_factor : `float`
+        The ratio between the frequencies of consecutive scales, see `SteerablePyramidFreq`.
+    history : `int`
+        The number of frames whose coefficients are kept, the current one included.
+
+    Attributes
+    ----------
+    frame_size : `tuple`
+        The size of the frames.
+    num_scales : `int`
+        The number of scales of the pyramids.
+    num_orientations : `int`
+        The number of orientations of the pyramids.
+    pyr_size : `dict`
+        The sizes of the pyramid coefficients, as in `SteerablePyramidFreq`.
+    is_complex : `bool`
+        Whether the coefficients are complex- or real-valued.
+    dtype : `np.dtype`
+        The floating-point precision of the pyramids.
+    history : `collections.deque`
+        The coefficients (`dict`s, as the `pyr_coeffs` of `SteerablePyramidFreq`) of the last
+        frames, the most recent first.
+    num_frames : `int`
+        The number of frames processed so far.
+
+    """
+    def __init__(self, frame_size, height='auto', order=3, twidth=1, is_complex=False,
+                 dtype=np.float64, fft_backend=None, num_threads=None, exact_masks=False,
+                 scale_factor=2, history=1):
+        if history < 1:
+            raise Exception("history must be at least 1, but got %s!" % history)
+        self.frame_size = tuple(frame_size)
+        if len(self.frame_size) != 2:
+            raise Exception("frame_size must be (height, width), but got %s!" % (frame_size,))
+        # the pyramid every frame goes through. Building it on a blank frame checks the
+        # parameters, and computes (and caches) the masks
+        self._pyr = SteerablePyramidFreq(np.zeros(self.frame_size), height=height, order=order,
+                                         twidth=twidth, is_complex=is_complex, dtype=dtype,
+                                         fft_backend=fft_backend, num_threads=num_threads,
+                                         exact_masks=exact_masks, scale_factor=scale_factor)
+        self._pyr.pyr_coeffs = {}
+        self.num_scales = self._pyr.num_scales
+        self.num_orientations = self._pyr.num_orientations
+        self.pyr_size = self._pyr.pyr_size
+        self.is_complex = self._pyr.is_complex
+        self.dtype = self._pyr.dtype
+        self.history = collections.deque(maxlen=int(history))
+        self.num_frames = 0
+
+    def process(self, frame):
+        """Build the pyramid of a frame
+
+        Parameters
+        ----------
+        frame : `array_like`
+            The frame, of size `frame_size`, or a batch of them (e.g., the color channels of the
+            frame), stacked along leading dimensions.
+
+        Returns
+        -------
+        pyr_coeffs : `dict`
+            The coefficients of the frame's pyramid, as the `pyr_coeffs` of `SteerablePyramidFreq`,
+            which are also added to `history`.
+
+        """
+        frame = np.asarray(frame, dtype=self.dtype)
+        if frame.ndim < 2 or frame.shape[-2:] != self.frame_size:
+            raise Exception("frames must be of size %s, but got one of shape %s!" %
+                            (self.frame_size, frame.shape))
+        pyr = self._pyr
+        pyr.image = frame
+        pyr.batch_shape = frame.shape[:-2]
+        pyr.pyr_coeffs = {}
+        pyr._build_pyr()
+        pyr_coeffs = pyr.pyr_coeffs
+        pyr.image = None
+        pyr.pyr_coeffs = {}
+        self.history.appendleft(pyr_coeffs)
+        self.num_frames += 1
+        return pyr_coeffs
+
+    def stream(self, frames):
+        """Build the pyramid of each of the frames, as they come
+
+        Parameters
+        ----------
+        frames : iterable
+            The frames (e.g., a generator reading them from a video file), see `process`.
+
+        Yields
+        ------
+        pyr_coeffs : `dict`
+            The coefficients of the pyramid of each frame, see `process`.
+
+        """
+        for frame in frames:
+            yield self.process(frame)
+
+    def recon_pyr(self, pyr_coeffs=None, levels='all', bands='all'):
+        """Reconstruct a frame from the coefficients of its pyramid
+
+        Parameters
+        ----------
+        pyr_coeffs : `dict` or None
+            The coefficients (e.g., those returned by `process`, or a processed version of them).
+            If None, use those of the last frame.
+        levels, bands :
+            The subset of the coefficients to reconstruct from, see
+            `SteerablePyramidFreq.recon_pyr`.
+
+        Returns
+        -------
+        recon : `np.array`
+            The reconstructed frame.
+
+        """
+        if pyr_coeffs is None:
+            pyr_coeffs = self.history[0]
+        pyr = self._pyr
+        pyr.pyr_coeffs = pyr_coeffs
+        pyr.batch_shape = np.shape(pyr_coeffs['residual_highpass'])[:-2]
+        try:
+            return pyr.recon_pyr(levels, bands, pyr._twidth)
+        finally:
+            pyr.pyr_coeffs = {}
@@ -33,11 +33,21 @@ class SteerablePyramidSpace(SteerablePyramidBase):
         * `'zero'` - assume values of zero outside image boundary
         * `'extend'` - reflect and invert
         * `'dont-compute'` - zero output when filter overhangs imput boundaries.
+    dtype : {np.float64, np.float32}
+        Floating-point precision in which to build the pyramid and store its coefficients. float32
+        halves memory use, at the cost of precision.
+    lazy : `bool`
+        If True, the levels are only built when they're needed: the first time one of their
+        coefficients (or one of a coarser level) is accessed, in `pyr_coeffs` or `pyr_size`.
+        Otherwise, they're all built now.
+    keep_image : `bool`
+        Whether to keep the image the pyramid is built from (in `image`), after it's built. It
+        isn't needed to reconstruct it, and dropping it saves memory.
 
     Attributes
     ----------
-    image : `array_like`
-        The input image used to construct the pyramid.
+    image : `array_like` or None
+        The input image used to construct the pyramid, or None if it wasn't kept.
     image_size : `tuple`
         The size of the input image.
     pyr_type : `str` or `None`
@@ -53,6 +63,8 @@ class SteerablePyramidSpace(SteerablePyramidBase):
     is_complex : `bool`
         Whether the coefficients are complex- or real-valued. Only `SteerablePyramidFreq` can have
         a value of True, all others must be False.
+    dtype : `np.dtype`
+        The floating-point precision of the pyramid.
 
     References
     ----------
@@ -63,8 +75,9 @@ class SteerablePyramidSpace(SteerablePyramidBase):
        Image Transforms", ICASSP, Atlanta, GA, May 1996.
     """
 
-    def __init__(self, image, height='auto', order=1, edge_type='reflect1'):
-        super().__init__(image=image, edge_type=edge_type)
+    def __init__(self, image, height='auto', order=1, edge_type='reflect1', dtype=np.float64,
+                 lazy=False, keep_image=True):
+        super().__init__(image=image, edge_type=edge_type, dtype=dtype)
 
         self.order = order
         self.num_orientations = self.order + 1
@@ -72,10 +85,16 @@ class SteerablePyramidSpace(SteerablePyramidBase):
         self.pyr_type = 'SteerableSpace'
         self._set_num_scales('lofilt', height)
 
+        self._build(lazy, keep_image)
+
+    def _build_levels(self):
+        """build the pyramid, yielding after each level (see `Pyramid._build`)
+        """
         hi0 = corrDn(image=self.image, filt=self.filters['hi0filt'], edge_type=self.edge_type)
 
         self.pyr_coeffs['residual_highpass'] = hi0
         self.pyr_size['residual_highpass'] = hi0.shape
+        yield
 
         lo = corrDn(image=self.image, filt=self.filters['lo0filt'], edge_type=self.edge_type)
         for i in range(self.num_scales):
@@ -85,13 +104,15 @@ class SteerablePyramidSpace(SteerablePyramidBase):
             for b in range(self.num_orientations):
                 filt = self.filters['bfilts'][:, b].reshape(bfiltsz, bfiltsz).T
                 band = corrDn(image=lo, filt=filt, edge_type=self.edge_type)
-                self.pyr_coeffs[(i, b)] = np.array(band)
+                self.pyr_coeffs[(i, b)] = band
                 self.pyr_size[(i, b)] = band.shape
+            yield
 
             lo = corrDn(image=lo, filt=self.filters['lofilt'], edge_type=self.edge_type, step=(2, 2))
 
         self.pyr_coeffs['residual_lowpass'] = lo
         self.pyr_size['residual_lowpass'] = lo.shape
+        yield
 
     def recon_pyr(self, order=None, edge_type=None, levels='all', bands='all'):
         """Reconstruct the image, optionally using subset of pyramid coefficients.
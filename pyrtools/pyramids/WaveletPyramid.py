@@ -1,7 +1,7 @@
 import numpy as np
 from .pyramid import Pyramid
 from .filters import parse_filter
-from .c.wrapper import corrDn, upConv
+from .c.wrapper import corrDn, upConv, sepCorrDn, sepUpConv
 
 
 class WaveletPyramid(Pyramid):
@@ -33,11 +33,21 @@ class WaveletPyramid(Pyramid):
         * `'zero'` - assume values of zero outside image boundary
         * `'extend'` - reflect and invert
         * `'dont-compute'` - zero output when filter overhangs imput boundaries.
+    dtype : {np.float64, np.float32}
+        Floating-point precision in which to build the pyramid and store its coefficients. float32
+        halves memory use, at the cost of precision.
+    lazy : `bool`
+        If True, the levels are only built when they're needed: the first time one of their
+        coefficients (or one of a coarser level) is accessed, in `pyr_coeffs` or `pyr_size`.
+        Otherwise, they're all built now.
+    keep_image : `bool`
+        Whether to keep the image the pyramid is built from (in `image`), after it's built. It
+        isn't needed to reconstruct it, and dropping it saves memory.
 
     Attributes
     ----------
-    image : `array_like`
-        The input image used to construct the pyramid.
+    image : `array_like` or None
+        The input image used to construct the pyramid, or None if it wasn't kept.
     image_size : `tuple`
         The size of the input image.
     pyr_type : `str` or `None`
@@ -53,6 +63,8 @@ class WaveletPyramid(Pyramid):
     is_complex : `bool`
         Whether the coefficients are complex- or real-valued. Only `SteerablePyramidFreq` can have
         a value of True, all others must be False.
+    dtype : `np.dtype`
+        The floating-point precision of the pyramid.
 
     References
     ----------
@@ -67,8 +79,9 @@ class WaveletPyramid(Pyramid):
        ed. John W Woods, Kluwer Academic Publishers,  Norwell, MA, 1990, pp 143--192.
     """
 
-    def __init__(self, image, height='auto', filter_name='qmf9', edge_type='reflect1'):
-        super().__init__(image=image, edge_type=edge_type)
+    def __init__(self, image, height='auto', filter_name='qmf9', edge_type='reflect1',
+                 dtype=np.float64, lazy=False, keep_image=True):
+        super().__init__(image=image, edge_type=edge_type, dtype=dtype)
         self.pyr_type = 'Wavelet'
 
         self.filters = {}
@@ -87,7 +100,7 @@ class WaveletPyramid(Pyramid):
         else:
             self.num_orientations = 3
 
-        self._build_pyr()
+        self._build(lazy, keep_image)
 
     def _modulate_flip(lo_filter):
         '''construct QMF/Wavelet highpass filter from lowpass filter
@@ -147,23 +160,24 @@ class WaveletPyramid(Pyramid):
             hihi = corrDn(image=image, filt=self.filters['hi_filter'].T, edge_type=self.edge_type, step=(1, 2), start=(0, 1))
             return lolo, (hihi, )
         else:
-            lo = corrDn(image=image, filt=self.filters['lo_filter'], edge_type=self.edge_type, step=(2, 1), start=(self.stagger, 0))
-            hi = corrDn(image=image, filt=self.filters['hi_filter'], edge_type=self.edge_type, step=(2, 1), start=(1, 0))
-            lolo = corrDn(image=lo, filt=self.filters['lo_filter'].T, edge_type=self.edge_type, step=(1, 2), start=(0, self.stagger))
-            lohi = corrDn(image=hi, filt=self.filters['lo_filter'].T, edge_type=self.edge_type, step=(1, 2), start=(0, self.stagger))
-            hilo = corrDn(image=lo, filt=self.filters['hi_filter'].T, edge_type=self.edge_type, step=(1, 2), start=(0, 1))
-            hihi = corrDn(image=hi, filt=self.filters['hi_filter'].T, edge_type=self.edge_type, step=(1, 2), start=(0, 1))
+            lo_filter, hi_filter = self.filters['lo_filter'], self.filters['hi_filter']
+            lolo = sepCorrDn(image=image, filt_y=lo_filter, filt_x=lo_filter, edge_type=self.edge_type, step=(2, 2), start=(self.stagger, self.stagger))
+            lohi = sepCorrDn(image=image, filt_y=hi_filter, filt_x=lo_filter, edge_type=self.edge_type, step=(2, 2), start=(1, self.stagger))
+            hilo = sepCorrDn(image=image, filt_y=lo_filter, filt_x=hi_filter, edge_type=self.edge_type, step=(2, 2), start=(self.stagger, 1))
+            hihi = sepCorrDn(image=image, filt_y=hi_filter, filt_x=hi_filter, edge_type=self.edge_type, step=(2, 2), start=(1, 1))
             return lolo, (lohi, hilo, hihi)
 
-    def _build_pyr(self):
+    def _build_levels(self):
         im = self.image
         for lev in range(self.num_scales):
             im, higher_bands = self._build_next(im)
             for j, band in enumerate(higher_bands):
                 self.pyr_coeffs[(lev, j)] = band
                 self.pyr_size[(lev, j)] = band.shape
+            yield
         self.pyr_coeffs['residual_lowpass'] = im
         self.pyr_size['residual_lowpass'] = im.shape
+        yield
 
 
     def _recon_prev(self, image, lev, recon_keys, output_size, lo_filter, hi_filter, edge_type,
@@ -184,25 +198,17 @@ class WaveletPyramid(Pyramid):
                 if (lev, 0) in recon_keys:
                     recon += upConv(image=self.pyr_coeffs[(lev, 0)], filt=hi_filter, edge_type=edge_type, step=(2, 1), start=(1, 0), stop=output_size)
         else:
-            lo_size = ([self.pyr_size[(lev, 1)][0], output_size[1]])
-            hi_size = ([self.pyr_size[(lev, 0)][0], output_size[1]])
-
-            tmp_recon = upConv(image=image, filt=lo_filter.T, edge_type=edge_type, step=(1, 2), start=(0, stagger), stop=lo_size)
-            recon = upConv(image=tmp_recon, filt=lo_filter, edge_type=edge_type, step=(2, 1), start=(stagger, 0), stop=output_size)
+            recon = sepUpConv(image=image, filt_y=lo_filter, filt_x=lo_filter, edge_type=edge_type, step=(2, 2), start=(stagger, stagger), stop=output_size)
 
             bands_recon_dict = {
-                0: [{'filt': lo_filter.T, 'start': (0, stagger), 'stop': hi_size},
-                    {'filt': hi_filter, 'start': (1, 0)}],
-                1: [{'filt': hi_filter.T, 'start': (0, 1), 'stop': lo_size},
-                    {'filt': lo_filter, 'start': (stagger, 0)}],
-                2: [{'filt': hi_filter.T, 'start': (0, 1), 'stop': hi_size},
-                    {'filt': hi_filter, 'start': (1, 0)}],
+                0: {'filt_y': hi_filter, 'filt_x': lo_filter, 'start': (1, stagger)},
+                1: {'filt_y': lo_filter, 'filt_x': hi_filter, 'start': (stagger, 1)},
+                2: {'filt_y': hi_filter, 'filt_x': hi_filter, 'start': (1, 1)},
             }
 
             for band in range(self.num_orientations):
                 if (lev, band) in recon_keys:
-                    tmp_recon = upConv(image=self.pyr_coeffs[(lev, band)], edge_type=edge_type, step=(1, 2), **bands_recon_dict[band][0])
-                    recon += upConv(image=tmp_recon, edge_type=edge_type, step=(2, 1), stop=output_size, **bands_recon_dict[band][1])
+                    recon += sepUpConv(image=self.pyr_coeffs[(lev, band)], edge_type=edge_type, step=(2, 2), stop=output_size, **bands_recon_dict[band])
 
         return recon
 
@@ -276,7 +282,7 @@ class WaveletPyramid(Pyramid):
         for lev in reversed(range(self.num_scales)):
             if self.num_orientations == 1:
                 if lev == 0:
-                    output_size = self.image.shape
+                    output_size = self.image_size
                 else:
                     output_size = self.pyr_size[(lev-1, 0)]
             else:
@@ -1,7 +1,10 @@
+from .pyramid import Pyramid
 from .GaussianPyramid import GaussianPyramid
 from .LaplacianPyramid import LaplacianPyramid
 from .WaveletPyramid import WaveletPyramid
 from .SteerablePyramidSpace import SteerablePyramidSpace
 from .SteerablePyramidFreq import SteerablePyramidFreq
+from .SteerablePyramidFreqStream import SteerablePyramidFreqStream
+from .PyramidStore import PyramidStore
 from .steer import steer, steer_to_harmonics_mtx
 from .pyr_utils import convert_pyr_coeffs_to_pyr, max_pyr_height
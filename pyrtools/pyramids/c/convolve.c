@@ -28,7 +28,9 @@
   STOP parameters, with values placed into RESULT array.  RESULT
   dimensions should be ceil((stop-start)/step).  TEMP should be a
   pointer to a temporary double array the size of the filter.
-  EDGES is a string specifying how to handle boundaries -- see edges.c.
+  REFLECT is the function that handles boundaries -- see edges.c.
+  BANK, if not NULL, holds the edge-handling filters precomputed by
+  internal_edge_bank, which are then used instead of calling REFLECT.
   The convolution is done in 9 sections, where the border sections use
   specially computed edge-handling filters (see edges.c). The origin 
   of the filter is assumed to be (floor(x_fdim/2), floor(y_fdim/2)).
@@ -69,10 +71,11 @@
 	}
 */
 
-int internal_reduce(image, x_dim, y_dim, filt, temp, x_fdim, y_fdim,
+int internal_reduce(image, x_dim, y_dim, filt, scratch, bank, x_fdim, y_fdim,
 		x_start, x_step, x_stop, y_start, y_step, y_stop,
-		result, edges)
-  register image_type *image, *temp;
+		result, reflect)
+  register image_type *image;
+  image_type *scratch, *bank;
   register int x_fdim, x_dim;
   register image_type *result;
   register int x_step, y_step;
@@ -80,8 +83,9 @@ int internal_reduce(image, x_dim, y_dim, filt, temp, x_fdim, y_fdim,
   int x_stop, y_stop;     
   image_type *filt; 
   int y_dim, y_fdim;
-  char *edges;
+  fptr reflect;
   { 
+  register image_type *temp;
   register double sum;
   register int filt_pos, im_pos, x_filt_stop;
   register int x_pos, filt_size = x_fdim*y_fdim;
@@ -93,11 +97,8 @@ int internal_reduce(image, x_dim, y_dim, filt, temp, x_fdim, y_fdim,
   int y_ctr_start = ((y_fdim==1)?0:1);
   int x_fmid = x_fdim/2;
   int y_fmid = y_fdim/2;
-  int base_res_pos;
-  fptr reflect = edge_function(edges);  /* look up edge-handling function */
-  int i,j;
+  int base_res_pos, n_ctr;
 
-  if (!reflect) return(-1);
 
   /*printf("x_dim=%d y_dim=%d x_fdim=%d y_fdim=%d x_start=%d x_step=%d x_stop=%d y_start=%d y_step=%d y_stop=%d edges=%s\n", x_dim, y_dim, x_fdim, y_fdim, x_start, x_step, x_stop, y_start, y_step, y_stop, edges);*/
 
@@ -127,11 +128,11 @@ int internal_reduce(image, x_dim, y_dim, filt, temp, x_fdim, y_fdim,
 	 x_pos<x_ctr_start;
 	 x_pos+=x_step, res_pos++)
       {
-      (*reflect)(filt,x_fdim,y_fdim,x_pos-1,y_pos-1,temp,REDUCE);
+      temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,x_pos-1,y_pos-1,reflect,REDUCE);
       INPROD(0,0)
       }
 
-    (*reflect)(filt,x_fdim,y_fdim,0,y_pos-1,temp,REDUCE);
+    temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,0,y_pos-1,reflect,REDUCE);
     for (;				      /* TOP EDGE */
 	 x_pos<x_ctr_stop;
 	 x_pos+=x_step, res_pos++) 
@@ -141,7 +142,7 @@ int internal_reduce(image, x_dim, y_dim, filt, temp, x_fdim, y_fdim,
 	 x_pos<x_stop;
 	 x_pos+=x_step, res_pos++) 
       {
-      (*reflect)(filt,x_fdim,y_fdim,x_pos-x_ctr_stop+1,y_pos-1,temp,REDUCE);
+      temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,x_pos-x_ctr_stop+1,y_pos-1,reflect,REDUCE);
       INPROD(x_ctr_stop,0)
       }
     } /* end TOP ROWS */   
@@ -151,27 +152,32 @@ int internal_reduce(image, x_dim, y_dim, filt, temp, x_fdim, y_fdim,
        x_pos<x_ctr_start;
        x_pos+=x_step, base_res_pos++)
     {
-    (*reflect)(filt,x_fdim,y_fdim,x_pos-1,0,temp,REDUCE);
+    temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,x_pos-1,0,reflect,REDUCE);
     for (y_pos=y_ctr_start, res_pos=base_res_pos;
 	 y_pos<y_ctr_stop;
 	 y_pos+=y_step, res_pos+=x_res_dim)
       INPROD(0,y_pos)
     }
 
-  (*reflect)(filt,x_fdim,y_fdim,0,0,temp,REDUCE);
-  for (;				      /* CENTER */
-       x_pos<x_ctr_stop;
-       x_pos+=x_step, base_res_pos++) 
+  temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,0,0,reflect,REDUCE);
+  n_ctr = (x_pos<x_ctr_stop) ? (x_ctr_stop-x_pos+x_step-1)/x_step : 0;
+  if (n_ctr > 0)			      /* CENTER, a row at a time (see simd.c) */
+    {
     for (y_pos=y_ctr_start, res_pos=base_res_pos;
 	 y_pos<y_ctr_stop;
 	 y_pos+=y_step, res_pos+=x_res_dim)
-      INPROD(x_pos,y_pos)
+      reduce_interior(image+y_pos*x_dim+x_pos,x_dim,temp,x_fdim,y_fdim,
+		      x_step,n_ctr,result+res_pos);
+    x_pos += n_ctr*x_step;
+    base_res_pos += n_ctr;
+    res_pos += n_ctr-1;			      /* as left by a column at a time */
+    }
 
   for (;				      /* RIGHT EDGE */
        x_pos<x_stop;
        x_pos+=x_step, base_res_pos++)
     {
-    (*reflect)(filt,x_fdim,y_fdim,x_pos-x_ctr_stop+1,0,temp,REDUCE);
+    temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,x_pos-x_ctr_stop+1,0,reflect,REDUCE);
     for (y_pos=y_ctr_start, res_pos=base_res_pos;
 	 y_pos<y_ctr_stop;
 	 y_pos+=y_step, res_pos+=x_res_dim)
@@ -186,11 +192,11 @@ int internal_reduce(image, x_dim, y_dim, filt, temp, x_fdim, y_fdim,
 	 x_pos<x_ctr_start;
 	 x_pos+=x_step, res_pos++)
       {
-      (*reflect)(filt,x_fdim,y_fdim,x_pos-1,y_pos-y_ctr_stop+1,temp,REDUCE);
+      temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,x_pos-1,y_pos-y_ctr_stop+1,reflect,REDUCE);
       INPROD(0,y_ctr_stop)
       }
 
-    (*reflect)(filt,x_fdim,y_fdim,0,y_pos-y_ctr_stop+1,temp,REDUCE);
+    temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,0,y_pos-y_ctr_stop+1,reflect,REDUCE);
     for (;				      /* BOTTOM EDGE */
 	 x_pos<x_ctr_stop;
 	 x_pos+=x_step, res_pos++) 
@@ -200,7 +206,7 @@ int internal_reduce(image, x_dim, y_dim, filt, temp, x_fdim, y_fdim,
 	 x_pos<x_stop;
 	 x_pos+=x_step, res_pos++) 
       {
-      (*reflect)(filt,x_fdim,y_fdim,x_pos-x_ctr_stop+1,y_pos-y_ctr_stop+1,temp,REDUCE);
+      temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,x_pos-x_ctr_stop+1,y_pos-y_ctr_stop+1,reflect,REDUCE);
       INPROD(x_ctr_stop,y_ctr_stop)
       }
     } /* end BOTTOM */
@@ -237,18 +243,21 @@ int internal_reduce(image, x_dim, y_dim, filt, temp, x_fdim, y_fdim,
       }									\
   }
 
-int internal_expand(image,filt,temp,x_fdim,y_fdim,
+int internal_expand(image,filt,scratch,bank,x_fdim,y_fdim,
 		x_start,x_step,x_stop,y_start,y_step,y_stop,
-		result,x_dim,y_dim,edges)
-  register image_type *result, *temp;
+		result,x_dim,y_dim,reflect)
+  register image_type *result;
+  image_type *scratch, *bank;
   register int x_fdim, x_dim;
   register int x_step, y_step;
   register image_type *image; 
   int x_start, y_start;
+  int x_stop, y_stop;
   image_type *filt; 
   int y_fdim, y_dim;
-  char *edges;
+  fptr reflect;
   {
+  register image_type *temp;
   register double val;
   register int filt_pos, res_pos, x_filt_stop;
   register int x_pos, filt_size = x_fdim*y_fdim;
@@ -260,10 +269,7 @@ int internal_expand(image,filt,temp,x_fdim,y_fdim,
   int x_fmid = x_fdim/2;
   int y_fmid = y_fdim/2;
   int base_im_pos, x_im_dim = (x_stop-x_start+x_step-1)/x_step;
-  fptr reflect = edge_function(edges);  /* look up edge-handling function */	 
-  int i,j;
-
-  if (!reflect) return(-1);
+  int n_ctr;
 
   /* print image and filter */
   /*for(i=0;i<x_dim*y_dim;i++)
@@ -292,11 +298,11 @@ int internal_expand(image,filt,temp,x_fdim,y_fdim,
 	 x_pos<x_ctr_start;
 	 x_pos+=x_step, im_pos++)
       {
-      (*reflect)(filt,x_fdim,y_fdim,x_pos-1,y_pos-1,temp,EXPAND);
+      temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,x_pos-1,y_pos-1,reflect,EXPAND);
       INPROD2(0,0)
       }
 
-    (*reflect)(filt,x_fdim,y_fdim,0,y_pos-1,temp,EXPAND);
+    temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,0,y_pos-1,reflect,EXPAND);
     for (;				      /* TOP EDGE */
 	 x_pos<x_ctr_stop;
 	 x_pos+=x_step, im_pos++) 
@@ -306,7 +312,7 @@ int internal_expand(image,filt,temp,x_fdim,y_fdim,
 	 x_pos<x_stop;
 	 x_pos+=x_step, im_pos++) 
       {
-      (*reflect)(filt,x_fdim,y_fdim,x_pos-x_ctr_stop+1,y_pos-1,temp,EXPAND);
+      temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,x_pos-x_ctr_stop+1,y_pos-1,reflect,EXPAND);
       INPROD2(x_ctr_stop,0)
       }
     }                                           /* end TOP ROWS */   
@@ -316,27 +322,32 @@ int internal_expand(image,filt,temp,x_fdim,y_fdim,
        x_pos<x_ctr_start;
        x_pos+=x_step, base_im_pos++)
     {
-    (*reflect)(filt,x_fdim,y_fdim,x_pos-1,0,temp,EXPAND);
+    temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,x_pos-1,0,reflect,EXPAND);
     for (y_pos=y_ctr_start, im_pos=base_im_pos;
 	 y_pos<y_ctr_stop;
 	 y_pos+=y_step, im_pos+=x_im_dim)
       INPROD2(0,y_pos)
     }
 
-  (*reflect)(filt,x_fdim,y_fdim,0,0,temp,EXPAND);
-  for (;				      /* CENTER */
-       x_pos<x_ctr_stop;
-       x_pos+=x_step, base_im_pos++) 
+  temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,0,0,reflect,EXPAND);
+  n_ctr = (x_pos<x_ctr_stop) ? (x_ctr_stop-x_pos+x_step-1)/x_step : 0;
+  if (n_ctr > 0)			      /* CENTER, a row at a time (see simd.c) */
+    {
     for (y_pos=y_ctr_start, im_pos=base_im_pos;
 	 y_pos<y_ctr_stop;
 	 y_pos+=y_step, im_pos+=x_im_dim)
-      INPROD2(x_pos,y_pos)
+      expand_interior(image+im_pos,n_ctr,x_step,temp,x_fdim,y_fdim,
+		      result+y_pos*x_dim+x_pos,x_dim);
+    x_pos += n_ctr*x_step;
+    base_im_pos += n_ctr;
+    im_pos += n_ctr-1;			      /* as left by a column at a time */
+    }
 
   for (;				      /* RIGHT EDGE */
        x_pos<x_stop;
        x_pos+=x_step, base_im_pos++)
     {
-    (*reflect)(filt,x_fdim,y_fdim,x_pos-x_ctr_stop+1,0,temp,EXPAND);
+    temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,x_pos-x_ctr_stop+1,0,reflect,EXPAND);
     for (y_pos=y_ctr_start, im_pos=base_im_pos;
 	 y_pos<y_ctr_stop;
 	 y_pos+=y_step, im_pos+=x_im_dim)
@@ -351,11 +362,11 @@ int internal_expand(image,filt,temp,x_fdim,y_fdim,
 	 x_pos<x_ctr_start;
 	 x_pos+=x_step, im_pos++)
       {
-      (*reflect)(filt,x_fdim,y_fdim,x_pos-1,y_pos-y_ctr_stop+1,temp,EXPAND);
+      temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,x_pos-1,y_pos-y_ctr_stop+1,reflect,EXPAND);
       INPROD2(0,y_ctr_stop)
       }
 
-    (*reflect)(filt,x_fdim,y_fdim,0,y_pos-y_ctr_stop+1,temp,EXPAND);
+    temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,0,y_pos-y_ctr_stop+1,reflect,EXPAND);
     for (;				      /* BOTTOM EDGE */
 	 x_pos<x_ctr_stop;
 	 x_pos+=x_step, im_pos++) 
@@ -365,7 +376,7 @@ int internal_expand(image,filt,temp,x_fdim,y_fdim,
 	 x_pos<x_stop;
 	 x_pos+=x_step, im_pos++) 
       {
-      (*reflect)(filt,x_fdim,y_fdim,x_pos-x_ctr_stop+1,y_pos-y_ctr_stop+1,temp,EXPAND);
+      temp = edge_filter(bank,filt,scratch,x_fdim,y_fdim,x_pos-x_ctr_stop+1,y_pos-y_ctr_stop+1,reflect,EXPAND);
       INPROD2(x_ctr_stop,y_ctr_stop)
       }
     } /* end BOTTOM */
@@ -373,6 +384,130 @@ int internal_expand(image,filt,temp,x_fdim,y_fdim,
   } /* end of internal_expand */
 
 
+/*
+  --------------------------------------------------------------------
+  Batched versions of internal_reduce and internal_expand.  IMAGE holds
+  N_IMAGES images of identical dimensions stored contiguously, one after
+  the other, and RESULT holds the N_IMAGES corresponding outputs, also
+  contiguously.  All images share the same filter, sampling lattice and
+  edge-handling, so the interface overhead is paid once for the whole
+  stack instead of once per image.
+
+  The work is split into blocks of rows (of the result for reduce, of
+  the input for expand), which are run on up to N_THREADS threads (see
+  parallel.c).  TEMP must have room for N_THREADS filters.  BANK holds
+  the edge-handling filters computed by internal_edge_bank for FILT,
+  EDGES and REDUCE (EXPAND), or is NULL to compute them as needed.
+
+  WARNING: like internal_expand, internal_expand_batch destructively
+  modifies the RESULT array, which should be zeroed before invocation!
+ ------------------------------------------------------------------------ */
+
+static void reduce_task(void *arg, int task, int worker)
+  {
+  CONV_JOB *job = (CONV_JOB *) arg;
+  int n = task / job->n_phase_blocks;
+  int block = job->first_block + job->block_stride*(task % job->n_phase_blocks);
+  int x_res_dim = (job->x_stop-job->x_start+job->x_step-1)/job->x_step;
+  int y_res_dim = (job->y_stop-job->y_start+job->y_step-1)/job->y_step;
+  int r0 = block*job->rows_per_block;
+  int r1 = (r0+job->rows_per_block < y_res_dim) ? r0+job->rows_per_block : y_res_dim;
+
+  if (internal_reduce(job->image + (size_t) n*job->x_dim*job->y_dim, job->x_dim, job->y_dim,
+		      job->filt, job->temp + worker*job->x_fdim*job->y_fdim, job->bank,
+		      job->x_fdim, job->y_fdim,
+		      job->x_start, job->x_step, job->x_stop,
+		      job->y_start + r0*job->y_step, job->y_step,
+		      job->y_start + (r1-1)*job->y_step + 1,
+		      job->result + ((size_t) n*y_res_dim + r0)*x_res_dim, job->reflect))
+    job->err = -1;
+  }
+
+int internal_reduce_batch(image_type *image, int n_images, int x_dim, int y_dim,
+			  image_type *filt, image_type *temp, image_type *bank,
+			  int x_fdim, int y_fdim,
+			  int x_start, int x_step, int x_stop,
+			  int y_start, int y_step, int y_stop,
+			  image_type *result, int edges, int n_threads)
+  {
+  CONV_JOB job;
+  int y_res_dim = (y_stop-y_start+y_step-1)/y_step;
+  size_t res_size = (size_t) ((x_stop-x_start+x_step-1)/x_step) * y_res_dim;
+  fptr reflect = edge_function_id(edges);
+
+  if (!reflect) return(-1);
+  n_threads = parallel_threads(n_images, res_size, x_fdim*y_fdim, n_threads);
+
+  job.image = image;  job.filt = filt;  job.temp = temp;  job.result = result;
+  job.bank = bank;
+  job.n_images = n_images;  job.x_dim = x_dim;  job.y_dim = y_dim;
+  job.x_fdim = x_fdim;  job.y_fdim = y_fdim;
+  job.x_start = x_start;  job.x_step = x_step;  job.x_stop = x_stop;
+  job.y_start = y_start;  job.y_step = y_step;  job.y_stop = y_stop;
+  job.reflect = reflect;  job.err = 0;
+  job.rows_per_block = row_block_size(n_images, y_res_dim, 1, n_threads);
+  job.n_blocks = (y_res_dim + job.rows_per_block - 1) / job.rows_per_block;
+  job.first_block = 0;  job.block_stride = 1;  job.n_phase_blocks = job.n_blocks;
+
+  if (job.n_blocks > 0)
+    run_parallel(reduce_task, &job, n_images*job.n_blocks, n_threads);
+  return(job.err);
+  } /* end of internal_reduce_batch */
+
+static void expand_task(void *arg, int task, int worker)
+  {
+  CONV_JOB *job = (CONV_JOB *) arg;
+  int n = task / job->n_phase_blocks;
+  int block = job->first_block + job->block_stride*(task % job->n_phase_blocks);
+  int x_im_dim = (job->x_stop-job->x_start+job->x_step-1)/job->x_step;
+  int y_im_dim = (job->y_stop-job->y_start+job->y_step-1)/job->y_step;
+  int r0 = block*job->rows_per_block;
+  int r1 = (r0+job->rows_per_block < y_im_dim) ? r0+job->rows_per_block : y_im_dim;
+
+  if (internal_expand(job->image + ((size_t) n*y_im_dim + r0)*x_im_dim,
+		      job->filt, job->temp + worker*job->x_fdim*job->y_fdim, job->bank,
+		      job->x_fdim, job->y_fdim,
+		      job->x_start, job->x_step, job->x_stop,
+		      job->y_start + r0*job->y_step, job->y_step,
+		      job->y_start + (r1-1)*job->y_step + 1,
+		      job->result + (size_t) n*job->x_dim*job->y_dim,
+		      job->x_dim, job->y_dim, job->reflect))
+    job->err = -1;
+  }
+
+int internal_expand_batch(image_type *image, int n_images,
+			  image_type *filt, image_type *temp, image_type *bank,
+			  int x_fdim, int y_fdim,
+			  int x_start, int x_step, int x_stop,
+			  int y_start, int y_step, int y_stop,
+			  image_type *result, int x_dim, int y_dim, int edges,
+			  int n_threads)
+  {
+  CONV_JOB job;
+  int y_im_dim = (y_stop-y_start+y_step-1)/y_step;
+  size_t im_size = (size_t) ((x_stop-x_start+x_step-1)/x_step) * y_im_dim;
+  fptr reflect = edge_function_id(edges);
+
+  if (!reflect) return(-1);
+  n_threads = parallel_threads(n_images, im_size, x_fdim*y_fdim, n_threads);
+
+  job.image = image;  job.filt = filt;  job.temp = temp;  job.result = result;
+  job.bank = bank;
+  job.n_images = n_images;  job.x_dim = x_dim;  job.y_dim = y_dim;
+  job.x_fdim = x_fdim;  job.y_fdim = y_fdim;
+  job.x_start = x_start;  job.x_step = x_step;  job.x_stop = x_stop;
+  job.y_start = y_start;  job.y_step = y_step;  job.y_stop = y_stop;
+  job.reflect = reflect;  job.err = 0;
+  job.rows_per_block = row_block_size(n_images, y_im_dim, (3*y_fdim+y_step-1)/y_step,
+				      n_threads);
+  job.n_blocks = (y_im_dim + job.rows_per_block - 1) / job.rows_per_block;
+
+  if (job.n_blocks > 0)
+    run_expand_phases(expand_task, &job, 0, n_threads);
+  return(job.err);
+  } /* end of internal_expand_batch */
+
+
 /* Local Variables: */
 /* buffer-read-only: t */
 /* End: */
@@ -11,6 +11,9 @@
 ;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
 */
 
+#ifndef CONVOLVE_H
+#define CONVOLVE_H
+
 #include <stdio.h>
 #include <stdlib.h> 
 
@@ -31,19 +34,66 @@ typedef struct
   fptr func;
   } EDGE_HANDLER;
 
+/* Defining SINGLE_PRECISION gives float versions of the convolution
+   routines, whose names get a _float suffix (see convolve_float.c). */
+#ifdef SINGLE_PRECISION
+typedef float image_type;
+#define edge_function edge_function_float
+#define edge_function_id edge_function_id_float
+#define edge_filter edge_filter_float
+#define internal_edge_bank internal_edge_bank_float
+#define reduce_interior reduce_interior_float
+#define expand_interior expand_interior_float
+#define internal_reduce internal_reduce_float
+#define internal_expand internal_expand_float
+#define internal_wrap_reduce internal_wrap_reduce_float
+#define internal_wrap_expand internal_wrap_expand_float
+#define internal_reduce_batch internal_reduce_batch_float
+#define internal_expand_batch internal_expand_batch_float
+#define internal_wrap_reduce_batch internal_wrap_reduce_batch_float
+#define internal_wrap_expand_batch internal_wrap_expand_batch_float
+#define internal_sep_reduce_batch internal_sep_reduce_batch_float
+#define internal_sep_expand_batch internal_sep_expand_batch_float
+#define internal_pointop internal_pointop_float
+#else
 typedef double image_type;
+#endif
+
+/* The batch routines below take the edge-handler as an integer id: its
+   index in the table of edges.c, or EDGES_CIRCULAR (separable routines
+   only), so that callers don't need to pass strings around. */
+#define EDGES_CIRCULAR -1
 
 fptr edge_function(char *edges);
+fptr edge_function_id(int id);
+int internal_edge_bank(image_type *filt, int x_fdim, int y_fdim, int edges, int r_or_e,
+		       image_type *bank);
+image_type *edge_filter(image_type *bank, image_type *filt, image_type *scratch,
+			int x_fdim, int y_fdim, int x_pos, int y_pos, fptr reflect, int r_or_e);
+/* Instruction sets of the interior kernels (see simd.c). */
+#define SIMD_NONE 0
+#define SIMD_AVX2 1
+
+int internal_simd_level(int level);
+int simd_kernels();
+void reduce_interior(image_type *image, int x_dim,
+		     image_type *filt, int x_fdim, int y_fdim,
+		     int x_step, int n, image_type *result);
+void expand_interior(image_type *image, int n, int x_step,
+		     image_type *filt, int x_fdim, int y_fdim,
+		     image_type *result, int x_dim);
 int internal_reduce(image_type *image, int x_idim, int y_idim, 
-		    image_type *filt, image_type *temp, int x_fdim, int y_fdim,
+		    image_type *filt, image_type *scratch, image_type *bank,
+		    int x_fdim, int y_fdim,
 		    int x_start, int x_step, int x_stop, 
 		    int y_start, int y_step, int y_stop,
-		    image_type *result, char *edges);
+		    image_type *result, fptr reflect);
 int internal_expand(image_type *image, 
-		    image_type *filt, image_type *temp, int x_fdim, int y_fdim,
+		    image_type *filt, image_type *scratch, image_type *bank,
+		    int x_fdim, int y_fdim,
 		    int x_start, int x_step, int x_stop, 
 		    int y_start, int y_step, int y_stop,
-		    image_type *result, int x_rdim, int y_rdim, char *edges);
+		    image_type *result, int x_rdim, int y_rdim, fptr reflect);
 int internal_wrap_reduce(image_type *image, int x_idim, int y_idim, 
 			 image_type *filt, int x_fdim, int y_fdim,
 			 int x_start, int x_step, int x_stop, 
@@ -53,3 +103,70 @@ int internal_wrap_expand(image_type *image, image_type *filt, int x_fdim, int y_
 			 int x_start, int x_step, int x_stop, 
 			 int y_start, int y_step, int y_stop,
 			 image_type *result, int x_rdim, int y_rdim);
+
+/* Arguments of a (possibly multithreaded) batch of convolutions. Each of the
+   N_IMAGES images is split into N_BLOCKS blocks of ROWS_PER_BLOCK rows of the
+   image that is iterated over (the result for reduce, the input for expand).
+   Task t handles block FIRST_BLOCK + BLOCK_STRIDE*(t % N_PHASE_BLOCKS) of
+   image t / N_PHASE_BLOCKS.  REFLECT is the edge-handling function (NULL for
+   circular boundaries), and BANK the precomputed edge-handling filters, if
+   any (see internal_edge_bank in edges.c).  PLANS holds the sampling plans of separable
+   convolutions (see separable.c). */
+typedef struct
+  {
+  image_type *image, *filt, *temp, *bank, *result;
+  int n_images, x_dim, y_dim, x_fdim, y_fdim;
+  int x_start, x_step, x_stop, y_start, y_step, y_stop;
+  int rows_per_block, n_blocks;
+  int first_block, block_stride, n_phase_blocks;
+  fptr reflect;
+  void *plans;
+  int err;
+  } CONV_JOB;
+
+typedef void (*task_fptr)(void *arg, int task, int worker);
+
+int run_parallel(task_fptr task, void *arg, int n_tasks, int n_threads);
+int parallel_threads(int n_images, size_t res_size, int filt_size, int n_threads);
+int row_block_size(int n_images, int dim, int min_rows, int n_threads);
+int run_expand_phases(task_fptr task, CONV_JOB *job, int wrap, int n_threads);
+
+int internal_reduce_batch(image_type *image, int n_images, int x_idim, int y_idim,
+			  image_type *filt, image_type *temp, image_type *bank,
+			  int x_fdim, int y_fdim,
+			  int x_start, int x_step, int x_stop,
+			  int y_start, int y_step, int y_stop,
+			  image_type *result, int edges, int n_threads);
+int internal_expand_batch(image_type *image, int n_images,
+			  image_type *filt, image_type *temp, image_type *bank,
+			  int x_fdim, int y_fdim,
+			  int x_start, int x_step, int x_stop,
+			  int y_start, int y_step, int y_stop,
+			  image_type *result, int x_rdim, int y_rdim, int edges,
+			  int n_threads);
+int internal_wrap_reduce_batch(image_type *image, int n_images, int x_idim, int y_idim,
+			       image_type *filt, int x_fdim, int y_fdim,
+			       int x_start, int x_step, int x_stop,
+			       int y_start, int y_step, int y_stop,
+			       image_type *result, int n_threads);
+int internal_wrap_expand_batch(image_type *image, int n_images,
+			       image_type *filt, int x_fdim, int y_fdim,
+			       int x_start, int x_step, int x_stop,
+			       int y_start, int y_step, int y_stop,
+			       image_type *result, int x_rdim, int y_rdim,
+			       int n_threads);
+int internal_sep_reduce_batch(image_type *image, int n_images, int x_idim, int y_idim,
+			      image_type *x_filt, int x_fdim, image_type *y_filt, int y_fdim,
+			      image_type *temp,
+			      int x_start, int x_step, int x_stop,
+			      int y_start, int y_step, int y_stop,
+			      image_type *result, int edges, int n_threads);
+int internal_sep_expand_batch(image_type *image, int n_images,
+			      image_type *x_filt, int x_fdim, image_type *y_filt, int y_fdim,
+			      image_type *temp,
+			      int x_start, int x_step, int x_stop,
+			      int y_start, int y_step, int y_stop,
+			      image_type *result, int x_rdim, int y_rdim, int edges,
+			      int n_threads);
+
+#endif /* CONVOLVE_H */
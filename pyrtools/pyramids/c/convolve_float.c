@@ -0,0 +1,24 @@
+/*
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+;;;  File: convolve_float.c
+;;;  Description: Single-precision versions of the routines in edges.c,
+;;;               convolve.c, wrap.c, separable.c, simd.c and
+;;;               internal_pointOp.c, for float images and filters.
+;;;               Exported names get a _float suffix (see convolve.h).
+;;;               Inner products are still accumulated in double.
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+*/
+
+#define SINGLE_PRECISION
+
+#include "edges.c"
+#include "convolve.c"
+
+/* wrap.c has its own inner product macros */
+#undef INPROD
+#undef INPROD2
+#include "wrap.c"
+
+#include "separable.c"
+#include "simd.c"
+#include "internal_pointOp.c"
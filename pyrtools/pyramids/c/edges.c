@@ -40,8 +40,14 @@ below.
 #define sgn(a)  ( ((a)>0)?1:(((a)<0)?-1:0) )
 #define clip(a,mn,mx)  ( ((a)<(mn))?(mn):(((a)>=(mx))?(mx-1):(a)) )
 
-int reflect1(), reflect2(), qreflect2(), repeat(), zero(), Extend(), nocompute();
-int ereflect(), predict();
+static int reflect1(), reflect2(), qreflect2(), repeat(), zero(), Extend(), nocompute();
+static int ereflect();
+
+/* predict() isn't in the table below, so it's kept external */
+#ifdef SINGLE_PRECISION
+#define predict predict_float
+#endif
+int predict();
 
 /* Lookup table matching a descriptive string to the edge-handling function */
 #if !THINK_C
@@ -92,6 +98,9 @@ int ereflect(), predict();
 	}
 #endif
 
+/* the number of edge handlers in the structure above */
+#define N_EDGE_HANDLERS ((int) (sizeof(edge_foos)/sizeof(EDGE_HANDLER)))
+
 /*
 Function looks up an edge handler id string in the structure above, and
 returns the associated function 
@@ -103,11 +112,11 @@ fptr edge_function(char *edges)
 #if THINK_C
   InitializeTable(edge_foos);
 #endif
-  for (i = 0; i<sizeof(edge_foos)/sizeof(EDGE_HANDLER); i++)
+  for (i = 0; i<N_EDGE_HANDLERS; i++)
     if (strcmp(edges,edge_foos[i].name) IS 0)
       return(edge_foos[i].func);
   printf("Error: '%s' is not the name of a valid edge-handler!\n",edges);
-  for (i=0; i<sizeof(edge_foos)/sizeof(EDGE_HANDLER); i++)
+  for (i=0; i<N_EDGE_HANDLERS; i++)
       {
       if (i IS 0) printf("  Options are: ");
       else printf(", ");
@@ -117,6 +126,64 @@ fptr edge_function(char *edges)
   return(0);
   }
 
+/*
+Function returns the edge handler at index ID of the structure above (e.g.
+0 for "dont-compute", 3 for "reflect1").  Used by the batch routines, so
+that the string lookup isn't repeated on every call.
+*/
+fptr edge_function_id(int id)
+  {
+#if THINK_C
+  InitializeTable(edge_foos);
+#endif
+  if ((id < 0) OR (id >= N_EDGE_HANDLERS))
+    {
+    printf("Error: %d is not the id of a valid edge-handler!\n",id);
+    return(0);
+    }
+  return(edge_foos[id].func);
+  }
+
+/*
+Function computes all the edge-handling filters that internal_reduce
+(R_OR_E = REDUCE) or internal_expand (EXPAND) can use with FILT and the
+edge handler with id EDGES, so that they can be reused across calls.  The
+filter for position (x_pos, y_pos) (see below) is stored at index
+(y_pos+y_fdim/2+1)*(x_fdim+2) + (x_pos+x_fdim/2+1) of BANK, for
+-(fdim/2+1) <= pos <= fdim-fdim/2 along each axis: BANK must have room
+for (x_fdim+2)*(y_fdim+2) filters.
+*/
+int internal_edge_bank(image_type *filt, int x_fdim, int y_fdim, int edges, int r_or_e,
+		       image_type *bank)
+  {
+  fptr reflect = edge_function_id(edges);
+  int x_pos, y_pos;
+
+  if (!reflect) return(-1);
+  for (y_pos=-(y_fdim/2+1); y_pos<=y_fdim-y_fdim/2; y_pos++)
+    for (x_pos=-(x_fdim/2+1); x_pos<=x_fdim-x_fdim/2; x_pos++, bank+=x_fdim*y_fdim)
+      (*reflect)(filt,x_fdim,y_fdim,x_pos,y_pos,bank,r_or_e);
+  return(0);
+  }
+
+/*
+Function returns the edge-handling filter for position (x_pos, y_pos):
+from BANK (see internal_edge_bank) if it is there, otherwise computed
+into SCRATCH by REFLECT.
+*/
+image_type *edge_filter(image_type *bank, image_type *filt, image_type *scratch,
+			int x_fdim, int y_fdim, int x_pos, int y_pos, fptr reflect, int r_or_e)
+  {
+  int x_index = x_pos + x_fdim/2 + 1;
+  int y_index = y_pos + y_fdim/2 + 1;
+
+  if ((bank ISNT NULL) AND (x_index >= 0) AND (x_index < x_fdim+2)
+      AND (y_index >= 0) AND (y_index < y_fdim+2))
+    return(bank + ((size_t) y_index*(x_fdim+2) + x_index)*x_fdim*y_fdim);
+  (*reflect)(filt,x_fdim,y_fdim,x_pos,y_pos,scratch,r_or_e);
+  return(scratch);
+  }
+
 /* 
 ---------------- EDGE HANDLER ARGUMENTS ------------------------
 filt - array of filter taps.
@@ -139,7 +206,7 @@ nocompute() - Return zero for values where filter hangs over the edge.
 */
 
 int nocompute(filt,x_dim,y_dim,x_pos,y_pos,result,r_or_e)
-  register double *filt, *result;
+  register image_type *filt, *result;
   register int x_dim;
   int y_dim, x_pos, y_pos, r_or_e;
   {
@@ -158,7 +225,7 @@ int nocompute(filt,x_dim,y_dim,x_pos,y_pos,result,r_or_e)
 zero() - Zero outside of image.  Discontinuous, but adds zero energy. */
 
 int zero(filt,x_dim,y_dim,x_pos,y_pos,result,r_or_e)
-  register double *filt, *result;
+  register image_type *filt, *result;
   register int x_dim;
   int y_dim, x_pos, y_pos, r_or_e;
   {
@@ -191,7 +258,7 @@ remain even, odd ones remain odd).
 */	 
 
 int reflect1(filt,x_dim,y_dim,x_pos,y_pos,result,r_or_e)
-  register double *filt, *result;
+  register image_type *filt, *result;
   register int x_dim;
   int y_dim, x_pos, y_pos, r_or_e;
   {
@@ -260,7 +327,7 @@ derivative.
 */
 
 int reflect2(filt,x_dim,y_dim,x_pos,y_pos,result,r_or_e)
-  register double *filt, *result;
+  register image_type *filt, *result;
   register int x_dim;
   int y_dim, x_pos, y_pos, r_or_e;
   {
@@ -335,7 +402,7 @@ even-length QMF filters.
 */
 
 int qreflect2(filt,x_dim,y_dim,x_pos,y_pos,result,r_or_e)
-  double *filt, *result;
+  image_type *filt, *result;
   int x_dim, y_dim, x_pos, y_pos, r_or_e;
   {
   reflect2(filt,x_dim,y_dim,x_pos,y_pos,result,0);
@@ -348,7 +415,7 @@ derivative.
 */
 
 int repeat(filt,x_dim,y_dim,x_pos,y_pos,result,r_or_e)
-  register double *filt, *result;
+  register image_type *filt, *result;
   register int x_dim;
   int y_dim, x_pos, y_pos, r_or_e;
   {
@@ -419,7 +486,7 @@ not higher derivs).
 */
 
 int Extend(filt,x_dim,y_dim,x_pos,y_pos,result,r_or_e)
-  register double *filt, *result;
+  register image_type *filt, *result;
   register int x_dim;
   int y_dim, x_pos, y_pos, r_or_e;
   {
@@ -539,7 +606,7 @@ by the reciprocal of the percentage of filter being used.  (i.e. if
 taps being used by 2).  */
 
 int predict(filt,x_dim,y_dim,x_pos,y_pos,result,r_or_e)
-  register double *filt, *result;
+  register image_type *filt, *result;
   register int x_dim;
   int y_dim, x_pos, y_pos, r_or_e;
   {
@@ -584,7 +651,7 @@ QMF filters, but it is not useful for most applications, since it
 alters the DC level.  */
 
 int ereflect(filt,x_dim,y_dim,x_pos,y_pos,result,r_or_e)
-  register double *filt, *result;
+  register image_type *filt, *result;
   register int x_dim;
   int y_dim, x_pos, y_pos, r_or_e;
   {
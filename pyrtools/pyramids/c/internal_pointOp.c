@@ -1,54 +1,169 @@
 #include <stdio.h>
 #include <math.h>
+#include "convolve.h"
+#include "internal_pointOp.h"
+
+#if (defined(__GNUC__) || defined(__clang__)) && (defined(__x86_64__) || defined(__i386__))
+#define HAVE_AVX2
+#include <immintrin.h>
+#endif
+
 /* Use linear interpolation on a lookup table.
    Taken from OBVIUS.  EPS, Spring, 1987.
  */
-void internal_pointop (im, res, size, lut, lutsize, origin, increment, warnings)
-  register double *im, *res, *lut;
-  register double origin, increment; 
-  register int size, lutsize, warnings;
+
+/* Rough cost of a lookup, in multiply-adds (see parallel_threads). */
+#define POINTOP_COST 8
+
+#define LEFT_EXTRAPOLATED 1
+#define RIGHT_EXTRAPOLATED 2
+
+/* Look up SIZE samples of IM, whose position in LUT is (im - ORIGIN) /
+   INCREMENT, putting the interpolated values in RES.  LUTSIZE is the
+   maximum index that can be interpolated from (the size of LUT minus
+   2).  Returns which way, if any, LUT had to be extrapolated. */
+static int pointop_scalar(image_type *im, image_type *res, int size, double *lut,
+			  int lutsize, double origin, double increment)
   {
   register int i, index;
-  register double pos;
-  register int l_unwarned = warnings;
-  register int r_unwarned = warnings;
+  register double pos, val;
+  int extrapolated = 0;
+
+  for (i=0; i<size; i++)
+    {
+    pos = (im[i] - origin) / increment;
+    index = (int) pos;   /* Floor */
+    if (index < 0)
+      {
+      index = 0;
+      extrapolated |= LEFT_EXTRAPOLATED;
+      }
+    else if (index > lutsize)
+      {
+      index = lutsize;
+      extrapolated |= RIGHT_EXTRAPOLATED;
+      }
+    val = lut[index] + (lut[index+1] - lut[index]) * (pos - index);
+    res[i] = val;
+    if(isnan(val))
+      printf("**NAN: lut[%d]=%f lut[%d]=%f pos=%f index=%d\n", index,
+	     lut[index], index+1, lut[index+1], pos, index);
+    }
+  return(extrapolated);
+  }
 
-  lutsize = lutsize - 2;	/* Maximum index value */
+#ifdef HAVE_AVX2
+/* Same as pointop_scalar, 4 samples at a time, with the same operations
+   in the same order (so the results are identical). */
+__attribute__((target("avx2")))
+static int pointop_avx2(image_type *im, image_type *res, int size, double *lut,
+			int lutsize, double origin, double increment)
+  {
+  __m256d origin4 = _mm256_set1_pd(origin), increment4 = _mm256_set1_pd(increment);
+  __m256d pos, lo, hi, val;
+  __m128i index, zero = _mm_setzero_si128(), max_index = _mm_set1_epi32(lutsize);
+  int i, extrapolated = 0;
+
+  for (i=0; i+4<=size; i+=4)
+    {
+#ifdef SINGLE_PRECISION
+    pos = _mm256_div_pd(_mm256_sub_pd(_mm256_cvtps_pd(_mm_loadu_ps(im+i)), origin4), increment4);
+#else
+    pos = _mm256_div_pd(_mm256_sub_pd(_mm256_loadu_pd(im+i), origin4), increment4);
+#endif
+    index = _mm256_cvttpd_epi32(pos);
+    if (_mm_movemask_epi8(_mm_cmpgt_epi32(zero, index)))
+      extrapolated |= LEFT_EXTRAPOLATED;
+    if (_mm_movemask_epi8(_mm_cmpgt_epi32(index, max_index)))
+      extrapolated |= RIGHT_EXTRAPOLATED;
+    index = _mm_min_epi32(_mm_max_epi32(index, zero), max_index);
+    lo = _mm256_i32gather_pd(lut, index, sizeof(double));
+    hi = _mm256_i32gather_pd(lut+1, index, sizeof(double));
+    val = _mm256_add_pd(lo, _mm256_mul_pd(_mm256_sub_pd(hi, lo),
+					   _mm256_sub_pd(pos, _mm256_cvtepi32_pd(index))));
+    if (_mm256_movemask_pd(_mm256_cmp_pd(val, val, _CMP_UNORD_Q)))
+      {
+      /* redo these 4 the slow way, for the message */
+      pointop_scalar(im+i, res+i, 4, lut, lutsize, origin, increment);
+      continue;
+      }
+#ifdef SINGLE_PRECISION
+    _mm_storeu_ps(res+i, _mm256_cvtpd_ps(val));
+#else
+    _mm256_storeu_pd(res+i, val);
+#endif
+    }
+  return(extrapolated | pointop_scalar(im+i, res+i, size-i, lut, lutsize, origin, increment));
+  }
+#endif
+
+typedef struct
+  {
+  image_type *im, *res;
+  double *lut, origin, increment;
+  int size, lutsize, chunk;
+  int *extrapolated;
+  } POINTOP_JOB;
+
+static void pointop_task(void *arg, int task, int worker)
+  {
+  POINTOP_JOB *job = (POINTOP_JOB *) arg;
+  int start = task*job->chunk;
+  int size = (start+job->chunk < job->size) ? job->chunk : job->size-start;
+
+#ifdef HAVE_AVX2
+  if (simd_kernels() IS SIMD_AVX2)
+    {
+    job->extrapolated[worker] |= pointop_avx2(job->im+start, job->res+start, size, job->lut,
+					      job->lutsize, job->origin, job->increment);
+    return;
+    }
+#endif
+  job->extrapolated[worker] |= pointop_scalar(job->im+start, job->res+start, size, job->lut,
+					      job->lutsize, job->origin, job->increment);
+  }
+
+/* Interpolate the SIZE samples of IM in the lookup table LUT (LUTSIZE
+   samples of a function, at ORIGIN, ORIGIN+INCREMENT, ...), putting
+   the results in RES.  Points beyond either end of the table are
+   linearly extrapolated from its first (last) two samples, with a
+   warning if WARNINGS is set.  The work is split over up to N_THREADS
+   threads. */
+void internal_pointop (im, res, size, lut, lutsize, origin, increment, warnings, n_threads)
+  image_type *im, *res;
+  double *lut;
+  double origin, increment;
+  int size, lutsize, warnings, n_threads;
+  {
+  POINTOP_JOB job;
+  int extrapolated[MAX_POINTOP_THREADS];
+  int i, n_tasks, n_workers;
 
   /* printf("size=%d origin=%f lutsize=%d increment=%f\n",size, origin, lutsize,
      increment); */
 
-  if (increment > 0)
+  if (increment <= 0)
+    {
     for (i=0; i<size; i++)
-      {
-	pos = (im[i] - origin) / increment;
-	index = (int) pos;   /* Floor */
-	if (index < 0)
-	  {
-	    index = 0;
-	    if (l_unwarned)
-	      {
-		printf("Warning: Extrapolating to left of lookup table...\n");
-		l_unwarned = 0;
-	      }
-	  }
-	else if (index > lutsize)
-	  {
-	    index = lutsize;
-	    if (r_unwarned)
-	      {
-		printf("Warning: Extrapolating to right of lookup table...\n");
-		r_unwarned = 0;
-	      }
-	  }
-	res[i] = lut[index] + (lut[index+1] - lut[index]) * (pos - index);
-	if(isnan(res[i]))
-	  printf("**NAN: lut[%d]=%f lut[%d]=%f pos=%f index=%d\n", index, 
-		 lut[index], index+1, lut[index+1], pos, index);
-      }
-  else
-    for (i=0; i<size; i++){
       res[i] = *lut;
-      /*printf("res[%d]=%f\n", i, res[i]);*/
+    return;
     }
+
+  n_workers = parallel_threads(1, size, POINTOP_COST, n_threads);
+  if (n_workers > MAX_POINTOP_THREADS) n_workers = MAX_POINTOP_THREADS;
+  for (i=0; i<n_workers; i++) extrapolated[i] = 0;
+  job.im = im; job.res = res; job.lut = lut;
+  job.origin = origin; job.increment = increment;
+  job.size = size;
+  job.lutsize = lutsize - 2;	/* Maximum index value */
+  job.chunk = (size + n_workers - 1) / n_workers;
+  job.extrapolated = extrapolated;
+  n_tasks = (job.chunk > 0) ? (size + job.chunk - 1) / job.chunk : 0;
+  run_parallel(pointop_task, &job, n_tasks, n_workers);
+
+  for (i=1; i<n_workers; i++) extrapolated[0] |= extrapolated[i];
+  if (warnings AND (extrapolated[0] & LEFT_EXTRAPOLATED))
+    printf("Warning: Extrapolating to left of lookup table...\n");
+  if (warnings AND (extrapolated[0] & RIGHT_EXTRAPOLATED))
+    printf("Warning: Extrapolating to right of lookup table...\n");
   }
@@ -1,3 +1,13 @@
-void internal_pointop(double *im, double *res, int size, double *lut, 
+#ifndef INTERNAL_POINTOP_H
+#define INTERNAL_POINTOP_H
+
+#include "convolve.h"
+
+/* Most threads internal_pointop splits its work over. */
+#define MAX_POINTOP_THREADS 64
+
+void internal_pointop(image_type *im, image_type *res, int size, double *lut, 
 		      int lutsize, double origin, double increment, 
-		      int warnings);
+		      int warnings, int n_threads);
+
+#endif /* INTERNAL_POINTOP_H */
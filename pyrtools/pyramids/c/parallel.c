@@ -0,0 +1,198 @@
+/*
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+;;;  File: parallel.c
+;;;  Description: Minimal thread pool used to split the convolution
+;;;               routines in convolve.c and wrap.c into independent
+;;;               row-blocks.
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+*/
+
+#include <stdlib.h>
+#include "convolve.h"
+
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <pthread.h>
+#endif
+
+/* Below this many multiply-adds, starting threads costs more than it saves. */
+#define PARALLEL_MIN_WORK 262144
+
+typedef struct
+  {
+  task_fptr task;
+  void *arg;
+  int first, n_tasks, stride;
+  } WORKER;
+
+static void run_worker(WORKER *w)
+  {
+  int t;
+
+  for (t=w->first; t<w->n_tasks; t+=w->stride)
+    (*w->task)(w->arg, t, w->first);
+  }
+
+#ifdef _WIN32
+static DWORD WINAPI worker_main(LPVOID w)
+  {
+  run_worker((WORKER *) w);
+  return(0);
+  }
+#else
+static void *worker_main(void *w)
+  {
+  run_worker((WORKER *) w);
+  return(NULL);
+  }
+#endif
+
+/*
+  --------------------------------------------------------------------
+  Run TASK(ARG, t, w) for every t in [0, N_TASKS), spread over at most
+  N_THREADS threads.  Worker w runs tasks w, w+n, w+2n, ... where n is
+  the number of workers actually used, so that w can be used to index
+  per-thread scratch space.  The calling thread acts as worker 0.  If a
+  thread can't be started, its tasks are run by the calling thread.
+ ------------------------------------------------------------------------ */
+int run_parallel(task_fptr task, void *arg, int n_tasks, int n_threads)
+  {
+  WORKER *workers;
+  int w, n_workers = (n_threads < n_tasks) ? n_threads : n_tasks;
+#ifdef _WIN32
+  HANDLE *threads;
+#else
+  pthread_t *threads;
+  int *started;
+#endif
+
+  if (n_workers <= 1)
+    {
+    for (w=0; w<n_tasks; w++) (*task)(arg, w, 0);
+    return(0);
+    }
+
+  workers = (WORKER *) malloc(n_workers*sizeof(WORKER));
+#ifdef _WIN32
+  threads = (HANDLE *) malloc(n_workers*sizeof(HANDLE));
+#else
+  threads = (pthread_t *) malloc(n_workers*sizeof(pthread_t));
+  started = (int *) malloc(n_workers*sizeof(int));
+  if (started IS NULL) threads = NULL;
+#endif
+  if ((workers IS NULL) OR (threads IS NULL))
+    {
+    free(workers); free(threads);
+    for (w=0; w<n_tasks; w++) (*task)(arg, w, 0);
+    return(0);
+    }
+
+  for (w=0; w<n_workers; w++)
+    {
+    workers[w].task = task;
+    workers[w].arg = arg;
+    workers[w].first = w;
+    workers[w].n_tasks = n_tasks;
+    workers[w].stride = n_workers;
+    }
+
+  for (w=1; w<n_workers; w++)
+#ifdef _WIN32
+    threads[w] = CreateThread(NULL, 0, worker_main, &workers[w], 0, NULL);
+#else
+    started[w] = (pthread_create(&threads[w], NULL, worker_main, &workers[w]) IS 0);
+#endif
+
+  run_worker(&workers[0]);
+
+  for (w=1; w<n_workers; w++)
+#ifdef _WIN32
+    if (threads[w] ISNT NULL)
+      {
+      WaitForSingleObject(threads[w], INFINITE);
+      CloseHandle(threads[w]);
+      }
+    else
+      run_worker(&workers[w]);
+#else
+    if (started[w])
+      pthread_join(threads[w], NULL);
+    else
+      run_worker(&workers[w]);
+  free(started);
+#endif
+
+  free(threads);
+  free(workers);
+  return(0);
+  }
+
+/*
+  --------------------------------------------------------------------
+  Number of threads worth using for N_IMAGES convolutions, each
+  computing RES_SIZE samples with a filter of FILT_SIZE taps.
+ ------------------------------------------------------------------------ */
+int parallel_threads(int n_images, size_t res_size, int filt_size, int n_threads)
+  {
+  double work = (double) n_images * res_size * filt_size;
+
+  if (n_threads < 1) return(1);
+  if (work < (double) PARALLEL_MIN_WORK * 2) return(1);
+  if (work < (double) PARALLEL_MIN_WORK * n_threads)
+    return((int) (work / PARALLEL_MIN_WORK));
+  return(n_threads);
+  }
+
+/*
+  --------------------------------------------------------------------
+  Split the DIM rows computed for each of N_IMAGES images into blocks
+  for N_THREADS threads, so that there are at least N_THREADS tasks in
+  total.  Each block has at least MIN_ROWS rows.  Returns the number
+  of rows per block.
+ ------------------------------------------------------------------------ */
+int row_block_size(int n_images, int dim, int min_rows, int n_threads)
+  {
+  int blocks_per_image, rows;
+
+  if (n_threads <= 1) return((dim > 0) ? dim : 1);
+  blocks_per_image = (n_threads + n_images - 1) / n_images;
+  rows = (dim + blocks_per_image - 1) / blocks_per_image;
+  if (rows < min_rows) rows = min_rows;
+  if (rows > dim) rows = dim;
+  return((rows > 0) ? rows : 1);
+  }
+
+/*
+  --------------------------------------------------------------------
+  Run an expand TASK over JOB->N_BLOCKS row-blocks per image.  Unlike
+  the reduce case, neighboring blocks add into overlapping rows of the
+  result, so they can't run at the same time.  Blocks are at least
+  three filter-heights tall, which means only adjacent blocks overlap:
+  we run all the even blocks in parallel, then all the odd ones.  With
+  circular boundaries the first and last blocks also overlap, so if
+  they'd both be even, the last one gets a phase of its own.
+ ------------------------------------------------------------------------ */
+int run_expand_phases(task_fptr task, CONV_JOB *job, int wrap, int n_threads)
+  {
+  int n_blocks = job->n_blocks;
+  int last_alone = wrap AND (n_blocks > 1) AND (n_blocks%2 IS 1);
+
+  job->block_stride = 2;
+  job->first_block = 0;					  /* EVEN BLOCKS */
+  job->n_phase_blocks = (n_blocks+1)/2 - last_alone;
+  run_parallel(task, job, job->n_phase_blocks*job->n_images, n_threads);
+
+  job->first_block = 1;					  /* ODD BLOCKS */
+  job->n_phase_blocks = n_blocks/2;
+  if (job->n_phase_blocks > 0)
+    run_parallel(task, job, job->n_phase_blocks*job->n_images, n_threads);
+
+  if (last_alone)					  /* LAST BLOCK */
+    {
+    job->first_block = n_blocks-1;
+    job->n_phase_blocks = 1;
+    run_parallel(task, job, job->n_images, n_threads);
+    }
+  return(0);
+  }
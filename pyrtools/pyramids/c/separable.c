@@ -0,0 +1,320 @@
+/*
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+;;;  File: separable.c
+;;;  Description: Convolution with separable filters.  Equivalent to a
+;;;               vertical internal_reduce (internal_expand) with a column
+;;;               filter followed by a horizontal one with a row filter,
+;;;               but done in a single pass over the image, one row at a
+;;;               time, through a row buffer.
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+*/
+
+#include <stdio.h>
+#include <stdlib.h>
+#include "convolve.h"
+
+/* Sampling of one axis: for each sample (of the result for reduce, of
+   the image for expand), the position of the first filter tap and the
+   filter to use.  Near the edges these are the edge-handling filters
+   computed by edges.c, so that the result is the same as that of
+   internal_reduce (internal_expand) with a 1D filter.  With circular
+   boundaries, the filter is never modified and positions are wrapped. */
+typedef struct
+  {
+  int n;
+  int *pos;
+  image_type **taps;
+  image_type *bank;
+  } AXIS_PLAN;
+
+static int wrap_index(int pos, int dim)
+  {
+  pos %= dim;
+  return((pos < 0) ? pos+dim : pos);
+  }
+
+static void free_plan(AXIS_PLAN *plan)
+  {
+  free(plan->pos);
+  free(plan->taps);
+  free(plan->bank);
+  }
+
+/* REFLECT is NULL for circular boundaries.  VERTICAL says whether FILT
+   is a column (y) or a row (x) filter. */
+static int make_plan(AXIS_PLAN *plan, image_type *filt, int fdim, int dim,
+		     int start, int step, int stop, fptr reflect, int vertical,
+		     int r_or_e)
+  {
+  int fmid = fdim/2;
+  int ctr_start = ((fdim==1)?0:1);
+  int ctr_stop = dim - ((fdim==1)?0:fdim);
+  int i, pos, n_edge = 0;
+  image_type *next;
+
+  plan->n = (stop-start+step-1)/step;
+
+  /* shift start/stop coords to the first filter tap */
+  start -= fmid;  stop -= fmid;
+  if (stop < ctr_stop) ctr_stop = stop;
+
+  if (reflect ISNT NULL)
+    for (pos=start; pos<stop; pos+=step)
+      if ((pos < ctr_start) OR (pos >= ctr_stop)) n_edge++;
+
+  plan->pos = (int *) malloc((plan->n+1)*sizeof(int));
+  plan->taps = (image_type **) malloc((plan->n+1)*sizeof(image_type *));
+  plan->bank = (image_type *) malloc((n_edge+1)*fdim*sizeof(image_type));
+  if ((plan->pos IS NULL) OR (plan->taps IS NULL) OR (plan->bank IS NULL))
+    {
+    printf("INTERNAL_SEP: Failed to allocate temp array!");
+    free_plan(plan);
+    return(-1);
+    }
+
+  if (reflect IS NULL)
+    {
+    for (i=0, pos=start; i<plan->n; i++, pos+=step)
+      {
+      plan->pos[i] = pos;
+      plan->taps[i] = filt;
+      }
+    return(0);
+    }
+
+#define EDGE_FILTER(RES,POS) \
+  { \
+  if (vertical) (*reflect)(filt,1,fdim,0,POS,RES,r_or_e); \
+  else (*reflect)(filt,fdim,1,POS,0,RES,r_or_e); \
+  }
+
+  EDGE_FILTER(plan->bank, 0)
+  for (i=0, pos=start, next=plan->bank+fdim; i<plan->n; i++, pos+=step)
+    if (pos < ctr_start)			      /* TOP/LEFT EDGE */
+      {
+      EDGE_FILTER(next, pos-1)
+      plan->pos[i] = 0;
+      plan->taps[i] = next;
+      next += fdim;
+      }
+    else if (pos < ctr_stop)			      /* CENTER */
+      {
+      plan->pos[i] = pos;
+      plan->taps[i] = plan->bank;
+      }
+    else					      /* BOTTOM/RIGHT EDGE */
+      {
+      EDGE_FILTER(next, pos-ctr_stop+1)
+      plan->pos[i] = ctr_stop;
+      plan->taps[i] = next;
+      next += fdim;
+      }
+#undef EDGE_FILTER
+  return(0);
+  }
+
+/* Fill in a CONV_JOB (see convolve.h) for a separable convolution.  TEMP
+   holds one row buffer of X_DIM samples per thread. */
+static void fill_job(CONV_JOB *job, AXIS_PLAN *plans, image_type *image, int n_images,
+		     int x_dim, int y_dim, int x_fdim, int y_fdim, image_type *temp,
+		     image_type *result, fptr reflect)
+  {
+  job->image = image;  job->filt = NULL;  job->temp = temp;  job->result = result;
+  job->n_images = n_images;  job->x_dim = x_dim;  job->y_dim = y_dim;
+  job->x_fdim = x_fdim;  job->y_fdim = y_fdim;
+  job->reflect = reflect;  job->err = 0;
+  job->plans = (void *) plans;
+  }
+
+/*
+  --------------------------------------------------------------------
+  Correlate IMAGE with the separable filter Y_FILT * X_FILT (a column
+  of Y_FDIM taps and a row of X_FDIM taps), subsampling according to
+  START, STEP and STOP.  Each row of the result is computed by
+  correlating Y_FDIM image rows with the (edge-handled) Y_FILT into a
+  row buffer, which is then correlated with X_FILT and subsampled.
+ ------------------------------------------------------------------------ */
+
+static void sep_reduce_task(void *arg, int task, int worker)
+  {
+  CONV_JOB *job = (CONV_JOB *) arg;
+  AXIS_PLAN *x_plan = (AXIS_PLAN *) job->plans, *y_plan = x_plan+1;
+  int wrap = (job->reflect IS NULL);
+  int n = task / job->n_phase_blocks;
+  int block = job->first_block + job->block_stride*(task % job->n_phase_blocks);
+  int x_dim = job->x_dim, y_dim = job->y_dim;
+  int x_fdim = job->x_fdim, y_fdim = job->y_fdim;
+  int r0 = block*job->rows_per_block;
+  int r1 = (r0+job->rows_per_block < y_plan->n) ? r0+job->rows_per_block : y_plan->n;
+  image_type *image = job->image + (size_t) n*x_dim*y_dim;
+  image_type *row = job->temp + (size_t) worker*x_dim;
+  image_type *res = job->result + ((size_t) n*y_plan->n + r0)*x_plan->n;
+  register image_type *src, *taps;
+  register double sum;
+  register image_type tap;
+  register int x_pos, k, pos;
+  int y_pos, i;
+
+  for (y_pos=r0; y_pos<r1; y_pos++)
+    {
+    taps = y_plan->taps[y_pos];		      /* VERTICAL, INTO ROW BUFFER */
+    for (x_pos=0; x_pos<x_dim; x_pos++) row[x_pos] = 0.0;
+    for (k=0; k<y_fdim; k++)
+      {
+      pos = y_plan->pos[y_pos] + k;
+      src = image + (size_t) (wrap ? wrap_index(pos, y_dim) : pos)*x_dim;
+      tap = taps[k];
+      for (x_pos=0; x_pos<x_dim; x_pos++)
+	row[x_pos] += src[x_pos]*tap;
+      }
+
+    for (i=0; i<x_plan->n; i++, res++)	      /* HORIZONTAL, FROM ROW BUFFER */
+      {
+      taps = x_plan->taps[i];
+      pos = x_plan->pos[i];
+      sum = 0.0;
+      if (wrap AND ((pos < 0) OR (pos+x_fdim > x_dim)))
+	for (k=0; k<x_fdim; k++)
+	  sum += row[wrap_index(pos+k, x_dim)]*taps[k];
+      else
+	for (src=row+pos, k=0; k<x_fdim; k++)
+	  sum += src[k]*taps[k];
+      *res = sum;
+      }
+    }
+  }
+
+int internal_sep_reduce_batch(image_type *image, int n_images, int x_dim, int y_dim,
+			      image_type *x_filt, int x_fdim, image_type *y_filt, int y_fdim,
+			      image_type *temp,
+			      int x_start, int x_step, int x_stop,
+			      int y_start, int y_step, int y_stop,
+			      image_type *result, int edges, int n_threads)
+  {
+  CONV_JOB job;
+  AXIS_PLAN plans[2];
+  fptr reflect = NULL;
+  int wrap = (edges IS EDGES_CIRCULAR);
+
+  if (!wrap AND !(reflect = edge_function_id(edges))) return(-1);
+  if (make_plan(&plans[0], x_filt, x_fdim, x_dim, x_start, x_step, x_stop,
+		reflect, 0, REDUCE))
+    return(-1);
+  if (make_plan(&plans[1], y_filt, y_fdim, y_dim, y_start, y_step, y_stop,
+		reflect, 1, REDUCE))
+    {
+    free_plan(&plans[0]);
+    return(-1);
+    }
+
+  n_threads = parallel_threads(n_images, (size_t) plans[1].n*x_dim, x_fdim+y_fdim, n_threads);
+  fill_job(&job, plans, image, n_images, x_dim, y_dim, x_fdim, y_fdim, temp, result,
+	   reflect);
+  job.rows_per_block = row_block_size(n_images, plans[1].n, 1, n_threads);
+  job.n_blocks = (plans[1].n + job.rows_per_block - 1) / job.rows_per_block;
+  job.first_block = 0;  job.block_stride = 1;  job.n_phase_blocks = job.n_blocks;
+
+  if (job.n_blocks > 0)
+    run_parallel(sep_reduce_task, &job, n_images*job.n_blocks, n_threads);
+
+  free_plan(&plans[0]);
+  free_plan(&plans[1]);
+  return(job.err);
+  } /* end of internal_sep_reduce_batch */
+
+/*
+  --------------------------------------------------------------------
+  Upsample IMAGE according to START, STEP and STOP and convolve with the
+  separable filter Y_FILT * X_FILT, adding values into the X_DIM by
+  Y_DIM RESULT.  Each image row is upsampled and convolved with
+  (edge-handled) X_FILT into a row buffer, which is then added into
+  Y_FDIM rows of the result, weighted by Y_FILT.
+
+  WARNING: this subroutine destructively modifies the RESULT array!
+ ------------------------------------------------------------------------ */
+
+static void sep_expand_task(void *arg, int task, int worker)
+  {
+  CONV_JOB *job = (CONV_JOB *) arg;
+  AXIS_PLAN *x_plan = (AXIS_PLAN *) job->plans, *y_plan = x_plan+1;
+  int wrap = (job->reflect IS NULL);
+  int n = task / job->n_phase_blocks;
+  int block = job->first_block + job->block_stride*(task % job->n_phase_blocks);
+  int x_dim = job->x_dim, y_dim = job->y_dim;
+  int x_fdim = job->x_fdim, y_fdim = job->y_fdim;
+  int r0 = block*job->rows_per_block;
+  int r1 = (r0+job->rows_per_block < y_plan->n) ? r0+job->rows_per_block : y_plan->n;
+  image_type *image = job->image + ((size_t) n*y_plan->n + r0)*x_plan->n;
+  image_type *row = job->temp + (size_t) worker*x_dim;
+  image_type *res = job->result + (size_t) n*x_dim*y_dim;
+  register image_type *dst, *taps;
+  register image_type val, tap;
+  register int x_pos, k, pos;
+  int y_pos, i;
+
+  for (y_pos=r0; y_pos<r1; y_pos++)
+    {
+    for (x_pos=0; x_pos<x_dim; x_pos++) row[x_pos] = 0.0;
+    for (i=0; i<x_plan->n; i++, image++)     /* HORIZONTAL, INTO ROW BUFFER */
+      {
+      val = *image;
+      taps = x_plan->taps[i];
+      pos = x_plan->pos[i];
+      if (wrap AND ((pos < 0) OR (pos+x_fdim > x_dim)))
+	for (k=0; k<x_fdim; k++)
+	  row[wrap_index(pos+k, x_dim)] += val*taps[k];
+      else
+	for (dst=row+pos, k=0; k<x_fdim; k++)
+	  dst[k] += val*taps[k];
+      }
+
+    taps = y_plan->taps[y_pos];		      /* VERTICAL, FROM ROW BUFFER */
+    for (k=0; k<y_fdim; k++)
+      {
+      pos = y_plan->pos[y_pos] + k;
+      dst = res + (size_t) (wrap ? wrap_index(pos, y_dim) : pos)*x_dim;
+      tap = taps[k];
+      for (x_pos=0; x_pos<x_dim; x_pos++)
+	dst[x_pos] += row[x_pos]*tap;
+      }
+    }
+  }
+
+int internal_sep_expand_batch(image_type *image, int n_images,
+			      image_type *x_filt, int x_fdim, image_type *y_filt, int y_fdim,
+			      image_type *temp,
+			      int x_start, int x_step, int x_stop,
+			      int y_start, int y_step, int y_stop,
+			      image_type *result, int x_dim, int y_dim, int edges,
+			      int n_threads)
+  {
+  CONV_JOB job;
+  AXIS_PLAN plans[2];
+  fptr reflect = NULL;
+  int wrap = (edges IS EDGES_CIRCULAR);
+
+  if (!wrap AND !(reflect = edge_function_id(edges))) return(-1);
+  if (make_plan(&plans[0], x_filt, x_fdim, x_dim, x_start, x_step, x_stop,
+		reflect, 0, EXPAND))
+    return(-1);
+  if (make_plan(&plans[1], y_filt, y_fdim, y_dim, y_start, y_step, y_stop,
+		reflect, 1, EXPAND))
+    {
+    free_plan(&plans[0]);
+    return(-1);
+    }
+
+  n_threads = parallel_threads(n_images, (size_t) plans[1].n*x_dim, x_fdim+y_fdim, n_threads);
+  fill_job(&job, plans, image, n_images, x_dim, y_dim, x_fdim, y_fdim, temp, result,
+	   reflect);
+  job.rows_per_block = row_block_size(n_images, plans[1].n, (3*y_fdim+y_step-1)/y_step,
+				      n_threads);
+  job.n_blocks = (plans[1].n + job.rows_per_block - 1) / job.rows_per_block;
+
+  if (job.n_blocks > 0)
+    run_expand_phases(sep_expand_task, &job, wrap, n_threads);
+
+  free_plan(&plans[0]);
+  free_plan(&plans[1]);
+  return(job.err);
+  } /* end of internal_sep_expand_batch */
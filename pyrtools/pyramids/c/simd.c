@@ -0,0 +1,238 @@
+/*
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+;;;  File: simd.c
+;;;  Description: Inner loops for the interior (CENTER) sections of
+;;;               internal_reduce, internal_expand, internal_wrap_reduce
+;;;               and internal_wrap_expand, which cover most samples of
+;;;               real images.  Each has a scalar version and, on x86
+;;;               compilers that support it, an AVX2 version, picked at
+;;;               run time according to the cpu (see internal_simd_level).
+;;;               Both versions sum the products for each sample in the
+;;;               same order, so they give identical results.
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+*/
+
+#include "convolve.h"
+
+#if (defined(__GNUC__) || defined(__clang__)) && (defined(__x86_64__) || defined(__i386__))
+#define HAVE_AVX2
+#include <immintrin.h>
+#endif
+
+/*
+  --------------------------------------------------------------------
+  Set the instruction set used by the interior kernels: SIMD_NONE for
+  the scalar loops, SIMD_AVX2, or a negative LEVEL for the best one
+  the cpu supports.  Levels the cpu (or compiler) doesn't support fall
+  back to the scalar loops.  Returns the level in effect.  Shared by
+  the single and double precision routines.
+ ------------------------------------------------------------------------ */
+#ifndef SINGLE_PRECISION
+static int simd_level = -1;
+
+int internal_simd_level(int level)
+  {
+  int supported = SIMD_NONE;
+
+#ifdef HAVE_AVX2
+  __builtin_cpu_init();
+  if (__builtin_cpu_supports("avx2")) supported = SIMD_AVX2;
+#endif
+  if ((level < 0) OR (level > supported)) level = supported;
+  simd_level = level;
+  return(level);
+  }
+
+int simd_kernels()
+  {
+  if (simd_level < 0) internal_simd_level(-1);
+  return(simd_level);
+  }
+#endif
+
+/*
+  --------------------------------------------------------------------
+  Correlate FILT with N windows of IMAGE, which start X_STEP samples
+  apart along a row, and put the inner products in RESULT[0..N).  All
+  the windows must lie within the image, whose rows are X_DIM long.
+ ------------------------------------------------------------------------ */
+static void reduce_interior_scalar(image_type *image, int x_dim,
+				   image_type *filt, int x_fdim, int y_fdim,
+				   int x_step, int n, image_type *result)
+  {
+  register double sum;
+  register image_type *im, *f;
+  register int x_f, y_f, i;
+
+  for (i=0; i<n; i++, image+=x_step)
+    {
+    sum=0.0;
+    for (y_f=0, im=image, f=filt; y_f<y_fdim; y_f++, im+=x_dim)
+      for (x_f=0; x_f<x_fdim; x_f++, f++)
+	sum += im[x_f] * *f;
+    result[i] = sum;
+    }
+  }
+
+/*
+  --------------------------------------------------------------------
+  Add FILT, scaled by each of the N samples of IMAGE, into RESULT, at
+  windows X_STEP samples apart along a row.  This is done a filter tap
+  at a time, adding that tap times the N samples into every X_STEP'th
+  sample of the result, so that consecutive updates don't overlap.
+  All the windows must lie within the result, whose rows are X_DIM
+  long.
+ ------------------------------------------------------------------------ */
+static void expand_interior_scalar(image_type *image, int n, int x_step,
+				   image_type *filt, int x_fdim, int y_fdim,
+				   image_type *result, int x_dim)
+  {
+  register double tap;
+  register image_type *res;
+  register int x_f, y_f, i;
+
+  for (y_f=0; y_f<y_fdim; y_f++, result+=x_dim)
+    for (x_f=0; x_f<x_fdim; x_f++, filt++)
+      for (i=0, tap=*filt, res=result+x_f; i<n; i++, res+=x_step)
+	*res += image[i] * tap;
+  }
+
+#ifdef HAVE_AVX2
+/* Vectors of 4 doubles, to/from 4 samples of image_type.  The products
+   of image and filter samples are taken in image_type, as in the scalar
+   loops, before being summed in double. */
+#ifdef SINGLE_PRECISION
+#define LOAD4(p)		_mm256_cvtps_pd(_mm_loadu_ps(p))
+#define STORE4(p,v)		_mm_storeu_ps((p), _mm256_cvtpd_ps(v))
+#define PROD4(v,f)		_mm256_cvtps_pd(_mm_mul_ps((v), _mm_set1_ps(f)))
+#define UNIT_PROD4(p,f)		PROD4(_mm_loadu_ps(p), f)
+/* samples 0, 2, 4 and 6, without reading past the last one */
+#define STEP2_PROD4(p,f) \
+  PROD4(_mm_shuffle_ps(_mm_loadu_ps(p), _mm_loadu_ps((p)+3), _MM_SHUFFLE(3,1,2,0)), f)
+#define STRIDED_PROD4(p,f)	PROD4(_mm_i32gather_ps((p), idx, sizeof(float)), f)
+#else
+#define LOAD4(p)		_mm256_loadu_pd(p)
+#define STORE4(p,v)		_mm256_storeu_pd((p), (v))
+#define PROD4(v,f)		_mm256_mul_pd((v), _mm256_set1_pd(f))
+#define UNIT_PROD4(p,f)		PROD4(_mm256_loadu_pd(p), f)
+#define STEP2_PROD4(p,f) \
+  PROD4(_mm256_permute4x64_pd(_mm256_blend_pd(_mm256_loadu_pd(p), _mm256_loadu_pd((p)+3), 0xA), \
+			      0xD8), f)
+#define STRIDED_PROD4(p,f)	PROD4(_mm256_i32gather_pd((p), idx, sizeof(double)), f)
+#endif
+
+/* 8 windows at a time, in two vectors to hide the latency of the adds */
+#define REDUCE8(PROD)							\
+  for (; i+8<=n; i+=8, image+=8*x_step)					\
+    {									\
+    sum0 = sum1 = _mm256_setzero_pd();					\
+    for (y_f=0, im=image, f=filt; y_f<y_fdim; y_f++, im+=x_dim)	\
+      for (x_f=0; x_f<x_fdim; x_f++, f++)				\
+	{								\
+	sum0 = _mm256_add_pd(sum0, PROD(im+x_f, *f));			\
+	sum1 = _mm256_add_pd(sum1, PROD(im+x_f+4*x_step, *f));		\
+	}								\
+    STORE4(result+i, sum0);						\
+    STORE4(result+i+4, sum1);						\
+    }
+
+__attribute__((target("avx2")))
+static void reduce_interior_avx2(image_type *image, int x_dim,
+				 image_type *filt, int x_fdim, int y_fdim,
+				 int x_step, int n, image_type *result)
+  {
+  __m128i idx = _mm_setr_epi32(0, x_step, 2*x_step, 3*x_step);
+  __m256d sum0, sum1;
+  image_type *im, *f;
+  int x_f, y_f, i = 0;
+
+  if (x_step IS 1)
+    REDUCE8(UNIT_PROD4)
+  else if (x_step IS 2)
+    REDUCE8(STEP2_PROD4)
+  else
+    REDUCE8(STRIDED_PROD4)
+  reduce_interior_scalar(image, x_dim, filt, x_fdim, y_fdim, x_step, n-i, result+i);
+  }
+
+/* Steps of 1 and 2 are vectorized, 4 samples of IMAGE at a time.  With
+   a step of 2, taps X_F and X_F+1 update alternate samples of the
+   result, so they are done together (each sample of the result still
+   gets them in order). */
+__attribute__((target("avx2")))
+static void expand_interior_avx2(image_type *image, int n, int x_step,
+				 image_type *filt, int x_fdim, int y_fdim,
+				 image_type *result, int x_dim)
+  {
+  __m256d tap4, val4;
+  image_type *res;
+  int x_f, y_f, i, t;
+
+  for (y_f=0; y_f<y_fdim; y_f++, result+=x_dim)
+    for (x_f=0; x_f<x_fdim; x_f++, filt++)
+      {
+      res = result+x_f;
+      i = 0;
+      if (x_step IS 1)
+	{
+	tap4 = _mm256_set1_pd(*filt);
+	for (; i+4<=n; i+=4)
+	  STORE4(res+i, _mm256_add_pd(LOAD4(res+i), _mm256_mul_pd(LOAD4(image+i), tap4)));
+	}
+      else if ((x_step IS 2) AND (x_f+1 < x_fdim))
+	{
+	tap4 = _mm256_setr_pd(filt[0], filt[1], filt[0], filt[1]);
+	for (; i+4<=n; i+=4)
+	  {
+	  val4 = LOAD4(image+i);
+	  STORE4(res+2*i, _mm256_add_pd(LOAD4(res+2*i),
+					_mm256_mul_pd(_mm256_permute4x64_pd(val4, 0x50), tap4)));
+	  STORE4(res+2*i+4, _mm256_add_pd(LOAD4(res+2*i+4),
+					  _mm256_mul_pd(_mm256_permute4x64_pd(val4, 0xFA), tap4)));
+	  }
+	for (t=i; t<n; t++)		      /* finish tap X_F, then do X_F+1 */
+	  res[t*x_step] += image[t] * (double) *filt;
+	x_f++; filt++; res++;
+	}
+      for (; i<n; i++)
+	res[i*x_step] += image[i] * (double) *filt;
+      }
+  }
+
+#undef LOAD4
+#undef STORE4
+#undef PROD4
+#undef UNIT_PROD4
+#undef STEP2_PROD4
+#undef STRIDED_PROD4
+#undef REDUCE8
+#endif /* HAVE_AVX2 */
+
+void reduce_interior(image_type *image, int x_dim,
+		     image_type *filt, int x_fdim, int y_fdim,
+		     int x_step, int n, image_type *result)
+  {
+#ifdef HAVE_AVX2
+  if (simd_kernels() IS SIMD_AVX2)
+    {
+    reduce_interior_avx2(image, x_dim, filt, x_fdim, y_fdim, x_step, n, result);
+    return;
+    }
+#endif
+  reduce_interior_scalar(image, x_dim, filt, x_fdim, y_fdim, x_step, n, result);
+  }
+
+void expand_interior(image_type *image, int n, int x_step,
+		     image_type *filt, int x_fdim, int y_fdim,
+		     image_type *result, int x_dim)
+  {
+  if (n <= 0) return;
+#ifdef HAVE_AVX2
+  if (simd_kernels() IS SIMD_AVX2)
+    {
+    expand_interior_avx2(image, n, x_step, filt, x_fdim, y_fdim, result, x_dim);
+    return;
+    }
+#endif
+  expand_interior_scalar(image, n, x_step, filt, x_fdim, y_fdim, result, x_dim);
+  }
@@ -57,6 +57,7 @@ int internal_wrap_reduce(image, x_dim, y_dim, filt, x_fdim, y_fdim,
   register int filt_pos, x_im, y_im, x_filt_stop;
   register int x_pos, y_pos, res_pos;
   int x_ctr_stop = x_dim - x_fdim + 1;
+  int n_ctr;
   int y_ctr_stop = y_dim - y_fdim + 1;
   int x_ctr_start = 0;
   int y_ctr_start = 0;
@@ -109,10 +110,11 @@ int internal_wrap_reduce(image, x_dim, y_dim, filt, x_fdim, y_fdim,
 	 x_pos+=x_step, res_pos++)
       INPROD(y_pos, y_im, x_pos+x_dim, x_im%x_dim)
 
-    for (;			/* CENTER SECTION */
-	 x_pos<x_ctr_stop;
-	 x_pos+=x_step, res_pos++) 
-      INPROD(y_pos, y_im, x_pos, x_im)
+    n_ctr = (x_pos<x_ctr_stop) ? (x_ctr_stop-x_pos+x_step-1)/x_step : 0;
+    reduce_interior(image+y_pos*x_dim+x_pos, x_dim, filt, x_fdim, y_fdim,
+		    x_step, n_ctr, result+res_pos);	/* CENTER SECTION */
+    x_pos += n_ctr*x_step;
+    res_pos += n_ctr;
 
     for (; 
 	 x_pos<x_stop;
@@ -187,6 +189,7 @@ int internal_wrap_expand(image, filt, x_fdim, y_fdim,
   register int filt_pos, x_res, y_res, x_filt_stop;
   register int x_pos, y_pos, im_pos;
   int x_ctr_stop = x_dim - x_fdim + 1;
+  int n_ctr;
   int y_ctr_stop = y_dim - y_fdim + 1;
   int x_ctr_start = 0;
   int y_ctr_start = 0;
@@ -239,10 +242,11 @@ int internal_wrap_expand(image, filt, x_fdim, y_fdim,
 	 x_pos+=x_step, im_pos++)
       INPROD2(y_pos, y_res, x_pos+x_dim, x_res%x_dim)
 	
-    for (;			/* CENTER SECTION */
-	 x_pos<x_ctr_stop;
-	 x_pos+=x_step, im_pos++) 
-      INPROD2(y_pos, y_res, x_pos, x_res)
+    n_ctr = (x_pos<x_ctr_stop) ? (x_ctr_stop-x_pos+x_step-1)/x_step : 0;
+    expand_interior(image+im_pos, n_ctr, x_step, filt, x_fdim, y_fdim,
+		    result+y_pos*x_dim+x_pos, x_dim);	/* CENTER SECTION */
+    x_pos += n_ctr*x_step;
+    im_pos += n_ctr;
 
     for (; 
 	 x_pos<x_stop;
@@ -276,6 +280,109 @@ int internal_wrap_expand(image, filt, x_fdim, y_fdim,
 
 
 
+/*
+ --------------------------------------------------------------------
+ Batched, multithreaded versions of internal_wrap_reduce and
+ internal_wrap_expand, operating on N_IMAGES images stored contiguously
+ in IMAGE (and RESULT).  See internal_reduce_batch in convolve.c.
+ -------------------------------------------------------------------- */
+
+static void wrap_reduce_task(void *arg, int task, int worker)
+  {
+  CONV_JOB *job = (CONV_JOB *) arg;
+  int n = task / job->n_phase_blocks;
+  int block = job->first_block + job->block_stride*(task % job->n_phase_blocks);
+  int x_res_dim = (job->x_stop-job->x_start+job->x_step-1)/job->x_step;
+  int y_res_dim = (job->y_stop-job->y_start+job->y_step-1)/job->y_step;
+  int r0 = block*job->rows_per_block;
+  int r1 = (r0+job->rows_per_block < y_res_dim) ? r0+job->rows_per_block : y_res_dim;
+
+  if (internal_wrap_reduce(job->image + (size_t) n*job->x_dim*job->y_dim,
+			   job->x_dim, job->y_dim, job->filt, job->x_fdim, job->y_fdim,
+			   job->x_start, job->x_step, job->x_stop,
+			   job->y_start + r0*job->y_step, job->y_step,
+			   job->y_start + (r1-1)*job->y_step + 1,
+			   job->result + ((size_t) n*y_res_dim + r0)*x_res_dim))
+    job->err = -1;
+  }
+
+int internal_wrap_reduce_batch(image_type *image, int n_images, int x_dim, int y_dim,
+			       image_type *filt, int x_fdim, int y_fdim,
+			       int x_start, int x_step, int x_stop,
+			       int y_start, int y_step, int y_stop,
+			       image_type *result, int n_threads)
+  {
+  CONV_JOB job;
+  int y_res_dim = (y_stop-y_start+y_step-1)/y_step;
+  size_t res_size = (size_t) ((x_stop-x_start+x_step-1)/x_step) * y_res_dim;
+
+  n_threads = parallel_threads(n_images, res_size, x_fdim*y_fdim, n_threads);
+
+  job.image = image;  job.filt = filt;  job.temp = NULL;  job.result = result;
+  job.n_images = n_images;  job.x_dim = x_dim;  job.y_dim = y_dim;
+  job.x_fdim = x_fdim;  job.y_fdim = y_fdim;
+  job.x_start = x_start;  job.x_step = x_step;  job.x_stop = x_stop;
+  job.y_start = y_start;  job.y_step = y_step;  job.y_stop = y_stop;
+  job.reflect = NULL;  job.err = 0;
+  job.rows_per_block = row_block_size(n_images, y_res_dim, 1, n_threads);
+  job.n_blocks = (y_res_dim + job.rows_per_block - 1) / job.rows_per_block;
+  job.first_block = 0;  job.block_stride = 1;  job.n_phase_blocks = job.n_blocks;
+
+  if (job.n_blocks > 0)
+    run_parallel(wrap_reduce_task, &job, n_images*job.n_blocks, n_threads);
+  return(job.err);
+  } /* end of internal_wrap_reduce_batch */
+
+static void wrap_expand_task(void *arg, int task, int worker)
+  {
+  CONV_JOB *job = (CONV_JOB *) arg;
+  int n = task / job->n_phase_blocks;
+  int block = job->first_block + job->block_stride*(task % job->n_phase_blocks);
+  int x_im_dim = (job->x_stop-job->x_start+job->x_step-1)/job->x_step;
+  int y_im_dim = (job->y_stop-job->y_start+job->y_step-1)/job->y_step;
+  int r0 = block*job->rows_per_block;
+  int r1 = (r0+job->rows_per_block < y_im_dim) ? r0+job->rows_per_block : y_im_dim;
+
+  if (internal_wrap_expand(job->image + ((size_t) n*y_im_dim + r0)*x_im_dim,
+			   job->filt, job->x_fdim, job->y_fdim,
+			   job->x_start, job->x_step, job->x_stop,
+			   job->y_start + r0*job->y_step, job->y_step,
+			   job->y_start + (r1-1)*job->y_step + 1,
+			   job->result + (size_t) n*job->x_dim*job->y_dim,
+			   job->x_dim, job->y_dim))
+    job->err = -1;
+  }
+
+int internal_wrap_expand_batch(image_type *image, int n_images,
+			       image_type *filt, int x_fdim, int y_fdim,
+			       int x_start, int x_step, int x_stop,
+			       int y_start, int y_step, int y_stop,
+			       image_type *result, int x_dim, int y_dim,
+			       int n_threads)
+  {
+  CONV_JOB job;
+  int y_im_dim = (y_stop-y_start+y_step-1)/y_step;
+  size_t im_size = (size_t) ((x_stop-x_start+x_step-1)/x_step) * y_im_dim;
+
+  n_threads = parallel_threads(n_images, im_size, x_fdim*y_fdim, n_threads);
+
+  job.image = image;  job.filt = filt;  job.temp = NULL;  job.result = result;
+  job.n_images = n_images;  job.x_dim = x_dim;  job.y_dim = y_dim;
+  job.x_fdim = x_fdim;  job.y_fdim = y_fdim;
+  job.x_start = x_start;  job.x_step = x_step;  job.x_stop = x_stop;
+  job.y_start = y_start;  job.y_step = y_step;  job.y_stop = y_stop;
+  job.reflect = NULL;  job.err = 0;
+  job.rows_per_block = row_block_size(n_images, y_im_dim, (3*y_fdim+y_step-1)/y_step,
+				      n_threads);
+  job.n_blocks = (y_im_dim + job.rows_per_block - 1) / job.rows_per_block;
+
+  if (job.n_blocks > 0)
+    run_expand_phases(wrap_expand_task, &job, 1, n_threads);
+  return(job.err);
+  } /* end of internal_wrap_expand_batch */
+
+
+
 /* Local Variables: */
 /* buffer-read-only: t */
 /* End: */
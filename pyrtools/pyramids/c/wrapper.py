@@ -1,30 +1,506 @@
 #!/usr/bin/python
 """functions that interact with the C code, for handling convolutions mostly.
 """
+import collections
 import ctypes
+import math
 import warnings
 import os
 import glob
+import threading
 import numpy as np
+import scipy.fft
 
 # the wrapConv.so file can have some system information after it from the compiler, so we just find
 # whatever it is called
 libpath = glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'wrapConv*.*'))
 # print(libpath)
 
+# ids of the edge-handlers, as passed to the C code: their index in the table in edges.c, or -1
+# (EDGES_CIRCULAR in convolve.h) for circular boundaries
+_EDGE_TYPES = {'circular': -1, 'dont-compute': 0, 'zero': 1, 'repeat': 2, 'reflect1': 3,
+               'reflect2': 4, 'extend': 6}
+
+# argument types of the C functions (see convolve.h), declared once so that ctypes doesn't have
+# to guess them on every call. Arrays are passed as their address, which is cheaper than building
+# a typed pointer
+_p, _i = ctypes.c_void_p, ctypes.c_int
+_SIGNATURES = {
+    'internal_reduce_batch': [_p, _i, _i, _i, _p, _p, _p, _i, _i] + [_i] * 6 + [_p, _i, _i],
+    'internal_expand_batch': [_p, _i, _p, _p, _p, _i, _i] + [_i] * 6 + [_p, _i, _i, _i, _i],
+    'internal_edge_bank': [_p, _i, _i, _i, _i, _p],
+    'internal_wrap_reduce_batch': [_p, _i, _i, _i, _p, _i, _i] + [_i] * 6 + [_p, _i],
+    'internal_wrap_expand_batch': [_p, _i, _p, _i, _i] + [_i] * 6 + [_p, _i, _i, _i],
+    'internal_sep_reduce_batch': [_p, _i, _i, _i, _p, _i, _p, _i, _p] + [_i] * 6 + [_p, _i, _i],
+    'internal_sep_expand_batch': [_p, _i, _p, _i, _p, _i, _p] + [_i] * 6 + [_p, _i, _i, _i, _i],
+}
+# and of those that don't return anything
+_VOID_SIGNATURES = {
+    'internal_pointop': [_p, _p, _i, _p, _i, ctypes.c_double, ctypes.c_double, _i, _i],
+}
+
+
+class _CFunctions:
+    """the C convolution functions of one precision, with their signatures declared
+
+    The single-precision functions have a '_float' suffix in the library, but they are found under
+    the names of their double-precision counterparts here.
+
+    """
+    def __init__(self, suffix):
+        for signatures, restype in [(_SIGNATURES, ctypes.c_int), (_VOID_SIGNATURES, None)]:
+            for name, argtypes in signatures.items():
+                func = getattr(lib, name + suffix)
+                func.argtypes = argtypes
+                func.restype = restype
+                setattr(self, name, func)
+
+
+def _env_int(name, default):
+    """get the integer value of the environment variable `name`, or `default` if it isn't set (or,
+    with a warning, isn't an integer)
+    """
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        warnings.warn("%s must be an integer, but got %s: using %d" % (name, os.environ[name],
+                                                                       default))
+        return default
+
+
 # load the c library
 if len(libpath) > 0:
     lib = ctypes.cdll.LoadLibrary(libpath[0])
+    lib.internal_simd_level.argtypes = [_i]
+    lib.internal_simd_level.restype = _i
+    # the convolutions use the vectorized (AVX2) inner loops if the cpu supports them. Setting the
+    # PYRTOOLS_SIMD environment variable to 0 forces the scalar ones, e.g., for debugging (the
+    # results are the same either way)
+    lib.internal_simd_level(_env_int('PYRTOOLS_SIMD', -1))
+    _double_functions = _CFunctions('')
+    _float_functions = _CFunctions('_float')
 else:
     warnings.warn("Can't load in C code, something went wrong in your install!")
 
+# largest number of elements in a cached bank of edge-handling filters (see _edge_bank). Bigger
+# banks (i.e., filters larger than about 20x20) aren't cached: their filters are computed as needed
+_EDGE_BANK_SIZE = 2 ** 18
+# most bytes the cached banks take up in total: beyond that, the least recently used are dropped
+_EDGE_BANK_CACHE_BYTES = 2 ** 25
+# the cached banks, the most recently used last, and the number of bytes they take up
+_edge_banks = collections.OrderedDict()
+_edge_banks_nbytes = 0
+_edge_banks_lock = threading.Lock()
+
+# cost of an FFT, per sample and per factor of two in its size, relative to that of one
+# multiply-add of the direct convolution. Used to decide between the two in corrDn and upConv
+_FFT_COST = 1.5
+
+# number of threads used by corrDn, upConv, pointOp and the FFTs of pyrtools.tools.fft when
+# num_threads is not given. Can be initialized with the PYRTOOLS_NUM_THREADS environment variable
+# (0 means use all available cpus)
+_num_threads = _env_int('PYRTOOLS_NUM_THREADS', 1)
+
+
+def set_num_threads(num_threads):
+    """Set the default number of threads used by `corrDn`, `upConv`, `pointOp` and FFTs.
+
+    The C code splits each convolution into blocks of rows (and, for 3d inputs, images), which are
+    run in parallel. Small convolutions always run on a single thread, since starting threads would
+    cost more than it saves. The GIL is released while the C code runs, so other python threads
+    can run at the same time either way. The FFTs of `SteerablePyramidFreq` and the synthetic
+    images are run by their backend (see `pyrtools.tools.fft.set_fft_backend`) on this many
+    threads.
+
+    Arguments
+    ---------
+    num_threads : `int` or None
+        the number of threads to use. If None or 0, use all available cpus. Default (at import) is
+        1, unless the PYRTOOLS_NUM_THREADS environment variable is set.
+
+    """
+    global _num_threads
+    if num_threads is None:
+        num_threads = 0
+    if num_threads < 0:
+        raise Exception("num_threads must be non-negative, but got %s!" % num_threads)
+    _num_threads = int(num_threads)
+
+
+def get_num_threads():
+    """Get the default number of threads used by `corrDn`, `upConv`, `pointOp` and FFTs.
+
+    Returns
+    -------
+    num_threads : `int`
+        the number of threads that will be used for large convolutions.
+
+    """
+    return _check_num_threads(None)
+
+
+def _check_num_threads(num_threads):
+    """resolve the num_threads argument of corrDn and upConv into a positive int
+    """
+    if num_threads is None:
+        num_threads = _num_threads
+    if num_threads <= 0:
+        num_threads = os.cpu_count() or 1
+    return int(num_threads)
+
+
+def _precision(image):
+    """get the precision in which to convolve image
+
+    float32 images are convolved in single precision, everything else in double precision.
+
+    Returns
+    -------
+    dtype : `type`
+        np.float32 or np.float64
+    clib : `_CFunctions`
+        the C functions to use
+
+    """
+    if np.asarray(image).dtype == np.float32:
+        return np.float32, _float_functions
+    return np.float64, _double_functions
+
+
+def _result_array(out, shape, dtype):
+    """get the array to write the result of a convolution into
+
+    If out is None, a new (uninitialized) array is allocated. Otherwise, out is checked and
+    returned as is, so that the C code writes directly into it.
+
+    """
+    shape = tuple(shape)
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if (not isinstance(out, np.ndarray) or out.shape != shape or out.dtype != dtype or
+            not out.flags.c_contiguous or not out.flags.writeable):
+        raise Exception("out must be a writeable, C-contiguous %s array of shape %s!" %
+                        (np.dtype(dtype).name, shape))
+    return out
+
+
+def _workspace_array(workspace, size, dtype):
+    """get a scratch array with (at least) size elements
+
+    If workspace is None, a new array is allocated. Otherwise, the first size elements of
+    workspace are used.
+
+    """
+    if workspace is None:
+        return np.empty(size, dtype=dtype)
+    if (not isinstance(workspace, np.ndarray) or workspace.dtype != dtype or
+            not workspace.flags.c_contiguous or not workspace.flags.writeable or
+            workspace.size < size):
+        raise Exception("workspace must be a writeable, C-contiguous %s array with at least %d "
+                        "elements!" % (np.dtype(dtype).name, size))
+    return workspace.reshape(-1)[:size]
+
+
+def _compute_edge_bank(dtype, shape, filt_bytes, edges, r_or_e):
+    """compute the edge-handling filters for a filter, given as bytes
+    """
+    _, clib = _precision(np.empty(0, dtype))
+    filt = np.frombuffer(filt_bytes, dtype=dtype)
+    bank = np.empty((shape[0] + 2) * (shape[1] + 2) * filt.size, dtype=dtype)
+    if clib.internal_edge_bank(filt.ctypes.data, shape[1], shape[0], edges, r_or_e,
+                               bank.ctypes.data) < 0:
+        raise Exception("The C code failed to compute the edge-handling filters!")
+    bank.flags.writeable = False
+    return bank
+
+
+def _cached_edge_bank(*key):
+    """get the edge-handling filters for the arguments of `_compute_edge_bank` from the cache,
+    computing (and caching) them if they're not in it
+    """
+    global _edge_banks_nbytes
+    with _edge_banks_lock:
+        bank = _edge_banks.get(key)
+        if bank is not None:
+            _edge_banks.move_to_end(key)
+            return bank
+    bank = _compute_edge_bank(*key)
+    with _edge_banks_lock:
+        if key not in _edge_banks:
+            _edge_banks[key] = bank
+            _edge_banks_nbytes += bank.nbytes
+            while _edge_banks_nbytes > _EDGE_BANK_CACHE_BYTES:
+                _edge_banks_nbytes -= _edge_banks.popitem(last=False)[1].nbytes
+    return bank
+
+
+def clear_edge_bank_cache():
+    """Free the edge-handling filters cached by `corrDn` and `upConv`.
+
+    Near the borders of the image, the convolutions use filters modified by the edge handling,
+    which are computed once for each filter and edge_type, and cached (up to 32 MB in total, the
+    least recently used being dropped beyond that). This empties the cache, e.g., to free its
+    memory once done with some filters; they're computed again if they're used later.
+
+    """
+    global _edge_banks_nbytes
+    with _edge_banks_lock:
+        _edge_banks.clear()
+        _edge_banks_nbytes = 0
+
+
+def _edge_bank(filt, edge_type, r_or_e):
+    """get the edge-handling filters the C code uses near the borders of the image
+
+    These only depend on the filter, the edge handler and whether we're reducing (r_or_e=0) or
+    expanding (1), so they are cached across calls: building a pyramid uses the same few filters
+    over and over. Returns None (i.e., compute the filters as needed) for filters too large to be
+    worth caching.
+
+    """
+    if (filt.shape[0] + 2) * (filt.shape[1] + 2) * filt.size > _EDGE_BANK_SIZE:
+        return None
+    return _cached_edge_bank(filt.dtype.type, filt.shape, filt.tobytes(), _EDGE_TYPES[edge_type],
+                             r_or_e)
+
+
+def _reduce(image, filt, edge_type, step, start, stop, result, num_threads, workspace=None):
+    """run the C code for corrDn on an (N, H, W) stack of images
+
+    result must be a C-contiguous (N, h, w) array, where (h, w) is the size of the window given by
+    start, step and stop.
+
+    """
+    dtype, clib = _precision(image)
+    if edge_type == 'circular':
+        if clib.internal_wrap_reduce_batch(image.ctypes.data,
+                                           image.shape[0], image.shape[2], image.shape[1],
+                                           filt.ctypes.data,
+                                           filt.shape[1], filt.shape[0],
+                                           start[1], step[1], stop[1], start[0], step[0],
+                                           stop[0],
+                                           result.ctypes.data,
+                                           num_threads) < 0:
+            raise Exception("The C code of corrDn failed (e.g., it couldn't allocate memory)!")
+    else:
+        # each thread needs its own scratch space for the edge-handling filter
+        tmp = _workspace_array(workspace, num_threads * filt.size, dtype)
+        bank = _edge_bank(filt, edge_type, 0)
+        if clib.internal_reduce_batch(image.ctypes.data,
+                                      image.shape[0], image.shape[2], image.shape[1],
+                                      filt.ctypes.data,
+                                      tmp.ctypes.data,
+                                      None if bank is None else bank.ctypes.data,
+                                      filt.shape[1], filt.shape[0],
+                                      start[1], step[1], stop[1], start[0], step[0],
+                                      stop[0],
+                                      result.ctypes.data,
+                                      _EDGE_TYPES[edge_type], num_threads) < 0:
+            raise Exception("The C code of corrDn failed (e.g., it couldn't allocate memory)!")
+
+
+def _expand(image, filt, edge_type, step, start, stop, result, num_threads, workspace=None):
+    """run the C code for upConv on an (N, h, w) stack of images, adding into result
+
+    image must hold the samples of the window given by start, step and stop, and result must be a
+    C-contiguous (N, H, W) array. The window can be smaller than (H, W), which is used to find the
+    edges of the result.
+
+    """
+    dtype, clib = _precision(image)
+    # each thread needs its own scratch space for the edge-handling filter
+    temp = _workspace_array(workspace, num_threads * filt.size, dtype)
+
+    if edge_type == 'circular':
+        if clib.internal_wrap_expand_batch(image.ctypes.data,
+                                           image.shape[0],
+                                           filt.ctypes.data,
+                                           filt.shape[1], filt.shape[0], start[1],
+                                           step[1], stop[1], start[0], step[0], stop[0],
+                                           result.ctypes.data,
+                                           result.shape[2], result.shape[1], num_threads) < 0:
+            raise Exception("The C code of upConv failed (e.g., it couldn't allocate memory)!")
+    else:
+        bank = _edge_bank(filt, edge_type, 1)
+        if clib.internal_expand_batch(image.ctypes.data,
+                                      image.shape[0],
+                                      filt.ctypes.data,
+                                      temp.ctypes.data,
+                                      None if bank is None else bank.ctypes.data,
+                                      filt.shape[1], filt.shape[0], start[1], step[1],
+                                      stop[1], start[0], step[0], stop[0],
+                                      result.ctypes.data,
+                                      result.shape[2], result.shape[1], _EDGE_TYPES[edge_type],
+                                      num_threads) < 0:
+            raise Exception("The C code of upConv failed (e.g., it couldn't allocate memory)!")
+
+
+def _interior_range(start, step, count, fdim, dim):
+    """find the samples of a corrDn / upConv lattice at which the filter is used as is
+
+    Along an axis of length dim, the C code only calls the edge-handling function for the samples
+    at which the filter overhangs (or touches) the edge. For the samples k0 <= k < k1, it
+    correlates (or convolves) with the filter itself, whatever the edge_type, so those can be
+    computed in any other way.
+
+    Returns
+    -------
+    k0, k1 : `int`
+        the interior samples along this axis, 0 <= k0 <= k1 <= count
+
+    """
+    if fdim == 1:
+        lo, hi = 0, dim
+    else:
+        lo, hi = 1, dim - fdim
+    # the first tap of the filter is at start + k*step - fdim//2
+    k0 = min(max(-((start - fdim // 2 - lo) // step), 0), count)
+    k1 = min(max(-((start - fdim // 2 - hi) // step), k0), count)
+    return k0, k1
+
+
+def _edge_windows(y_range, x_range, shape):
+    """split the samples outside of the interior into (at most four) rectangular windows
+
+    Returns a list of ((r0, r1), (c0, c1)) tuples, giving the rows and columns of each window.
+
+    """
+    (k0, k1), (j0, j1) = y_range, x_range
+    windows = [((0, k0), (0, shape[1])), ((k1, shape[0]), (0, shape[1])),
+               ((k0, k1), (0, j0)), ((k0, k1), (j1, shape[1]))]
+    return [w for w in windows if w[0][0] < w[0][1] and w[1][0] < w[1][1]]
+
+
+def _window(start, step, stop, rows, cols):
+    """start and stop of the part of a lattice given by rows and cols"""
+    return ((start[0] + rows[0] * step[0], start[1] + cols[0] * step[1]),
+            (min(start[0] + rows[1] * step[0], stop[0]),
+             min(start[1] + cols[1] * step[1], stop[1])))
+
+
+def _choose_method(method, n_samples, y_range, x_range, filt_size, fft_shape):
+    """decide whether to compute a convolution directly or with FFTs
+
+    The direct computation costs filt_size multiply-adds for each of the n_samples samples, while
+    with FFTs, only the samples outside the interior are computed directly, the rest costing
+    about an FFT (and inverse FFT) of fft_shape.
+
+    """
+    if method not in ['auto', 'direct', 'fft']:
+        raise Exception("method must be one of 'auto', 'direct' or 'fft', but got %s!" % method)
+    if method != 'auto':
+        return method
+    n_interior = (y_range[1] - y_range[0]) * (x_range[1] - x_range[0])
+    direct_cost = n_samples * filt_size
+    # the FFT is at least as large as the interior, which rules it out quickly for small filters
+    if n_interior < 2 or direct_cost <= 2 * _FFT_COST * n_interior * math.log2(n_interior):
+        return 'direct'
+    fft_size = (scipy.fft.next_fast_len(int(fft_shape[0]), real=True) *
+                scipy.fft.next_fast_len(int(fft_shape[1]), real=True))
+    fft_cost = ((n_samples - n_interior) * filt_size +
+                2 * _FFT_COST * fft_size * math.log2(fft_size))
+    return 'fft' if fft_cost < direct_cost else 'direct'
+
+
+def _fft_convolve(image, filt, shape, num_threads):
+    """convolve the last two dimensions of image with filt, using FFTs of (at least) shape
+
+    The convolution is circular: samples beyond shape wrap around.
+
+    """
+    shape = [scipy.fft.next_fast_len(int(n), real=True) for n in shape]
+    image_dft = scipy.fft.rfft2(image, shape, workers=num_threads)
+    image_dft *= scipy.fft.rfft2(filt, shape, workers=num_threads)
+    return scipy.fft.irfft2(image_dft, shape, workers=num_threads)
+
+
+def _fft_reduce(image, filt, edge_type, step, start, stop, result, y_range, x_range,
+                num_threads, workspace=None):
+    """corrDn of an (N, H, W) stack of images, with FFTs in the interior
+
+    The interior samples (see `_interior_range`) are computed with an FFT-based correlation of
+    the part of the image they cover, and the samples near the edges with the C code, so that the
+    result is the same as that of `_reduce`, for all edge_types.
+
+    """
+    (k0, k1), (j0, j1) = y_range, x_range
+    fy, fx = filt.shape
+    if k0 < k1 and j0 < j1:
+        # the part of the image covered by the filter at the interior samples
+        y0 = start[0] + k0 * step[0] - fy // 2
+        x0 = start[1] + j0 * step[1] - fx // 2
+        y1 = start[0] + (k1 - 1) * step[0] - fy // 2 + fy
+        x1 = start[1] + (j1 - 1) * step[1] - fx // 2 + fx
+        # correlation is convolution with the flipped filter, whose first fully overlapping
+        # sample is at (fy-1, fx-1)
+        corr = _fft_convolve(image[:, y0:y1, x0:x1], filt[::-1, ::-1], (y1 - y0, x1 - x0),
+                             num_threads)
+        result[:, k0:k1, j0:j1] = corr[:, fy-1:y1-y0:step[0], fx-1:x1-x0:step[1]]
+
+    for rows, cols in _edge_windows(y_range, x_range, result.shape[1:]):
+        win_start, win_stop = _window(start, step, stop, rows, cols)
+        win = np.empty((result.shape[0], rows[1] - rows[0], cols[1] - cols[0]), result.dtype)
+        _reduce(image, filt, edge_type, step, win_start, win_stop, win, num_threads, workspace)
+        result[:, rows[0]:rows[1], cols[0]:cols[1]] = win
+
+
+def _fft_expand(image, filt, edge_type, step, start, stop, result, y_range, x_range,
+                num_threads, workspace=None):
+    """upConv of an (N, h, w) stack of images, with FFTs in the interior
+
+    The contributions of the interior samples (see `_interior_range`) are computed with an
+    FFT-based convolution, and those of the samples near the edges with the C code, so that the
+    result is the same as that of `_expand`, for all edge_types. Unlike `_expand`, this overwrites
+    result.
+
+    """
+    (k0, k1), (j0, j1) = y_range, x_range
+    fy, fx = filt.shape
+    if k0 < k1 and j0 < j1:
+        upsampled = np.zeros(result.shape, result.dtype)
+        upsampled[:, start[0]+k0*step[0]:start[0]+(k1-1)*step[0]+1:step[0],
+                  start[1]+j0*step[1]:start[1]+(j1-1)*step[1]+1:step[1]] = image[:, k0:k1, j0:j1]
+        # the filter never overhangs the edges here, so nothing wraps around in an FFT that's
+        # larger than the result by the filter's origin
+        conv = _fft_convolve(upsampled, filt, (result.shape[1] + fy // 2,
+                                               result.shape[2] + fx // 2), num_threads)
+        result[...] = conv[:, fy//2:fy//2+result.shape[1], fx//2:fx//2+result.shape[2]]
+    else:
+        result.fill(0)
 
-def corrDn(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=None):
+    for rows, cols in _edge_windows(y_range, x_range, image.shape[1:]):
+        win_start, win_stop = _window(start, step, stop, rows, cols)
+        win = np.ascontiguousarray(image[:, rows[0]:rows[1], cols[0]:cols[1]])
+        _expand(win, filt, edge_type, step, win_start, win_stop, result, num_threads, workspace)
+
+
+def corrDn(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=None,
+           num_threads=None, out=None, workspace=None, method='auto'):
     """Compute correlation of image with filt, followed by downsampling.
 
     These arguments should be 1D or 2D arrays, and image must be larger (in both dimensions) than
     filt.  The origin of filt is assumed to be floor(size(filt)/2)+1.
 
+    image can also be a 3D array of shape (N, H, W), in which case it is treated as a stack of N
+    images, each of which is correlated with the same filt. This is done in a single call to the C
+    code, which is much faster than looping over the images when they are small.
+
+    Large convolutions can be split across several threads (see `num_threads` and
+    `set_num_threads`). The GIL is released while the C code runs.
+
+    If image is a float32 array, the computation is done in single precision and the result is
+    float32 as well, which halves memory use. Otherwise, it is done in double precision (float64).
+
+    C-contiguous arrays of the right precision are passed to the C code without being copied. To
+    avoid allocating memory on every call (e.g., when building many pyramids of the same size),
+    the result can be written into an existing array (`out`) and the scratch space can be passed
+    in as well (`workspace`).
+
+    For large filters, the samples at which the filter doesn't overhang the edges of the image can
+    be computed more quickly using FFTs; the samples near the edges are always computed directly,
+    so the result is the same (up to floating-point rounding) whatever the edge_type. By default
+    (`method='auto'`), whichever of the two should be faster is used.
+
     Downsampling factors are determined by step (optional, default=(1, 1)), which should be a
     2-tuple (y, x).
 
@@ -43,7 +519,8 @@ def corrDn(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=No
     Arguments
     ---------
     image : `array_like`
-        1d or 2d array containing the image to correlate and downsample.
+        1d or 2d array containing the image to correlate and downsample, or 3d array of shape
+        (N, H, W) containing a stack of N such images.
     filt : `array_like`
         1d or 2d array containing the filter to use for correlation and downsampling.
     edge_type : {'circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'dont-compute'}
@@ -63,61 +540,90 @@ def corrDn(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=No
     start : `tuple` or None
         2-tuple which specifies the end of the window over which we perform the convolution. If
         None, perform convolution over the whole image
+    num_threads : `int` or None
+        number of threads to split the computation across. If None, use the value set by
+        `set_num_threads` (1 by default). The result does not depend on the number of threads.
+    out : `np.array` or None
+        C-contiguous array, with the shape and precision of the result, to write the result into.
+        It must not overlap with image. If None, a new array is allocated.
+    workspace : `np.array` or None
+        C-contiguous array of the same precision as the result, with at least
+        ``num_threads * filt.size`` elements, to use as scratch space. Its contents are overwritten.
+        If None, a new array is allocated.
+    method : {'auto', 'direct', 'fft'}
+        how to compute the correlation. 'direct' computes each sample of the result as a sum of
+        products, 'fft' computes the samples away from the edges with FFTs, and 'auto' picks
+        whichever of the two should be faster, based on the sizes of the image and filter.
 
     Returns
     -------
     result : `np.array`
-        the correlated and downsampled array
+        the correlated and downsampled array. If image was 3d, this is 3d as well, with the same
+        number of images.
 
     """
-    image = image.copy().astype(float)
-    filt = filt.copy().astype(float)
+    dtype = _precision(image)[0]
+    image = np.ascontiguousarray(image, dtype=dtype)
+    filt = np.ascontiguousarray(filt, dtype=dtype)
+
+    if image.ndim == 3:
+        n_images = image.shape[0]
+        image_shape = image.shape[1:]
+    else:
+        n_images = 1
+        image_shape = image.shape
 
-    if image.shape[0] < filt.shape[0] or image.shape[1] < filt.shape[1]:
-        raise Exception("Signal smaller than filter in corresponding dimension: ", image.shape, filt.shape, " see parse filter")
+    if image_shape[0] < filt.shape[0] or image_shape[1] < filt.shape[1]:
+        raise Exception("Signal smaller than filter in corresponding dimension: ", image_shape, filt.shape, " see parse filter")
 
-    if edge_type not in ['circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'dont-compute']:
+    if edge_type not in _EDGE_TYPES:
         raise Exception("Don't know how to do convolution with edge_type %s!" % edge_type)
 
     if filt.ndim == 1:
         filt = filt.reshape(1, -1)
 
     if stop is None:
-        stop = (image.shape[0], image.shape[1])
+        stop = (image_shape[0], image_shape[1])
 
     rxsz = len(range(start[0], stop[0], step[0]))
     rysz = len(range(start[1], stop[1], step[1]))
-    result = np.zeros((rxsz, rysz))
-
-    if edge_type == 'circular':
-        lib.internal_wrap_reduce(image.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                                 image.shape[1], image.shape[0],
-                                 filt.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                                 filt.shape[1], filt.shape[0],
-                                 start[1], step[1], stop[1], start[0], step[0],
-                                 stop[0],
-                                 result.ctypes.data_as(ctypes.POINTER(ctypes.c_double)))
+    # every sample of the result is written by the C code, so it doesn't need to be zeroed
+    result = _result_array(out, image.shape[:-2] + (rxsz, rysz), dtype)
+    num_threads = _check_num_threads(num_threads)
+
+    # work on stacks of images from here on
+    image = image.reshape((n_images,) + tuple(image_shape))
+    result_3d = result.reshape((n_images, rxsz, rysz))
+    y_range = _interior_range(start[0], step[0], rxsz, filt.shape[0], image_shape[0])
+    x_range = _interior_range(start[1], step[1], rysz, filt.shape[1], image_shape[1])
+    fft_shape = ((y_range[1] - y_range[0] - 1) * step[0] + filt.shape[0],
+                 (x_range[1] - x_range[0] - 1) * step[1] + filt.shape[1])
+    if _choose_method(method, rxsz * rysz, y_range, x_range, filt.size, fft_shape) == 'fft':
+        _fft_reduce(image, filt, edge_type, step, start, stop, result_3d, y_range, x_range,
+                    num_threads, workspace)
     else:
-        tmp = np.zeros((filt.shape[0], filt.shape[1]))
-        lib.internal_reduce(image.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            image.shape[1], image.shape[0],
-                            filt.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            tmp.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            filt.shape[1], filt.shape[0],
-                            start[1], step[1], stop[1], start[0], step[0],
-                            stop[0],
-                            result.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            edge_type.encode('ascii'))
+        _reduce(image, filt, edge_type, step, start, stop, result_3d, num_threads, workspace)
 
     return result
 
 
-def upConv(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=None):
+def upConv(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=None,
+           num_threads=None, out=None, workspace=None, method='auto'):
     """Upsample matrix image, followed by convolution with matrix filt.
 
     These arguments should be 1D or 2D matrices, and image must be larger (in both dimensions) than
     filt.  The origin of filt is assumed to be floor(size(filt)/2)+1.
 
+    As with `corrDn`, image can also be a 3D array of shape (N, H, W), in which case each of the N
+    images is upsampled and convolved with filt, in a single call to the C code.
+
+    If image is a float32 array, the computation is done in single precision and the result is
+    float32 as well, which halves memory use. Otherwise, it is done in double precision (float64).
+
+    As with `corrDn`, inputs are not copied when they don't need to be, and the result and scratch
+    space can be passed in (`out` and `workspace`), and large filters are applied using FFTs
+    (see `method`).
+
     Upsampling factors are determined by step (optional, default=(1, 1)),
     a 2-tuple (y, x).
 
@@ -136,7 +642,8 @@ def upConv(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=No
     Arguments
     ---------
     image : `array_like`
-        1d or 2d array containing the image to upsample and convolve.
+        1d or 2d array containing the image to upsample and convolve, or 3d array of shape
+        (N, H, W) containing a stack of N such images.
     filt : `array_like`
         1d or 2d array containing the filter to use for upsampling and convolution.
     edge_type : {'circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'dont-compute'}
@@ -156,26 +663,46 @@ def upConv(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=No
     start : `tuple` or None
         2-tuple which specifies the end of the window over which we perform the convolution. If
         None, perform convolution over the whole image
+    num_threads : `int` or None
+        number of threads to split the computation across. If None, use the value set by
+        `set_num_threads` (1 by default). The result does not depend on the number of threads.
+    out : `np.array` or None
+        C-contiguous array, with the shape and precision of the result, to write the result into.
+        It must not overlap with image. If None, a new array is allocated.
+    workspace : `np.array` or None
+        C-contiguous array of the same precision as the result, with at least
+        ``num_threads * (filt.size + 1)`` elements, to use as scratch space. Its contents are
+        overwritten. If None, a new array is allocated.
+    method : {'auto', 'direct', 'fft'}
+        how to compute the convolution, see `corrDn`.
 
     Returns
     -------
     result : `np.array`
-        the correlated and downsampled array
+        the upsampled and convolved array. If image was 3d, this is 3d as well, with the same
+        number of images.
 
     """
-    image = image.copy().astype(float)
-    filt = filt.copy().astype(float)
+    dtype = _precision(image)[0]
+    image = np.ascontiguousarray(image, dtype=dtype)
+    filt = np.ascontiguousarray(filt, dtype=dtype)
 
     if image.ndim == 1:
         image = image.reshape(-1, 1)
 
-    image_shape = (image.shape[0] * step[0], image.shape[1] * step[1])
+    if image.ndim == 3:
+        n_images = image.shape[0]
+        image_shape = image.shape[1:]
+    else:
+        n_images = 1
+        image_shape = image.shape
 
-    if image_shape[0] < filt.shape[0] or image_shape[1] < filt.shape[1]:
-        raise Exception("Signal smaller than filter in corresponding dimension: ", image_shape, filt.shape, " see parse filter")
+    upsampled_shape = (image_shape[0] * step[0], image_shape[1] * step[1])
+
+    if upsampled_shape[0] < filt.shape[0] or upsampled_shape[1] < filt.shape[1]:
+        raise Exception("Signal smaller than filter in corresponding dimension: ", upsampled_shape, filt.shape, " see parse filter")
 
-    if edge_type not in ['circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend',
-                         'dont-compute']:
+    if edge_type not in _EDGE_TYPES:
         raise Exception("Don't know how to do convolution with edge_type %s!" % edge_type)
 
     # from upConv.c, the c code that gets compiled in the matlab version: upConv has a bug for
@@ -183,51 +710,268 @@ def upConv(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=No
     if ((edge_type in ["reflect1", "extend", "repeat"]) and
             (filt.shape[0] % 2 == 0 or filt.shape[1] % 2 == 0)):
         if filt.shape[1] == 1:
-            filt = np.append(filt, 0.0)
+            filt = np.append(filt, dtype(0))
             filt = np.reshape(filt, (len(filt), 1))
         elif filt.shape[0] == 1:
-            filt = np.append(filt, 0.0)
+            filt = np.append(filt, dtype(0))
             filt = np.reshape(filt, (1, len(filt)))
         else:
             raise Exception('Even sized 2D filters not yet supported by upConv.')
 
     if stop is None:
-        stop = [imshape_d * step_d for imshape_d, step_d in zip(image.shape, step)]
+        stop = [imshape_d * step_d for imshape_d, step_d in zip(image_shape, step)]
+
+    result = _result_array(out, image.shape[:-2] + (stop[0], stop[1]), dtype)
+    num_threads = _check_num_threads(num_threads)
+
+    # work on stacks of images from here on
+    image = image.reshape((n_images,) + tuple(image_shape))
+    result_3d = result.reshape((n_images, stop[0], stop[1]))
+    # the C code reads the samples of each image in order, one per point of the upsampling
+    # lattice, whose shape differs from the image's if start or stop are set: give it (and the
+    # FFT path) images of the lattice's shape
+    lattice = (len(range(start[0], stop[0], step[0])), len(range(start[1], stop[1], step[1])))
+    if lattice != tuple(image_shape):
+        if lattice[0] * lattice[1] > image_shape[0] * image_shape[1]:
+            raise Exception("The upsampling lattice (%d, %d) has more points than the image has"
+                            " samples!" % lattice)
+        image = image.reshape((n_images, -1))[:, :lattice[0] * lattice[1]]
+        image = np.ascontiguousarray(image).reshape((n_images,) + lattice)
+    y_range = _interior_range(start[0], step[0], lattice[0], filt.shape[0], stop[0])
+    x_range = _interior_range(start[1], step[1], lattice[1], filt.shape[1], stop[1])
+    fft_shape = (stop[0] + filt.shape[0] // 2, stop[1] + filt.shape[1] // 2)
+    if _choose_method(method, lattice[0] * lattice[1], y_range, x_range, filt.size,
+                      fft_shape) == 'fft':
+        _fft_expand(image, filt, edge_type, step, start, stop, result_3d, y_range, x_range,
+                    num_threads, workspace)
+    else:
+        # the C code adds into the result, so it must start out zeroed
+        result.fill(0)
+        _expand(image, filt, edge_type, step, start, stop, result_3d, num_threads, workspace)
 
-    result = np.zeros((stop[1], stop[0]))
+    return result
 
-    temp = np.zeros((filt.shape[1], filt.shape[0]))
 
-    if edge_type == 'circular':
-        lib.internal_wrap_expand(image.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                                 filt.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                                 filt.shape[1], filt.shape[0], start[1],
-                                 step[1], stop[1], start[0], step[0], stop[0],
-                                 result.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                                 stop[1], stop[0])
+def sepCorrDn(image, filt_y, filt_x, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=None,
+              num_threads=None, out=None, workspace=None):
+    """Compute correlation of image with a separable filter, followed by downsampling.
+
+    This gives the same result as correlating with the column filter filt_y and then with the row
+    filter filt_x (i.e., ``corrDn(corrDn(image, filt_y, edge_type, (step[0], 1), (start[0], 0),
+    (stop[0], image.shape[1])), filt_x.T, edge_type, (1, step[1]), (0, start[1]), stop)``), but both
+    passes are done in a single call to the C code, one row at a time, without allocating the
+    intermediate array. This is faster than either the two calls or a single call to `corrDn` with
+    the outer product of the two filters.
+
+    As with `corrDn`, image can also be a 3D array of shape (N, H, W), in which case each of the N
+    images is correlated with the filters, and the computation can be split across several threads.
+
+    If image is a float32 array, the computation is done in single precision and the result is
+    float32 as well, which halves memory use. Otherwise, it is done in double precision (float64).
+    As with `corrDn`, the result and scratch space can be passed in (`out` and `workspace`).
+
+    Arguments
+    ---------
+    image : `array_like`
+        2d array containing the image to correlate and downsample, or 3d array of shape (N, H, W)
+        containing a stack of N such images.
+    filt_y : `array_like`
+        1d array (or 2d array with a single row or column) containing the filter to correlate with
+        along the first (y) dimension.
+    filt_x : `array_like`
+        1d array (or 2d array with a single row or column) containing the filter to correlate with
+        along the second (x) dimension.
+    edge_type : {'circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'dont-compute'}
+        Specifies how to handle edges, see `corrDn`.
+    step : `tuple`
+        2-tuple (y, x) which determines the downsampling factor
+    start : `tuple`
+        2-tuple which specifies the start of the window over which we perform the convolution
+    stop : `tuple` or None
+        2-tuple which specifies the end of the window over which we perform the convolution. If
+        None, perform convolution over the whole image
+    num_threads : `int` or None
+        number of threads to split the computation across. If None, use the value set by
+        `set_num_threads` (1 by default). The result does not depend on the number of threads.
+    out : `np.array` or None
+        C-contiguous array, with the shape and precision of the result, to write the result into.
+        It must not overlap with image. If None, a new array is allocated.
+    workspace : `np.array` or None
+        C-contiguous array of the same precision as the result, with at least
+        ``num_threads * image.shape[-1]`` elements, to use as scratch space. Its contents are overwritten.
+        If None, a new array is allocated.
+
+    Returns
+    -------
+    result : `np.array`
+        the correlated and downsampled array. If image was 3d, this is 3d as well, with the same
+        number of images.
+
+    """
+    dtype, clib = _precision(image)
+    image = np.ascontiguousarray(image, dtype=dtype)
+    filt_y = np.ascontiguousarray(filt_y, dtype=dtype).ravel()
+    filt_x = np.ascontiguousarray(filt_x, dtype=dtype).ravel()
+
+    if image.ndim == 3:
+        n_images = image.shape[0]
+        image_shape = image.shape[1:]
     else:
-        lib.internal_expand(image.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            filt.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            temp.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            filt.shape[1], filt.shape[0], start[1], step[1],
-                            stop[1], start[0], step[0], stop[0],
-                            result.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            stop[1], stop[0], edge_type.encode('ascii'))
-    result = np.reshape(result, stop)
+        n_images = 1
+        image_shape = image.shape
+
+    if image_shape[0] < filt_y.size or image_shape[1] < filt_x.size:
+        raise Exception("Signal smaller than filter in corresponding dimension: ", image_shape, (filt_y.size, filt_x.size), " see parse filter")
+
+    if edge_type not in _EDGE_TYPES:
+        raise Exception("Don't know how to do convolution with edge_type %s!" % edge_type)
+
+    if stop is None:
+        stop = (image_shape[0], image_shape[1])
+
+    rxsz = len(range(start[0], stop[0], step[0]))
+    rysz = len(range(start[1], stop[1], step[1]))
+    result = _result_array(out, image.shape[:-2] + (rxsz, rysz), dtype)
+    num_threads = _check_num_threads(num_threads)
+
+    # one row buffer per thread
+    tmp = _workspace_array(workspace, num_threads * image_shape[1], dtype)
+    if clib.internal_sep_reduce_batch(image.ctypes.data,
+                                      n_images, image_shape[1], image_shape[0],
+                                      filt_x.ctypes.data,
+                                      filt_x.size,
+                                      filt_y.ctypes.data,
+                                      filt_y.size,
+                                      tmp.ctypes.data,
+                                      start[1], step[1], stop[1], start[0], step[0], stop[0],
+                                      result.ctypes.data,
+                                      _EDGE_TYPES[edge_type], num_threads) < 0:
+        raise Exception("The C code of sepCorrDn failed (e.g., it couldn't allocate memory)!")
 
     return result
 
 
-def pointOp(image, lut, origin, increment, warnings=False):
+def sepUpConv(image, filt_y, filt_x, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=None,
+              num_threads=None, out=None, workspace=None):
+    """Upsample image, followed by convolution with a separable filter.
+
+    This gives the same result as upsampling and convolving with the column filter filt_y and then
+    with the row filter filt_x (i.e., ``upConv(upConv(image, filt_y, edge_type, (step[0], 1),
+    (start[0], 0), (stop[0], image.shape[1])), filt_x.T, edge_type, (1, step[1]), (0, start[1]),
+    stop)``), but both passes are done in a single call to the C code, one row at a time, without
+    allocating the intermediate array.
+
+    As with `upConv`, image can also be a 3D array of shape (N, H, W), in which case each of the N
+    images is upsampled and convolved with the filters.
+
+    If image is a float32 array, the computation is done in single precision and the result is
+    float32 as well, which halves memory use. Otherwise, it is done in double precision (float64).
+    As with `upConv`, the result and scratch space can be passed in (`out` and `workspace`).
+
+    Arguments
+    ---------
+    image : `array_like`
+        2d array containing the image to upsample and convolve, or 3d array of shape (N, H, W)
+        containing a stack of N such images.
+    filt_y : `array_like`
+        1d array (or 2d array with a single row or column) containing the filter to convolve with
+        along the first (y) dimension.
+    filt_x : `array_like`
+        1d array (or 2d array with a single row or column) containing the filter to convolve with
+        along the second (x) dimension.
+    edge_type : {'circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'dont-compute'}
+        Specifies how to handle edges, see `upConv`.
+    step : `tuple`
+        2-tuple (y, x) which determines the upsampling factor
+    start : `tuple`
+        2-tuple which specifies the start of the window over which we perform the convolution.
+    stop : `tuple` or None
+        2-tuple which specifies the end of the window over which we perform the convolution. If
+        None, perform convolution over the whole image
+    num_threads : `int` or None
+        number of threads to split the computation across. If None, use the value set by
+        `set_num_threads` (1 by default). The result does not depend on the number of threads.
+    out : `np.array` or None
+        C-contiguous array, with the shape and precision of the result, to write the result into.
+        It must not overlap with image. If None, a new array is allocated.
+    workspace : `np.array` or None
+        C-contiguous array of the same precision as the result, with at least
+        ``num_threads * stop[1]`` elements, to use as scratch space. Its contents are overwritten.
+        If None, a new array is allocated.
+
+    Returns
+    -------
+    result : `np.array`
+        the upsampled and convolved array. If image was 3d, this is 3d as well, with the same
+        number of images.
+
+    """
+    dtype, clib = _precision(image)
+    image = np.ascontiguousarray(image, dtype=dtype)
+    filt_y = np.ascontiguousarray(filt_y, dtype=dtype).ravel()
+    filt_x = np.ascontiguousarray(filt_x, dtype=dtype).ravel()
+
+    if image.ndim == 3:
+        n_images = image.shape[0]
+        image_shape = image.shape[1:]
+    else:
+        n_images = 1
+        image_shape = image.shape
+
+    upsampled_shape = (image_shape[0] * step[0], image_shape[1] * step[1])
+
+    if upsampled_shape[0] < filt_y.size or upsampled_shape[1] < filt_x.size:
+        raise Exception("Signal smaller than filter in corresponding dimension: ", upsampled_shape, (filt_y.size, filt_x.size), " see parse filter")
+
+    if edge_type not in _EDGE_TYPES:
+        raise Exception("Don't know how to do convolution with edge_type %s!" % edge_type)
+
+    # same work-around as in upConv for even-length kernels
+    if edge_type in ["reflect1", "extend", "repeat"]:
+        if filt_y.size % 2 == 0:
+            filt_y = np.append(filt_y, dtype(0))
+        if filt_x.size % 2 == 0:
+            filt_x = np.append(filt_x, dtype(0))
+
+    if stop is None:
+        stop = [imshape_d * step_d for imshape_d, step_d in zip(image_shape, step)]
+
+    # the C code adds into the result, so it must start out zeroed
+    result = _result_array(out, image.shape[:-2] + (stop[0], stop[1]), dtype)
+    result.fill(0)
+    num_threads = _check_num_threads(num_threads)
+
+    # one row buffer per thread
+    temp = _workspace_array(workspace, num_threads * stop[1], dtype)
+    if clib.internal_sep_expand_batch(image.ctypes.data,
+                                      n_images,
+                                      filt_x.ctypes.data,
+                                      filt_x.size,
+                                      filt_y.ctypes.data,
+                                      filt_y.size,
+                                      temp.ctypes.data,
+                                      start[1], step[1], stop[1], start[0], step[0], stop[0],
+                                      result.ctypes.data,
+                                      stop[1], stop[0], _EDGE_TYPES[edge_type], num_threads) < 0:
+        raise Exception("The C code of sepUpConv failed (e.g., it couldn't allocate memory)!")
+
+    return result
+
+
+def pointOp(image, lut, origin, increment, warnings=False, num_threads=None, out=None):
     """Apply a point operation, specified by lookup table `lut`, to `image`
 
     This function is very fast and allows extrapolation beyond the lookup table domain.  The
     drawbacks are that the lookup table must be equi-spaced, and the interpolation is linear.
 
+    The lookups are vectorized (when the cpu supports it) and, for large images, split across
+    threads. float32 images give a float32 result (the interpolation itself is always done in
+    double precision), everything else a float64 one.
+
     Arguments
     ---------
     image : `array_like`
-        1d or 2d array
+        array of any shape. Non-contiguous arrays are copied first.
     lut : `array_like`
         a row or column vector, assumed to contain (equi-spaced) samples of the function.
     origin : `float`
@@ -236,20 +980,30 @@ def pointOp(image, lut, origin, increment, warnings=False):
         specifies the spacing between samples.
     warnings : `bool`
         whether to print a warning whenever the lookup table is extrapolated
+    num_threads : `int` or None
+        number of threads to split the computation across. If None, use the value set by
+        `set_num_threads` (1 by default). The result does not depend on the number of threads.
+    out : `np.array` or None
+        C-contiguous array, with the shape of image and the precision of the result, to write the
+        result into. It can be image itself (if that has the right precision). If None, a new
+        array is allocated.
+
+    Returns
+    -------
+    result : `np.array`
+        the interpolated values, with the same shape as image
 
     """
-    result = np.empty_like(image)
-    # this way we can use python booleans when calling
-    if warnings:
-        warnings = 1
-    else:
-        warnings = 0
-    lib.internal_pointop(image.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                         result.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                         image.shape[0] * image.shape[1],
-                         lut.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                         lut.shape[0],
-                         ctypes.c_double(origin),
-                         ctypes.c_double(increment), warnings)
-
-    return np.array(result)
+    dtype, clib = _precision(image)
+    image = np.ascontiguousarray(image, dtype=dtype)
+    lut = np.ascontiguousarray(lut, dtype=np.float64).ravel()
+    if lut.size < 2:
+        raise Exception("lut must have at least 2 samples!")
+    result = _result_array(out, image.shape, dtype)
+    num_threads = _check_num_threads(num_threads)
+
+    clib.internal_pointop(image.ctypes.data, result.ctypes.data, image.size,
+                          lut.ctypes.data, lut.size,
+                          float(origin), float(increment), int(bool(warnings)), num_threads)
+
+    return result
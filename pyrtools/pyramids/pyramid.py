@@ -1,3 +1,6 @@
+import collections.abc
+import json
+import zlib
 import numpy as np
 import warnings
 from .pyr_utils import max_pyr_height
@@ -5,6 +8,171 @@ from .filters import named_filter
 from .steer import steer
 
 
+def _vector_views(vector, index):
+    """the coefficients laid out in the last dimension of `vector` according to `index` (the
+    (offset, shape, is_complex) of each, see `Pyramid.to_vector`), as views into it
+    """
+    complex_dtype = np.result_type(vector.dtype, np.complex64)
+    lead = vector.shape[:-1]
+    views = {}
+    for k, (offset, shape, is_complex) in index.items():
+        size = int(np.prod(shape, dtype=int))
+        if is_complex:
+            coeff = vector[..., offset:offset + 2*size].view(complex_dtype)
+        else:
+            coeff = vector[..., offset:offset + size]
+        views[k] = coeff.reshape(lead + tuple(shape))
+    return views
+
+
+# the file format of `Pyramid.save`: a magic string, the version of the format and the length of
+# the (json) header, the header, and the buffers of the arrays, each aligned (for memory-mapping)
+_SAVE_MAGIC = b'PYRTOOLS'
+_SAVE_VERSION = 1
+_SAVE_ALIGN = 64
+# the attributes not saved as they are: the coefficients (saved as their vector), and their views
+_SAVE_EXCLUDE = ['pyr_coeffs', 'pyr_coeffs_dft', '_coeffs_vector', '_coeffs_index', '_coeffs_views']
+
+
+def _aligned(offset):
+    return -(-offset // _SAVE_ALIGN) * _SAVE_ALIGN
+
+
+def _encode(value, arrays):
+    """encode the attribute `value` of a pyramid in json, the arrays it contains being replaced by
+    their index in `arrays` (where they're added)
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.dtype):
+        return {'dtype': value.str}
+    if isinstance(value, np.ndarray):
+        arrays.append(value)
+        return {'array': len(arrays) - 1}
+    if isinstance(value, tuple):
+        return {'tuple': [_encode(v, arrays) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v, arrays) for v in value]
+    if isinstance(value, dict):
+        return {'dict': [[_encode(k, arrays), _encode(v, arrays)] for k, v in value.items()]}
+    raise Exception("Can't save a value of type %s!" % type(value))
+
+
+def _decode(value, arrays):
+    """the inverse of `_encode`
+    """
+    if isinstance(value, list):
+        return [_decode(v, arrays) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if 'dtype' in value:
+        return np.dtype(value['dtype'])
+    if 'array' in value:
+        return arrays[value['array']]
+    if 'tuple' in value:
+        return tuple(_decode(v, arrays) for v in value['tuple'])
+    return {_decode(k, arrays): _decode(v, arrays) for k, v in value['dict']}
+
+
+def _subclasses(cls):
+    for sub in cls.__subclasses__():
+        yield sub
+        yield from _subclasses(sub)
+
+
+class _LazyCoeffs(collections.abc.MutableMapping):
+    """the coefficients of a pyramid built lazily (see `Pyramid._build`)
+
+    The keys are known from the start, but the levels are only built (by the pyramid's
+    `_build_levels` generator, which keeps the state of the construction, e.g., the running
+    lowpass, between them) when a coefficient of theirs, or one of a coarser level, is first
+    accessed. Assigned coefficients replace the built ones. If not `keep_image`, the pyramid's
+    image is dropped once all the levels are built.
+    """
+    def __init__(self, pyr, keep_image=True):
+        self._pyr = pyr
+        self._keep_image = keep_image
+        self._keys = pyr._coeffs_keys()
+        self._levels = pyr._build_levels()
+        self._built = {}
+        self._assigned = {}
+        self.sizes = _LazySizes(self)
+
+    def _build(self, key):
+        """build the levels, until that of `key`
+        """
+        pyr = self._pyr
+        while key not in self._built and self._levels is not None:
+            # the builder stores the coefficients and their sizes in the pyramid's attributes
+            coeffs, sizes = pyr.pyr_coeffs, pyr.pyr_size
+            pyr.pyr_coeffs, pyr.pyr_size = self._built, self.sizes._sizes
+            try:
+                next(self._levels)
+            except StopIteration:
+                pass
+            finally:
+                pyr.pyr_coeffs, pyr.pyr_size = coeffs, sizes
+            if self._built.keys() >= set(pyr._coeffs_keys()):
+                # all the levels are built: drop the state of the construction
+                self._levels.close()
+                self._levels = None
+                if not self._keep_image:
+                    pyr.image = None
+
+    def __getitem__(self, key):
+        if key in self._assigned:
+            return self._assigned[key]
+        if key not in self._keys:
+            raise KeyError(key)
+        self._build(key)
+        return self._built[key]
+
+    def __setitem__(self, key, coeff):
+        if key not in self._keys:
+            self._keys.append(key)
+        self._assigned[key] = coeff
+
+    def __delitem__(self, key):
+        self._keys.remove(key)
+        self._assigned.pop(key, None)
+        self._built.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class _LazySizes(collections.abc.Mapping):
+    """the sizes of the coefficients of a pyramid built lazily, known once they're built
+    """
+    def __init__(self, coeffs):
+        self._coeffs = coeffs
+        self._sizes = {}
+
+    def __getitem__(self, key):
+        if key not in self._sizes:
+            self._coeffs._build(key)
+        if key not in self._sizes and key in self._coeffs:
+            self._sizes[key] = np.shape(self._coeffs[key])[-2:]
+        return self._sizes[key]
+
+    def __contains__(self, key):
+        return key in self._coeffs
+
+    def __iter__(self):
+        return iter(self._coeffs)
+
+    def __len__(self):
+        return len(self._coeffs)
+
+
 class Pyramid:
     """Base class for multiscale pyramids
 
@@ -25,43 +193,320 @@ class Pyramid:
         * `'zero'` - assume values of zero outside image boundary
         * `'extend'` - reflect and invert
         * `'dont-compute'` - zero output when filter overhangs imput boundaries.
+    dtype : {np.float64, np.float32}
+        Floating-point precision in which to build the pyramid and store its coefficients. float32
+        halves memory use, at the cost of precision.
 
     Attributes
     ----------
-    image : `array_like`
-        The input image used to construct the pyramid.
+    image : `array_like` or None
+        The input image used to construct the pyramid, or None if it wasn't kept.
     image_size : `tuple`
         The size of the input image.
+    batch_shape : `tuple`
+        The shape of the leading (batch) dimensions of the input, for pyramids that can be built
+        on a batch of images at once (see `SteerablePyramidFreq`). Empty otherwise.
     pyr_type : `str` or `None`
         Human-readable string specifying the type of pyramid. For base class, is None.
     edge_type : `str`
         Specifies how edges were handled.
     pyr_coeffs : `dict`
         Dictionary containing the coefficients of the pyramid. Keys are `(level, band)` tuples and
-        values are 1d or 2d numpy arrays (same number of dimensions as the input image)
+        values are 1d or 2d numpy arrays (same number of dimensions as the input image). Once the
+        pyramid is built, they are views into a single buffer, see `to_vector`.
     pyr_size : `dict`
         Dictionary containing the sizes of the pyramid coefficients. Keys are `(level, band)`
         tuples and values are tuples.
     is_complex : `bool`
         Whether the coefficients are complex- or real-valued. Only `SteerablePyramidFreq` can have
         a value of True, all others must be False.
+    dtype : `np.dtype`
+        The floating-point precision of the pyramid.
     """
+    # whether the pyramid can be built on a batch of images, stacked along leading dimensions
+    _batched = False
 
-    def __init__(self, image, edge_type):
+    def __init__(self, image, edge_type, dtype=np.float64):
 
-        self.image = np.array(image).astype(float)
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in [np.float32, np.float64]:
+            raise Exception("dtype must be np.float32 or np.float64, but got %s!" % self.dtype)
+        self.image = np.asarray(image).astype(self.dtype)
         if self.image.ndim == 1:
             self.image = self.image.reshape(-1, 1)
-        assert self.image.ndim == 2, "Error: Input signal must be 1D or 2D."
+        if self._batched:
+            assert self.image.ndim >= 2, "Error: Input signal must be at least 2D."
+        else:
+            assert self.image.ndim == 2, "Error: Input signal must be 1D or 2D."
 
-        self.image_size = self.image.shape
+        self.image_size = self.image.shape[-2:]
+        self.batch_shape = self.image.shape[:-2]
         if not hasattr(self, 'pyr_type'):
             self.pyr_type = None
         self.edge_type = edge_type
         self.pyr_coeffs = {}
         self.pyr_size = {}
         self.is_complex = False
+        # the buffer the coefficients are packed into (see `to_vector`), the (offset, shape,
+        # is_complex) of each in it, and the views of it that `pyr_coeffs` held when packed
+        self._coeffs_vector = None
+        self._coeffs_index = None
+        self._coeffs_views = None
+
+    def _coeffs_layout(self):
+        """the layout of the coefficients in a vector (see `to_vector`): the (offset, shape,
+        is_complex) of each, in the order of `pyr_coeffs`, and the length of the vector
+        """
+        index = {}
+        size = 0
+        for k, v in self.pyr_coeffs.items():
+            is_complex = np.iscomplexobj(v)
+            index[k] = (size, np.shape(v), is_complex)
+            # complex coefficients take two entries each, their real and imaginary parts
+            size += np.size(v) * (2 if is_complex else 1)
+        return index, size
+
+    def _is_packed(self):
+        """whether `pyr_coeffs` are (still) the views into `_coeffs_vector`
+        """
+        views = self._coeffs_views
+        if views is None or not isinstance(self.pyr_coeffs, dict):
+            return False
+        return (views.keys() == self.pyr_coeffs.keys() and
+                all(self.pyr_coeffs[k] is v for k, v in views.items()))
+
+    def _pack_coeffs(self):
+        """copy the coefficients into a single buffer, and replace them by views into it
+
+        The user should not call this directly: it's called at the end of the construction of a
+        pyramid (so builders don't need to copy their coefficients), and by `to_vector` if the
+        coefficients have been replaced since.
+        """
+        index, size = self._coeffs_layout()
+        vector = np.empty(size, self.dtype)
+        views = _vector_views(vector, index)
+        for k, v in views.items():
+            v[...] = self.pyr_coeffs[k]
+        self._coeffs_vector = vector
+        self._coeffs_index = index
+        # pyramids whose coefficients aren't a plain dict (e.g., those computed on access) keep
+        # them as they are: the buffer is then only a copy of them
+        if isinstance(self.pyr_coeffs, dict):
+            self.pyr_coeffs = views
+            self._coeffs_views = dict(views)
+        else:
+            self._coeffs_views = None
+
+    def to_vector(self):
+        """Get all the coefficients of the pyramid, as a single vector
+
+        The coefficients are stored in a single (1d, contiguous) buffer, which `pyr_coeffs` are
+        views into: this returns that buffer, without copying it, so that changing it changes the
+        coefficients, and vice versa. The coefficients are laid out one after the other, in the
+        order of `pyr_coeffs` (the residual highpass, the bands from the finest scale to the
+        coarsest, and the residual lowpass, as in matlabPyrTools' `pyr` vectors), each flattened in
+        C (row-major) order, with the real and imaginary parts of complex coefficients interleaved.
+        `pyr_size` gives their shapes (as matlabPyrTools' `pind`).
 
+        If coefficients have been assigned to `pyr_coeffs` (rather than changed in place), they're
+        first copied into a new buffer, which `pyr_coeffs` then are views into.
+
+        Returns
+        -------
+        vector : `np.array`
+            1d array, of the pyramid's `dtype`, containing all the coefficients.
+
+        """
+        if not self._is_packed():
+            self._pack_coeffs()
+        return self._coeffs_vector
+
+    def from_vector(self, vector):
+        """Set all the coefficients of the pyramid from a single vector
+
+        The inverse of `to_vector`: `vector` must have the layout of the vector it returns. It isn't
+        copied (unless it has to be cast to the pyramid's `dtype`): `pyr_coeffs` become views into
+        it, and the pyramid can then be reconstructed from it as usual.
+
+        Parameters
+        ----------
+        vector : `array_like`
+            1d array, with the layout of `to_vector`.
+
+        """
+        if self._is_packed():
+            index, size = self._coeffs_index, self._coeffs_vector.size
+        else:
+            index, size = self._coeffs_layout()
+        vector = np.asarray(vector, dtype=self.dtype)
+        if vector.shape != (size,):
+            raise Exception("vector must be 1d, of length %d, but got one of shape %s!" %
+                            (size, vector.shape))
+        self._set_vector(vector, index)
+
+    def _set_vector(self, vector, index):
+        """set the coefficients as the views into `vector`, laid out according to `index`
+        """
+        views = _vector_views(vector, index)
+        self._coeffs_index = index
+        if isinstance(self.pyr_coeffs, dict):
+            self._coeffs_vector = vector
+            self.pyr_coeffs = views
+            self._coeffs_views = dict(views)
+        else:
+            self._coeffs_vector = None
+            self._coeffs_views = None
+            for k, v in views.items():
+                self.pyr_coeffs[k] = v
+
+    def _coeffs_keys(self):
+        """the keys of `pyr_coeffs`, in the order they're built
+        """
+        return ([(i, b) for i in range(self.num_scales) for b in range(self.num_orientations)] +
+                ['residual_lowpass'])
+
+    def _build_levels(self):
+        """build the pyramid, storing its coefficients (and their sizes) in `pyr_coeffs` (and
+        `pyr_size`): a generator, which yields after each level it builds (see `_build`)
+        """
+        raise NotImplementedError
+
+    def _build_pyr(self):
+        """build all the levels of the pyramid
+        """
+        for _ in self._build_levels():
+            pass
+
+    def _build(self, lazy=False, keep_image=True):
+        """build the pyramid, at the end of its construction
+
+        If `lazy`, the levels are only built when they're needed: `pyr_coeffs` and `pyr_size` are
+        then mappings which build the levels (from the finest) the first time a coefficient of
+        theirs (or one of a coarser level) is accessed. Otherwise, all are built now, and packed
+        into a single buffer (see `to_vector`). If not `keep_image`, `image` is dropped (set to
+        None) once all the levels are built.
+        """
+        if lazy:
+            self.pyr_coeffs = _LazyCoeffs(self, keep_image)
+            self.pyr_size = self.pyr_coeffs.sizes
+        else:
+            self._build_pyr()
+            self._pack_coeffs()
+            if not keep_image:
+                self.image = None
+
+    def _reset_coeffs(self):
+        """empty the coefficients, before those of a loaded pyramid are set
+        """
+        self.pyr_coeffs = {}
+
+    def save(self, path, include_image=True, compress=False):
+        """Save the pyramid to a file
+
+        The file is in a compact binary format: a (json) header describing the pyramid (its
+        class, and its attributes, e.g., `pyr_size`, `num_scales`...), followed by the raw
+        buffers of its arrays: its coefficients, as their vector (see `to_vector`), its filters
+        and, optionally, its image. Load it with `Pyramid.load`.
+
+        Parameters
+        ----------
+        path : `str`
+            The file to save the pyramid to.
+        include_image : `bool`
+            Whether to save the image the pyramid was built from. If not, the `image` of the loaded
+            pyramid is None (which it doesn't need to be reconstructed).
+        compress : `bool`
+            Whether to compress the buffers (with zlib). Compressed files are smaller, but slower
+            to save and load, and can't be memory-mapped.
+
+        """
+        arrays = [self.to_vector()]
+        attributes = {k: v for k, v in self.__dict__.items() if k not in _SAVE_EXCLUDE}
+        attributes['pyr_size'] = dict(self.pyr_size)
+        if not include_image:
+            attributes['image'] = None
+        header = {'class': type(self).__name__, 'vector': 0,
+                  'coeffs': _encode(self._coeffs_index, arrays),
+                  'attributes': _encode(attributes, arrays), 'buffers': []}
+        # the offsets of the buffers are relative to the end of the header
+        payloads = []
+        offset = 0
+        for a in arrays:
+            a = np.ascontiguousarray(a)
+            payload = zlib.compress(a) if compress else a
+            nbytes = len(payload) if compress else a.nbytes
+            header['buffers'].append({'dtype': a.dtype.str, 'shape': list(a.shape),
+                                      'offset': offset, 'nbytes': nbytes,
+                                      'compressed': compress})
+            payloads.append(payload)
+            offset = _aligned(offset + nbytes)
+        buffers = header['buffers']
+        header = json.dumps(header).encode()
+        with open(path, 'wb') as f:
+            f.write(_SAVE_MAGIC)
+            f.write(np.array([_SAVE_VERSION, len(header)], '<u4').tobytes())
+            f.write(header)
+            start = _aligned(f.tell())
+            for buf, payload in zip(buffers, payloads):
+                f.write(b'\0' * (start + buf['offset'] - f.tell()))
+                f.write(payload if compress else payload.data)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """Load a pyramid saved by `save`
+
+        Parameters
+        ----------
+        path : `str`
+            The file the pyramid was saved to.
+        mmap_mode : {None, 'r', 'r+', 'c'}
+            If not None, memory-map the arrays (the coefficients, notably) from the file, with this
+            mode (see `np.memmap`), rather than reading them: they're then only read from disk
+            when they're used. The file mustn't be compressed.
+
+        Returns
+        -------
+        pyr : `Pyramid`
+            The pyramid, of the class it was saved from (which must be `cls` or a subclass of it).
+
+        """
+        with open(path, 'rb') as f:
+            if f.read(len(_SAVE_MAGIC)) != _SAVE_MAGIC:
+                raise Exception("%s isn't a saved pyramid!" % path)
+            version, length = np.frombuffer(f.read(8), '<u4')
+            if version > _SAVE_VERSION:
+                raise Exception("%s was saved in version %d of the format, which is newer than"
+                                " this one (%d)!" % (path, version, _SAVE_VERSION))
+            header = json.loads(f.read(int(length)).decode())
+            start = _aligned(len(_SAVE_MAGIC) + 8 + int(length))
+            arrays = []
+            for buf in header['buffers']:
+                dtype = np.dtype(buf['dtype'])
+                count = int(np.prod(buf['shape'], dtype=int))
+                if buf['compressed']:
+                    if mmap_mode is not None:
+                        raise Exception("%s is compressed, so it can't be memory-mapped!" % path)
+                    f.seek(start + buf['offset'])
+                    data = bytearray(zlib.decompress(f.read(buf['nbytes'])))
+                    a = np.frombuffer(data, dtype)
+                elif mmap_mode is not None and count:
+                    a = np.memmap(path, dtype, mmap_mode, start + buf['offset'], (count,))
+                else:
+                    f.seek(start + buf['offset'])
+                    a = np.fromfile(f, dtype, count)
+                arrays.append(a.reshape(buf['shape']))
+
+        pyr_cls = [c for c in [Pyramid, *_subclasses(Pyramid)] if c.__name__ == header['class']]
+        if not pyr_cls or not issubclass(pyr_cls[0], cls):
+            raise Exception("%s contains a %s, not a %s!" % (path, header['class'], cls.__name__))
+        pyr = pyr_cls[0].__new__(pyr_cls[0])
+        pyr.__dict__.update(_decode(header['attributes'], arrays))
+        pyr._coeffs_vector = None
+        pyr._coeffs_index = None
+        pyr._coeffs_views = None
+        pyr._reset_coeffs()
+        pyr._set_vector(arrays[header['vector']], _decode(header['coeffs'], arrays))
+        return pyr
 
     def _set_num_scales(self, filter_name, height, extra_height=0):
         """Figure out the number of scales (height) of the pyramid
@@ -230,8 +675,11 @@ class SteerablePyramidBase(Pyramid):
     SteerablePyramidSpace inherit the steer_coeffs function
 
     """
-    def __init__(self, image, edge_type):
-        super().__init__(image=image, edge_type=edge_type)
+    def __init__(self, image, edge_type, dtype=np.float64):
+        super().__init__(image=image, edge_type=edge_type, dtype=dtype)
+
+    def _coeffs_keys(self):
+        return ['residual_highpass'] + super()._coeffs_keys()
 
     def steer_coeffs(self, angles, even_phase=True):
         """Steer pyramid coefficients to the specified angles
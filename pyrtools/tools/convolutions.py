@@ -1,6 +1,6 @@
 import numpy as np
 from ..pyramids.filters import parse_filter
-from ..pyramids.c.wrapper import corrDn, upConv
+from ..pyramids.c.wrapper import corrDn, upConv, sepCorrDn, sepUpConv
 import scipy.signal
 
 
@@ -73,11 +73,9 @@ def blur(image, n_levels=1, filt='binom5'):
 
         elif filt.shape[1] == 1:
             # 2D image 1D filter [N, 1]
-            imIn = corrDn(image=image, filt=filt, step=(2, 1))
-            imIn = corrDn(image=imIn, filt=filt.T, step=(1, 2))
+            imIn = sepCorrDn(image=image, filt_y=filt, filt_x=filt, step=(2, 2))
             out = blur(imIn, n_levels-1, filt)
-            res = upConv(image=out, filt=filt.T, step=(1, 2), start=(0, 0), stop=[out.shape[0], image.shape[1]])
-            res = upConv(image=res, filt=filt, step=(2, 1), start=(0, 0), stop=image.shape)
+            res = sepUpConv(image=out, filt_y=filt, filt_x=filt, step=(2, 2), start=(0, 0), stop=image.shape)
             return res
 
         else:
@@ -158,8 +156,7 @@ def blurDn(image, n_levels=1, filt='binom5'):
 
         elif filt.shape[1] == 1:
             # 2D image and 1D filter [N, 1]
-            res = corrDn(image=image, filt=filt, step=(2, 1))
-            res = corrDn(image=res, filt=filt.T, step=(1, 2))
+            res = sepCorrDn(image=image, filt_y=filt, filt_x=filt, step=(2, 2))
 
         else:
             # 2D image and 2D filter
@@ -237,8 +234,7 @@ def upBlur(image, n_levels=1, filt='binom5'):
 
         elif filt.shape[1] == 1:
             # 2D image and 1D filter [N, 1]
-            res = upConv(image=image, filt=filt, step=(2, 1))
-            res = upConv(image=res, filt=filt.T, step=(1, 2))
+            res = sepUpConv(image=image, filt_y=filt, filt_x=filt, step=(2, 2))
 
         else:
             # 2D image and 2D filter
@@ -0,0 +1,168 @@
+"""FFTs used by the frequency pyramid and the synthetic images, with a choice of backend
+
+The backends take the number of threads to use (their `workers`). By default, that's the library's
+number of threads, see `set_num_threads`.
+"""
+import atexit
+import importlib
+import os
+import struct
+import warnings
+import scipy.fft
+from ..pyramids.c.wrapper import _check_num_threads
+
+# the backends, and the module (with the interface of scipy.fft) that implements each
+_BACKENDS = {'scipy': 'scipy.fft', 'pyfftw': 'pyfftw.interfaces.scipy_fft'}
+
+# file the pyfftw wisdom (its knowledge of the fastest plans) is loaded from and saved to at exit,
+# if set_fft_backend was given one
+_wisdom_file = None
+# the wisdom files start with this, followed by the number of strings of wisdom (pyfftw exports one
+# per precision), then each string as its length and its bytes (integers are little-endian uint64)
+_WISDOM_MAGIC = b'PYRTOOLS-FFTW-WISDOM'
+
+
+def _load_backend(backend):
+    """import the module implementing `backend`
+    """
+    if backend not in _BACKENDS:
+        raise Exception("FFT backend must be one of %s, but got %s!" % (list(_BACKENDS.keys()),
+                                                                         backend))
+    try:
+        module = importlib.import_module(_BACKENDS[backend])
+    except ImportError:
+        raise Exception("The %s FFT backend requires the %s package, which can't be imported!" %
+                        (backend, backend))
+    if backend == 'pyfftw':
+        # keep the plans (and the arrays they use) of recent transforms around, so that
+        # transforms of the same shape and type don't have to be planned again
+        importlib.import_module('pyfftw.interfaces.cache').enable()
+    return module
+
+
+def _write_wisdom(path, wisdom):
+    """write pyfftw's wisdom (a tuple of bytes) to the file `path`
+    """
+    with open(path, 'wb') as f:
+        f.write(_WISDOM_MAGIC + struct.pack('<Q', len(wisdom)))
+        for w in wisdom:
+            f.write(struct.pack('<Q', len(w)) + w)
+
+
+def _read_wisdom(path):
+    """read pyfftw's wisdom (a tuple of bytes) from the file `path`, checking that it's one
+    written by `_write_wisdom`
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(_WISDOM_MAGIC):
+        raise Exception("%s isn't a pyfftw wisdom file!" % path)
+    pos = len(_WISDOM_MAGIC)
+    wisdom = []
+    try:
+        n, = struct.unpack_from('<Q', data, pos)
+        pos += 8
+        for i in range(n):
+            length, = struct.unpack_from('<Q', data, pos)
+            pos += 8
+            if pos + length > len(data):
+                raise struct.error()
+            wisdom.append(data[pos:pos + length])
+            pos += length
+    except struct.error:
+        raise Exception("The pyfftw wisdom file %s is truncated!" % path)
+    if pos != len(data):
+        raise Exception("The pyfftw wisdom file %s has trailing data!" % path)
+    return tuple(wisdom)
+
+
+def _save_wisdom():
+    if _wisdom_file is not None:
+        _write_wisdom(_wisdom_file, importlib.import_module('pyfftw').export_wisdom())
+
+
+def set_fft_backend(backend='scipy', wisdom_file=None):
+    """Set the default backend of the FFTs of `SteerablePyramidFreq` and the synthetic images.
+
+    Arguments
+    ---------
+    backend : {'scipy', 'pyfftw'}
+        'scipy' uses `scipy.fft`, 'pyfftw' the (optional) pyFFTW package, which plans (and caches
+        the plans of) the transforms of each shape and type. Both run the transforms on the
+        library's number of threads, see `set_num_threads`. Default (at import) is 'scipy', unless
+        the PYRTOOLS_FFT_BACKEND environment variable is set.
+    wisdom_file : `str` or None
+        With the 'pyfftw' backend, a file in which to keep pyFFTW's wisdom (the plans it found to
+        be fastest) between sessions: it's loaded now (if it exists) and saved when python exits.
+        Without it (the default), the wisdom isn't loaded nor saved.
+
+    """
+    global _backend, _wisdom_file
+    _backend = _load_backend(backend)
+    if wisdom_file is not None:
+        if backend != 'pyfftw':
+            raise Exception("wisdom_file can only be used with the pyfftw backend!")
+        if os.path.exists(wisdom_file):
+            wisdom = _read_wisdom(wisdom_file)
+            try:
+                imported = importlib.import_module('pyfftw').import_wisdom(wisdom)
+            except Exception as e:
+                raise Exception("Can't import the pyfftw wisdom of %s: %s" % (wisdom_file, e))
+            if not all(imported):
+                warnings.warn("Some of the pyfftw wisdom of %s couldn't be imported" % wisdom_file)
+        if _wisdom_file is None:
+            atexit.register(_save_wisdom)
+        _wisdom_file = wisdom_file
+
+
+def get_fft_backend():
+    """Get the default backend of the FFTs of `SteerablePyramidFreq` and the synthetic images.
+
+    Returns
+    -------
+    backend : `str`
+        the name of the backend.
+
+    """
+    return [k for k, v in _BACKENDS.items() if v == _backend.__name__][0]
+
+
+def _backend_module(backend):
+    """resolve the backend argument of the functions below into a module
+    """
+    if backend is None:
+        return _backend
+    return _load_backend(backend)
+
+
+def fft2(x, backend=None, num_threads=None):
+    """2d FFT of `x`, with `backend` (default: see `set_fft_backend`) on `num_threads` threads
+    """
+    return _backend_module(backend).fft2(x, workers=_check_num_threads(num_threads))
+
+
+def ifft2(x, backend=None, num_threads=None):
+    """2d inverse FFT of `x`, with `backend` on `num_threads` threads
+    """
+    return _backend_module(backend).ifft2(x, workers=_check_num_threads(num_threads))
+
+
+def rfft2(x, backend=None, num_threads=None):
+    """2d FFT of the real `x` (the non-negative frequencies of its last dimension), with `backend`
+    on `num_threads` threads
+    """
+    return _backend_module(backend).rfft2(x, workers=_check_num_threads(num_threads))
+
+
+def irfft2(x, s, backend=None, num_threads=None):
+    """2d inverse of `rfft2`, with output shape `s`, with `backend` on `num_threads` threads
+    """
+    return _backend_module(backend).irfft2(x, s=s, workers=_check_num_threads(num_threads))
+
+
+_backend = scipy.fft
+if os.environ.get('PYRTOOLS_FFT_BACKEND', 'scipy') != 'scipy':
+    try:
+        set_fft_backend(os.environ['PYRTOOLS_FFT_BACKEND'])
+    except Exception as e:
+        warnings.warn("Can't use the FFT backend of PYRTOOLS_FFT_BACKEND (%s), using scipy" % e)
@@ -0,0 +1,237 @@
+"""Phase-based motion magnification, with the complex steerable pyramid
+
+As described in [1]_: the local phase of the bands of a complex `SteerablePyramidFreq` moves with
+the image content, so amplifying its temporal variations (in a band of temporal frequencies)
+amplifies the motions at those frequencies.
+
+References
+----------
+.. [1] N Wadhwa, M Rubinstein, F Durand and W T Freeman, "Phase-Based Video Motion Processing",
+   ACM Transactions on Graphics (SIGGRAPH), 2013.
+"""
+import concurrent.futures
+import numpy as np
+import scipy.signal
+from ..pyramids.SteerablePyramidFreqStream import SteerablePyramidFreqStream
+from ..pyramids.c.wrapper import _check_num_threads
+
+
+class PhaseMotionMagnifier:
+    """Magnify the motions in a video, frame by frame, with the phase of a complex steerable pyramid
+
+    For each frame, the phase of each coefficient of the oriented bands of its (complex)
+    `SteerablePyramidFreq` is tracked over time (accumulating its difference with that of the
+    previous frame, so that it doesn't wrap), filtered by `temporal_filter`, and the filtered phase
+    is amplified `alpha` times in the coefficients, which are then reconstructed into the output
+    frame. The residuals are left as they are. The first frame is the reference, whose phase is
+    zero.
+
+    The coefficients of all the bands are processed together, in preallocated buffers: each step
+    is a single (numpy) operation over all of them, which is split across `num_threads` threads,
+    as are the FFTs of the pyramids.
+
+    Parameters
+    ----------
+    frame_size : `tuple`
+        The size (height, width) of the frames.
+    alpha : `float`
+        The amplification of the (filtered) phase variations.
+    temporal_filter : `tuple`
+        The coefficients `(b, a)` of the temporal filter, as for `scipy.signal.lfilter`, typically
+        a bandpass around the frequencies of the motions to magnify (see `magnify_motion`). For a
+        FIR filter, `a` is `[1]`.
+    height : 'auto' or `int`.
+        The height of the pyramids, see `SteerablePyramidFreq`.
+    order : `int`.
+        The Gaussian derivative order used for the steerable filters, see `SteerablePyramidFreq`.
+    twidth : `int`
+        The width of the transition region of the radial lowpass function, in octaves
+    scale_factor : `float`
+        The ratio between the frequencies of consecutive scales of the pyramids, see
+        `SteerablePyramidFreq` (e.g., `2**.5` for the half-octave pyramids of [1]_).
+    dtype : {np.float64, np.float32}
+        Floating-point precision of the pyramids and of the processing.
+    fft_backend : {None, 'scipy', 'pyfftw'}
+        The backend of the FFTs, see `pyrtools.tools.fft.set_fft_backend`.
+    num_threads : `int` or None
+        The number of threads the FFTs and the processing of the bands run on. If None, use the
+        library's default, see `set_num_threads`.
+
+    Attributes
+    ----------
+    alpha : `float`
+        The amplification of the phase variations.
+    stream : `SteerablePyramidFreqStream`
+        The stream building the pyramids of the frames.
+    num_frames : `int`
+        The number of frames processed so far.
+
+    """
+    def __init__(self, frame_size, alpha, temporal_filter, height='auto', order=3, twidth=1,
+                 scale_factor=2, dtype=np.float64, fft_backend=None, num_threads=None):
+        self.alpha = alpha
+        self.stream = SteerablePyramidFreqStream(frame_size, height=height, order=order,
+                                                 twidth=twidth, is_complex=True, dtype=dtype,
+                                                 fft_backend=fft_backend, num_threads=num_threads,
+                                                 scale_factor=scale_factor)
+        b, a = (np.atleast_1d(np.asarray(c, dtype=np.float64)) for c in temporal_filter)
+        if a[0] == 0:
+            raise Exception("The first coefficient of the temporal filter's a can't be 0!")
+        # the filter, normalized, in direct form II transposed: its state has one term per
+        # coefficient (but the first)
+        n = max(len(a), len(b))
+        self._b = np.zeros(n)
+        self._b[:len(b)] = b / a[0]
+        self._a = np.zeros(n)
+        self._a[:len(a)] = a / a[0]
+        self._num_threads = num_threads
+        self._pool = None
+        self._bands = [(i, b) for i in range(self.stream.num_scales)
+                       for b in range(self.stream.num_orientations)]
+        self.num_frames = 0
+
+    def _allocate(self, pyr_coeffs):
+        """allocate the buffers, once the shape of the frames (with their batch dimensions) is known
+        """
+        sizes = [pyr_coeffs[k].size for k in self._bands]
+        self._offsets = np.concatenate([[0], np.cumsum(sizes)])
+        size = self._offsets[-1]
+        real_dtype = self.stream.dtype
+        complex_dtype = np.result_type(real_dtype, np.complex64)
+        # the coefficients of the current and previous frames (swapped at each frame)
+        self._coeffs = np.zeros(size, complex_dtype)
+        self._prev_coeffs = np.zeros(size, complex_dtype)
+        # scratch buffer, for the phase differences and then the phase shifts
+        self._rotation = np.zeros(size, complex_dtype)
+        self._magnified = np.zeros(size, complex_dtype)
+        # the (accumulated) phase, its filtered version, and the state of the filter
+        self._phase = np.zeros(size, real_dtype)
+        self._filtered = np.zeros(size, real_dtype)
+        self._scratch = np.zeros(size, real_dtype)
+        self._state = np.zeros((len(self._b) - 1, size), real_dtype)
+        # the magnified coefficients, as the pyramid's
+        self._magnified_coeffs = {}
+        for k, start, stop in zip(self._bands, self._offsets[:-1], self._offsets[1:]):
+            self._magnified_coeffs[k] = self._magnified[start:stop].reshape(pyr_coeffs[k].shape)
+
+    def _update(self, start, stop):
+        """process the coefficients from `start` to `stop` (of the flattened bands)
+        """
+        coeffs, prev, rotation = (self._coeffs[start:stop], self._prev_coeffs[start:stop],
+                                  self._rotation[start:stop])
+        phase, filtered = self._phase[start:stop], self._filtered[start:stop]
+        scratch = self._scratch[start:stop]
+        state = self._state[:, start:stop]
+        if self.num_frames > 0:
+            # the phase difference with the previous frame, in (-pi, pi]
+            np.conjugate(prev, out=rotation)
+            rotation *= coeffs
+            phase += np.arctan2(rotation.imag, rotation.real, out=scratch)
+        # the temporal filter
+        b, a = self._b, self._a
+        np.multiply(phase, b[0], out=filtered)
+        if len(state):
+            filtered += state[0]
+            for k in range(len(state) - 1):
+                np.multiply(phase, b[k+1], out=state[k])
+                state[k] += state[k+1]
+                state[k] -= np.multiply(filtered, a[k+1], out=scratch)
+            np.multiply(phase, b[-1], out=state[-1])
+            state[-1] -= np.multiply(filtered, a[-1], out=scratch)
+        # shift the phase of the coefficients
+        filtered *= self.alpha
+        np.cos(filtered, out=rotation.real)
+        np.sin(filtered, out=rotation.imag)
+        np.multiply(coeffs, rotation, out=self._magnified[start:stop])
+
+    def process(self, frame):
+        """Magnify the motions of a frame
+
+        Parameters
+        ----------
+        frame : `array_like`
+            The frame, of size `frame_size`, or a batch of them (e.g., its color channels), stacked
+            along leading dimensions. All frames must have the same shape.
+
+        Returns
+        -------
+        magnified : `np.array`
+            The frame, with its motions magnified.
+
+        """
+        pyr_coeffs = self.stream.process(frame)
+        if self.num_frames == 0:
+            self._allocate(pyr_coeffs)
+        self._coeffs, self._prev_coeffs = self._prev_coeffs, self._coeffs
+        for k, start, stop in zip(self._bands, self._offsets[:-1], self._offsets[1:]):
+            if pyr_coeffs[k].size != stop - start:
+                raise Exception("All frames must have the same shape!")
+            self._coeffs[start:stop] = pyr_coeffs[k].ravel()
+
+        num_threads = _check_num_threads(self._num_threads)
+        if num_threads > 1:
+            if self._pool is None:
+                self._pool = concurrent.futures.ThreadPoolExecutor(num_threads)
+            # numpy releases the GIL during the operations on the buffers
+            bounds = np.linspace(0, len(self._coeffs), num_threads+1).astype(int)
+            list(self._pool.map(self._update, bounds[:-1], bounds[1:]))
+        else:
+            self._update(0, len(self._coeffs))
+        self.num_frames += 1
+
+        magnified_coeffs = dict(pyr_coeffs)
+        magnified_coeffs.update(self._magnified_coeffs)
+        return self.stream.recon_pyr(magnified_coeffs)
+
+    def stream_frames(self, frames):
+        """Magnify the motions of each of the frames, as they come
+
+        Parameters
+        ----------
+        frames : iterable
+            The frames (e.g., a generator reading them from a video file), see `process`.
+
+        Yields
+        ------
+        magnified : `np.array`
+            Each frame, with its motions magnified.
+
+        """
+        for frame in frames:
+            yield self.process(frame)
+
+
+def magnify_motion(frames, alpha, freq_band, fps, **kwargs):
+    """Magnify the motions in a video, in a band of temporal frequencies
+
+    This is a generator, which processes the frames as they come (see `PhaseMotionMagnifier`),
+    with a (first-order Butterworth) bandpass temporal filter.
+
+    Parameters
+    ----------
+    frames : iterable
+        The frames of the video, all of the same shape.
+    alpha : `float`
+        The amplification of the motions.
+    freq_band : `tuple`
+        The (low, high) temporal frequencies of the motions to magnify, in Hz.
+    fps : `float`
+        The frame rate of the video.
+    kwargs :
+        Passed to `PhaseMotionMagnifier` (e.g., `order`, `dtype` or `num_threads`).
+
+    Yields
+    ------
+    magnified : `np.array`
+        Each frame, with its motions magnified.
+
+    """
+    temporal_filter = scipy.signal.butter(1, freq_band, btype='bandpass', fs=fps)
+    frames = iter(frames)
+    try:
+        first = np.asarray(next(frames))
+    except StopIteration:
+        return
+    magnifier = PhaseMotionMagnifier(first.shape[-2:], alpha, temporal_filter, **kwargs)
+    yield magnifier.process(first)
+    yield from magnifier.stream_frames(frames)
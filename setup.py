@@ -12,6 +12,7 @@ pyrtools_version_spec.loader.exec_module(pyrtools_version_module)
 VERSION = pyrtools_version_module.version
 
 platform_src = ["pyrtools/windows.c"] if os.name == 'nt' else []
+platform_link_args = [] if os.name == 'nt' else ['-pthread']
 
 setup(
     name='pyrtools',
@@ -27,7 +28,7 @@ setup(
     packages=['pyrtools', 'pyrtools.pyramids', 'pyrtools.tools', 'pyrtools.pyramids.c'],
     package_data={'': ['*.h', 'LICENSE']},
     install_requires=['numpy>=1.1',
-                      'scipy>=0.18',
+                      'scipy>=1.4',
                       'matplotlib>=1.5',
                       'Pillow>=3.4',
                       'tqdm>=4.29',
@@ -36,9 +37,14 @@ setup(
                            sources=['pyrtools/pyramids/c/convolve.c',
                                     'pyrtools/pyramids/c/edges.c',
                                     'pyrtools/pyramids/c/wrap.c',
+                                    'pyrtools/pyramids/c/parallel.c',
+                                    'pyrtools/pyramids/c/separable.c',
+                                    'pyrtools/pyramids/c/simd.c',
+                                    'pyrtools/pyramids/c/convolve_float.c',
                                     'pyrtools/pyramids/c/internal_pointOp.c'] + platform_src,
                            depends=['pyrtools/pyramids/c/convolve.h',
                                     'pyrtools/pyramids/c/internal_pointOp.h'],
-                           extra_compile_args=['-fPIC', '-shared'])],
+                           extra_compile_args=['-fPIC', '-shared'],
+                           extra_link_args=platform_link_args)],
     tests='TESTS',
     )